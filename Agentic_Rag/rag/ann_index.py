@@ -0,0 +1,245 @@
+"""
+Approximate Nearest Neighbor Index for the Vector Store
+IVF-flat (inverted file) index over L2-normalized dense or CSR vectors, in NumPy / SciPy
+"""
+
+import os
+import logging
+from typing import Optional, Union
+
+import numpy as np
+from scipy import sparse
+
+Matrix = Union[np.ndarray, sparse.spmatrix]
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are assigned to the nearest of nlist spherical
+    k-means centroids, and a query only scores the rows of its nprobe closest
+    centroids. Assignments are kept per matrix row, so they follow the packed
+    rows of EmbeddingMatrix through inserts and swap-removes.
+    Only the centroids are persisted, tagged with the fingerprint of the vectorizer
+    state they were trained under; assignments are recomputed on load with one
+    matrix product.
+    The index never trains during a search: owners call train(), or
+    training_sample() / fit_centroids() / install() to run k-means off their lock.
+    Rows may be dense or CSR (TF-IDF); centroids are dense nlist x d either way,
+    so only matrices of at most max_dimension columns are indexed (2^18-column
+    hashing rows are refused).
+    """
+
+    def __init__(self,
+                 nlist: Optional[int] = None,
+                 nprobe: int = 8,
+                 min_train_size: int = 1000,
+                 max_train_samples: int = 20000,
+                 kmeans_iterations: int = 10,
+                 retrain_growth: float = 4.0,
+                 max_dimension: int = 4096,
+                 path: Optional[str] = None,
+                 seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.max_train_samples = max_train_samples
+        self.kmeans_iterations = kmeans_iterations
+        self.retrain_growth = retrain_growth
+        self.max_dimension = max_dimension
+        self.path = path
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        # Vectorizer state the centroids belong to; set by the owner before install()
+        self.fingerprint: Optional[str] = None
+        self.trained_size = 0
+        self.row_cluster = np.zeros(0, dtype=np.int32)
+        self.stale = False
+        self.logger = logging.getLogger("ivf_index")
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def ready(self, num_rows: int) -> bool:
+        """True when queries should go through the index rather than exact search"""
+        return self.is_trained and not self.stale and len(self.row_cluster) == num_rows
+
+    def supports(self, dimension: Optional[int]) -> bool:
+        return dimension is not None and dimension <= self.max_dimension
+    
+    def needs_training(self, num_rows: int, dimension: Optional[int]) -> bool:
+        if num_rows < self.min_train_size or not self.supports(dimension):
+            return False
+        if not self.is_trained or self.stale:
+            return True
+        return num_rows > self.retrain_growth * self.trained_size
+
+    # Training and assignment
+
+    def _default_nlist(self, num_rows: int) -> int:
+        return max(1, int(4 * np.sqrt(num_rows)))
+
+    def assign(self, vectors: Matrix, chunk_size: int = 8192) -> np.ndarray:
+        """Nearest centroid of each row (cosine; rows need not be normalized)"""
+        return self._assign_to(vectors, self.centroids, chunk_size)
+
+    @staticmethod
+    def _assign_to(vectors: Matrix, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+        num_rows = vectors.shape[0]
+        assignments = np.empty(num_rows, dtype=np.int32)
+        for start in range(0, num_rows, chunk_size):
+            similarities = vectors[start:start + chunk_size] @ centroids.T
+            assignments[start:start + chunk_size] = np.asarray(similarities).argmax(axis=1)
+        return assignments
+
+    def _check_matrix(self, matrix: Matrix):
+        if not self.supports(matrix.shape[1]):
+            raise ValueError(f"IVF index supports at most {self.max_dimension} dimensions, got {matrix.shape[1]}")
+
+    def train(self, matrix: Matrix):
+        """Spherical k-means on a sample of the normalized rows, then assign every row"""
+        self.install(self.fit_centroids(self.training_sample(matrix), matrix.shape[0]), matrix)
+
+    def training_sample(self, matrix: Matrix) -> Matrix:
+        """Copy of up to max_train_samples rows, safe to cluster while the matrix keeps changing"""
+        self._check_matrix(matrix)
+        num_rows = matrix.shape[0]
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(num_rows, max(self.max_train_samples, self.nlist or 0))
+        sample_rows = np.sort(rng.choice(num_rows, size=sample_size, replace=False))
+        if sparse.issparse(matrix):
+            return sparse.csr_matrix(matrix[sample_rows], dtype=np.float32, copy=True)
+        return np.array(matrix[sample_rows], dtype=np.float32)
+
+    def fit_centroids(self, sample: Matrix, num_rows: int) -> np.ndarray:
+        """Spherical k-means centroids of a training sample; does not touch the index state"""
+        rng = np.random.default_rng(self.seed)
+        sample_size = sample.shape[0]
+        nlist = min(self.nlist or self._default_nlist(num_rows), sample_size)
+
+        centroids = self._normalize(self._dense(sample[rng.choice(sample_size, size=nlist, replace=False)]))
+        for _ in range(self.kmeans_iterations):
+            assignments = self._assign_to(sample, centroids)
+            # Sum members per centroid with a (nlist x sample) indicator matrix
+            membership = sparse.csr_matrix(
+                (np.ones(sample_size, dtype=np.float32), (assignments, np.arange(sample_size))),
+                shape=(nlist, sample_size)
+            )
+            sums = self._dense(membership @ sample)
+            empty = np.flatnonzero(np.asarray(membership.sum(axis=1)).ravel() == 0)
+            if len(empty):
+                sums[empty] = self._dense(sample[rng.choice(sample_size, size=len(empty), replace=False)])
+            centroids = self._normalize(sums)
+        return centroids
+
+    def install(self, centroids: np.ndarray, matrix: Matrix):
+        """Switch to new centroids and assign every current row to them"""
+        self._check_matrix(matrix)
+        self.centroids = centroids
+        self.row_cluster = self.assign(matrix) if matrix.shape[0] else np.zeros(0, dtype=np.int32)
+        self.trained_size = matrix.shape[0]
+        self.stale = False
+        self.logger.info(f"Trained IVF index: {len(centroids)} lists over {matrix.shape[0]} vectors")
+        self.save()
+
+    @staticmethod
+    def _dense(matrix: Matrix) -> np.ndarray:
+        """Float32 ndarray copy of a dense or sparse block of rows"""
+        if sparse.issparse(matrix):
+            return matrix.toarray().astype(np.float32, copy=False)
+        return np.array(matrix, dtype=np.float32)
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    # Row bookkeeping, mirrored from EmbeddingMatrix
+
+    def reset_rows(self, matrix: Optional[Matrix], retrain: bool):
+        """
+        All rows were replaced: reassign them to the current centroids (load), or
+        mark the index stale (full rebuild) so the owner retrains it; until then
+        searches are exact
+        """
+        num_rows = 0 if matrix is None else matrix.shape[0]
+        self.row_cluster = np.zeros(0, dtype=np.int32)
+        if num_rows == 0:
+            return
+        if retrain or (self.is_trained and self.centroids.shape[1] != matrix.shape[1]):
+            self.stale = True
+        if self.is_trained and not self.stale:
+            self.row_cluster = self.assign(matrix)
+
+    def set_row(self, row: int, vector: Matrix):
+        # Untrained or stale: rows are not tracked, queries fall back to exact search until retraining
+        if not self.is_trained or self.stale or row > len(self.row_cluster):
+            return
+        if vector.shape[-1] != self.centroids.shape[1]:
+            self.stale = True
+            return
+        cluster = int(self.assign(vector if sparse.issparse(vector) else np.atleast_2d(vector))[0])
+        if row == len(self.row_cluster):
+            self.row_cluster = np.append(self.row_cluster, np.int32(cluster))
+        else:
+            self.row_cluster[row] = cluster
+
+    def move_row(self, source: int, target: int):
+        if source < len(self.row_cluster) and target < len(self.row_cluster):
+            self.row_cluster[target] = self.row_cluster[source]
+
+    def pop_row(self):
+        if len(self.row_cluster):
+            self.row_cluster = self.row_cluster[:-1]
+
+    def candidate_rows(self, normalized_query: Matrix, nprobe: Optional[int] = None) -> np.ndarray:
+        """Rows of the nprobe lists whose centroids are closest to the (dense or 1 x d CSR) query"""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        if sparse.issparse(normalized_query):
+            centroid_scores = np.asarray(normalized_query @ self.centroids.T).ravel()
+        else:
+            centroid_scores = self.centroids @ normalized_query
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.flatnonzero(np.isin(self.row_cluster, probed))
+
+    # Persistence
+
+    def save(self) -> bool:
+        if not self.path or not self.is_trained:
+            return False
+        try:
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez(tmp_path, centroids=self.centroids, trained_size=self.trained_size, nprobe=self.nprobe,
+                     fingerprint=np.str_(self.fingerprint or ''))
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            self.logger.error(f"Error saving IVF index: {e}")
+            return False
+
+    def load(self, fingerprint: Optional[str] = None) -> bool:
+        """
+        Restore persisted centroids; a file trained under another vectorizer state
+        (after a refit, the vocabulary changes even when the dimension does not) is ignored
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path) as data:
+                centroids = data['centroids'].astype(np.float32)
+                if not self.supports(centroids.shape[1]):
+                    self.logger.warning(f"Ignoring IVF index with {centroids.shape[1]} dimensions at {self.path}")
+                    return False
+                stored_fingerprint = str(data['fingerprint']) if 'fingerprint' in data.files else ''
+                if stored_fingerprint != (fingerprint or ''):
+                    self.logger.warning(f"Ignoring IVF index trained under another vectorizer state at {self.path}")
+                    return False
+                self.centroids = centroids
+                self.fingerprint = fingerprint
+                self.trained_size = int(data['trained_size'])
+            self.stale = False
+            self.logger.info(f"Loaded IVF index with {len(self.centroids)} lists from {self.path}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error loading IVF index: {e}")
+            return False
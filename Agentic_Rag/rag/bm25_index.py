@@ -0,0 +1,142 @@
+"""
+BM25 Inverted Index for Poker Knowledge
+Keyword retrieval that keeps exact poker terms ("3-bet", "SPR"), plus rank fusion with vector search
+"""
+
+import re
+import math
+import heapq
+import logging
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Words with inner hyphens, slashes or apostrophes stay whole: 3-bet, c-bet, 4/5, don't
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-/'][a-z0-9]+)*")
+
+# Deliberately small: generic English stop lists drop poker terms such as
+# "call", "fire", "top", "side", "full", "behind", "show", "first" and "all"
+STOP_WORDS = frozenset([
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'is', 'are', 'was', 'be', 'it', 'its',
+    'this', 'that', 'these', 'those', 'i', 'me', 'my', 'you', 'your', 'we', 'our',
+    'do', 'does', 'how', 'what', 'when', 'where', 'why', 'which', 'who', 'should', 'can', 'would',
+    'with', 'for', 'from'
+])
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms without stop words; hyphenated terms are also indexed joined (3-bet -> 3bet)"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOP_WORDS:
+            continue
+        tokens.append(token)
+        if '-' in token:
+            tokens.append(token.replace('-', ''))
+    return tokens
+
+class BM25Index:
+    """
+    Inverted index (term -> {document id: term frequency}) with Okapi BM25 scoring
+    Documents are added, replaced and removed one at a time; corpus statistics
+    (document count, average length) are kept as running totals
+    Search is term-at-a-time in decreasing idf order with max-score pruning:
+    once the remaining terms' score upper bound falls below the current k-th
+    best score, no new candidate can reach the top k, so only documents
+    already accumulated are updated
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.document_terms: Dict[str, Counter] = {}
+        self.document_lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.logger = logging.getLogger("bm25_index")
+
+    def __len__(self) -> int:
+        return len(self.document_lengths)
+
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self.document_lengths
+
+    @property
+    def average_length(self) -> float:
+        return self.total_length / len(self.document_lengths) if self.document_lengths else 0.0
+
+    def add_document(self, document_id: str, text: str):
+        """Index a document, replacing its previous version"""
+        self.remove_document(document_id)
+        terms = Counter(tokenize(text))
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[document_id] = frequency
+        self.document_terms[document_id] = terms
+        length = sum(terms.values())
+        self.document_lengths[document_id] = length
+        self.total_length += length
+
+    def remove_document(self, document_id: str) -> bool:
+        terms = self.document_terms.pop(document_id, None)
+        if terms is None:
+            return False
+        for term in terms:
+            posting = self.postings[term]
+            del posting[document_id]
+            if not posting:
+                del self.postings[term]
+        self.total_length -= self.document_lengths.pop(document_id)
+        return True
+
+    def clear(self):
+        self.postings.clear()
+        self.document_terms.clear()
+        self.document_lengths.clear()
+        self.total_length = 0
+
+    def idf(self, term: str) -> float:
+        document_frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.document_lengths) - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def search(self,
+               query: str,
+               top_k: int = 10,
+               accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, float]]:
+        """Top-k (document id, BM25 score); accept filters documents before ranking"""
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms or top_k <= 0:
+            return []
+
+        # A term contributes at most idf * (k1 + 1); visit the most selective terms first
+        weighted_terms = sorted(((self.idf(term), term) for term in terms), reverse=True)
+        remaining_bound = sum(idf * (self.k1 + 1) for idf, _ in weighted_terms)
+        length_norm = self.k1 / (self.average_length or 1.0)
+
+        scores: Dict[str, float] = {}
+        rejected = set()
+        threshold = 0.0
+        for idf, term in weighted_terms:
+            admit_new = len(scores) < top_k or remaining_bound > threshold
+            for document_id, frequency in self.postings[term].items():
+                if document_id not in scores:
+                    if not admit_new or document_id in rejected:
+                        continue
+                    if accept is not None and not accept(document_id):
+                        rejected.add(document_id)
+                        continue
+                denominator = frequency + self.k1 * (1 - self.b) + length_norm * self.b * self.document_lengths[document_id]
+                scores[document_id] = scores.get(document_id, 0.0) + idf * frequency * (self.k1 + 1) / denominator
+
+            remaining_bound -= idf * (self.k1 + 1)
+            if len(scores) >= top_k:
+                threshold = heapq.nlargest(top_k, scores.values())[-1]
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[str, float]]],
+                           top_k: int,
+                           k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked (id, score) lists: each list adds 1 / (k + rank) to the ids it contains"""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, (document_id, _) in enumerate(ranking, start=1):
+            fused[document_id] = fused.get(document_id, 0.0) + 1.0 / (k + rank)
+    return heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])
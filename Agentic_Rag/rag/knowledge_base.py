@@ -3,6 +3,7 @@ Poker Knowledge Base System
 Manages structured poker knowledge for RAG retrieval
 """
 
+import os
 import json
 import uuid
 from datetime import datetime
@@ -12,6 +13,8 @@ from enum import Enum
 import hashlib
 import logging
 
+from .bm25_index import BM25Index
+
 class DocumentType(Enum):
     """Types of poker knowledge documents"""
     STRATEGY = "strategy"
@@ -111,6 +114,15 @@ class PokerKnowledgeBase:
         }
         self.logger = logging.getLogger("knowledge_base")
         
+        # BM25 inverted index over title and content, kept in sync with the other indexes
+        self.text_index = BM25Index()
+        
+        # Bumped on every mutation, so caches of derived results can tell they are stale
+        self.generation = 0
+        
+        # Modification time of storage_path as of this instance's last load or save
+        self.storage_mtime: Optional[float] = None
+        
         # Load existing knowledge if available
         self.load_knowledge()
         
@@ -133,6 +145,7 @@ class PokerKnowledgeBase:
             
             # Update indexes
             self._update_indexes(document)
+            self.generation += 1
             
             self.logger.info(f"Added document: {document.id} - {document.title}")
             return True
@@ -151,7 +164,17 @@ class PokerKnowledgeBase:
                         skill_level: SkillLevel = None,
                         tags: List[str] = None,
                         limit: int = 10) -> List[KnowledgeDocument]:
-        """Search documents with various filters"""
+        """Search documents with various filters, ranked by BM25 when a query is given"""
+        if query:
+            def accept(document_id: str) -> bool:
+                document = self.documents[document_id]
+                return ((not document_type or document.document_type == document_type)
+                        and (not skill_level or document.skill_level in (skill_level, SkillLevel.ALL_LEVELS))
+                        and (not tags or any(tag in document.tags for tag in tags)))
+            
+            ranked = self.text_index.search(query, top_k=limit, accept=accept)
+            return [self.documents[document_id] for document_id, _ in ranked]
+        
         results = list(self.documents.values())
         
         # Filter by document type
@@ -168,12 +191,6 @@ class PokerKnowledgeBase:
             results = [doc for doc in results 
                       if any(tag in doc.tags for tag in tags)]
         
-        # Text search in title and content
-        if query:
-            query_lower = query.lower()
-            results = [doc for doc in results 
-                      if query_lower in doc.title.lower() or query_lower in doc.content.lower()]
-        
         # Sort by relevance (confidence score and recency)
         results.sort(key=lambda x: (x.confidence_score, x.updated_at), reverse=True)
         
@@ -206,6 +223,7 @@ class PokerKnowledgeBase:
             
             # Update indexes
             self._update_indexes(document)
+            self.generation += 1
             
             self.logger.info(f"Updated document: {document_id}")
             return True
@@ -227,6 +245,7 @@ class PokerKnowledgeBase:
             
             # Remove document
             del self.documents[document_id]
+            self.generation += 1
             
             self.logger.info(f"Deleted document: {document_id}")
             return True
@@ -269,8 +288,12 @@ class PokerKnowledgeBase:
                 }
             }
             
-            with open(self.storage_path, 'w') as f:
+            # Write then rename, so a concurrent load never reads a half-written file
+            tmp_path = f"{self.storage_path}.tmp"
+            with open(tmp_path, 'w') as f:
                 json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.storage_path)
+            self.storage_mtime = os.path.getmtime(self.storage_path)
             
             self.logger.info(f"Saved knowledge base to {self.storage_path}")
             return True
@@ -282,14 +305,18 @@ class PokerKnowledgeBase:
     def load_knowledge(self) -> bool:
         """Load knowledge base from storage"""
         try:
+            # Taken before reading: a write landing during the read shows up as a newer mtime
+            storage_mtime = os.path.getmtime(self.storage_path)
             with open(self.storage_path, 'r') as f:
                 data = json.load(f)
+            self.storage_mtime = storage_mtime
             
             # Load documents
             for doc_id, doc_data in data.get('documents', {}).items():
                 document = KnowledgeDocument.from_dict(doc_data)
                 self.documents[doc_id] = document
                 self._update_indexes(document)
+            self.generation += 1
             
             self.logger.info(f"Loaded {len(self.documents)} documents from {self.storage_path}")
             return True
@@ -327,6 +354,9 @@ class PokerKnowledgeBase:
         # Index by content hash
         content_hash = document.get_content_hash()
         self.indexes['by_content_hash'][content_hash] = document.id
+        
+        # Full-text index (replaces the document's previous text)
+        self.text_index.add_document(document.id, f"{document.title} {document.content}")
     
     def _remove_from_indexes(self, document: KnowledgeDocument):
         """Remove document from all indexes"""
@@ -348,6 +378,9 @@ class PokerKnowledgeBase:
                 if document.id in self.indexes['by_tags'][tag]:
                     self.indexes['by_tags'][tag].remove(document.id)
         
+        # Remove from full-text index
+        self.text_index.remove_document(document.id)
+        
         # Remove from content hash index
         content_hash = document.get_content_hash()
         if content_hash in self.indexes['by_content_hash']:
@@ -433,6 +433,7 @@ class KnowledgeSourceManager:
             
             ingested_count = 0
             failed_count = 0
+            ingested_documents = []
             
             for content in content_list:
                 try:
@@ -445,8 +446,7 @@ class KnowledgeSourceManager:
                     
                     # Add to knowledge base
                     if self.knowledge_base.add_document(document):
-                        # Add to vector store
-                        self.vector_store.add_document_embedding(document)
+                        ingested_documents.append(document)
                         ingested_count += 1
                     else:
                         failed_count += 1
@@ -455,6 +455,10 @@ class KnowledgeSourceManager:
                     self.logger.error(f"Error ingesting content '{content.title}': {e}")
                     failed_count += 1
             
+            # Add to vector store in one batch / one transaction
+            if ingested_documents and not self.vector_store.add_embeddings(ingested_documents):
+                self.logger.error(f"Error adding embeddings for {len(ingested_documents)} documents from {source.name}")
+            
             # Update statistics
             self.ingestion_stats['total_ingested'] += ingested_count
             self.ingestion_stats['successful_ingestions'] += ingested_count
@@ -5,7 +5,12 @@ Integrates RAG capabilities with the existing agent system
 
 import asyncio
 import logging
-from typing import Dict, List, Any, Optional, Union
+import threading
+import time
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple, Union
 from datetime import datetime
 from dataclasses import dataclass
 
@@ -13,7 +18,8 @@ from src.agents.base_agent import BaseAgent, AgentMessage
 from src.models.orchestrator import AgentOrchestrator
 from src.models.poker_models import SkillLevel
 from .knowledge_base import DocumentType, PokerKnowledgeBase, KnowledgeDocument
-from .vector_store import VectorStore, EmbeddingService
+from .vector_store import VectorStore, EmbeddingService, SparseEmbeddingMatrix
+from .bm25_index import tokenize
 from .retrieval_agent import RetrievalAgent, ProcessedQuery, RetrievalResult
 
 @dataclass
@@ -26,6 +32,119 @@ class RAGEnhancedResponse:
     sources: List[str]
     metadata: Dict[str, Any]
 
+class SemanticResponseCache:
+    """
+    Cache of retrieval outcomes looked up by query similarity instead of exact text
+    Queries are embedded with their own hashed term-frequency vectors over the
+    poker-safe BM25 tokens, not with the store's TF-IDF vectorizer, whose English
+    stop words drop "top" / "bottom" or "call" / "fold". A lookup is one top-1
+    search over the entries of the same scope (agent id, retrieval filters,
+    retrieval settings) in a SparseEmbeddingMatrix.
+    Entries are evicted LRU-first, expire after ttl_seconds, and are dropped
+    wholesale when the knowledge generation (documents and indexed vectors) or
+    the vectorizer changes
+    """
+    
+    def __init__(self, 
+                 embedding_service: EmbeddingService,
+                 max_entries: int = 256,
+                 similarity_threshold: float = 0.8,
+                 ttl_seconds: float = 600.0):
+        self.embedding_service = embedding_service
+        self.vectorizer = HashingVectorizer(
+            tokenizer=tokenize,
+            lowercase=False,
+            token_pattern=None,
+            n_features=2 ** 18,
+            alternate_sign=False,
+            norm='l2',
+            dtype=np.float32
+        )
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._reset()
+    
+    def _reset(self):
+        self._entries: 'OrderedDict[str, Tuple[Tuple, float, Any]]' = OrderedDict()
+        self._vectors = SparseEmbeddingMatrix()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def _check_version(self, generation: Tuple):
+        version = (generation, self.embedding_service.vectorizer_version)
+        if version != self._version:
+            self._reset()
+            self._version = version
+    
+    def _embed(self, query: str):
+        return self.vectorizer.transform([query]).tocsr()
+    
+    def _remove(self, entry_id: str):
+        del self._entries[entry_id]
+        self._vectors.remove(entry_id)
+    
+    def get(self, query: str, scope: Tuple, generation: Tuple) -> Optional[Tuple[Any, float]]:
+        """(cached value, similarity) of the closest prior query in scope, if above the threshold"""
+        query_vector = self._embed(query)
+        with self._lock:
+            self._check_version(generation)
+            if self._entries:
+                candidates = np.fromiter((self._entries[entry_id][0] == scope for entry_id in self._vectors.ids),
+                                         dtype=bool, count=len(self._vectors))
+                if candidates.any():
+                    matches = self._vectors.top_k(query_vector, 1, self.similarity_threshold, candidates)
+                    if matches:
+                        entry_id, similarity = matches[0]
+                        _, created, value = self._entries[entry_id]
+                        if time.monotonic() - created <= self.ttl_seconds:
+                            self._entries.move_to_end(entry_id)
+                            self.hits += 1
+                            return value, similarity
+                        self._remove(entry_id)
+            self.misses += 1
+            return None
+    
+    def put(self, query: str, scope: Tuple, generation: Tuple, value: Any):
+        if self.max_entries <= 0:
+            return
+        query_vector = self._embed(query)
+        with self._lock:
+            self._check_version(generation)
+            entry_id = str(self._next_id)
+            self._next_id += 1
+            if not self._vectors.upsert(entry_id, query_vector):
+                return
+            self._entries[entry_id] = (scope, time.monotonic(), value)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._reset()
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'similarity_threshold': self.similarity_threshold,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
 class RAGOrchestrator:
     """
     Orchestrates RAG functionality across the PokerPy agent system
@@ -51,7 +170,10 @@ class RAGOrchestrator:
             'max_retrieved_docs': 3,
             'min_similarity_threshold': 0.2,
             'enhance_all_responses': False,  # Only enhance when explicitly requested
-            'cache_enhanced_responses': True
+            'cache_enhanced_responses': True,
+            'cache_similarity_threshold': 0.8,  # Cosine similarity for a rephrased query to reuse a cached result
+            'cache_size': 256,
+            'cache_ttl_seconds': 600.0
         }
         
         # Performance tracking
@@ -59,12 +181,17 @@ class RAGOrchestrator:
             'total_rag_requests': 0,
             'successful_enhancements': 0,
             'average_enhancement_time': 0.0,
-            'knowledge_base_hits': 0
+            'knowledge_base_hits': 0,
+            'cache_hits': 0
         }
         
-        # Response cache
-        self.response_cache = {}
-        self.cache_size_limit = 50
+        # Semantic response cache
+        self.response_cache = SemanticResponseCache(
+            self.vector_store.embedding_service,
+            max_entries=self.rag_config['cache_size'],
+            similarity_threshold=self.rag_config['cache_similarity_threshold'],
+            ttl_seconds=self.rag_config['cache_ttl_seconds']
+        )
         
         # Define RAG-enhanced workflows
         self._define_rag_workflows()
@@ -91,6 +218,10 @@ class RAGOrchestrator:
             "retrieval_agent", "community"
         ])
     
+    def _knowledge_generation(self) -> Tuple[int, int]:
+        """Changes whenever a retrieval could return different documents"""
+        return self.knowledge_base.generation, self.vector_store.generation
+    
     async def enhance_agent_response(self, 
                                    agent_id: str,
                                    original_query: str,
@@ -100,10 +231,40 @@ class RAGOrchestrator:
         start_time = datetime.now()
         
         try:
-            # Check cache first
-            cache_key = f"{agent_id}_{hash(original_query)}_{hash(agent_response)}"
-            if cache_key in self.response_cache:
-                return self.response_cache[cache_key]
+            # Check cache first: a close enough prior query in the same scope reuses its retrieval
+            context = context or {}
+            use_cache = self.rag_config['cache_enhanced_responses']
+            generation = self._knowledge_generation()
+            if use_cache:
+                # Scoped on the filters retrieval will apply, e.g. the skill level inferred from the query text
+                cache_scope = (
+                    agent_id,
+                    RetrievalAgent.freeze_filters(self.retrieval_agent.search_filters(original_query, context)),
+                    self.rag_config['max_retrieved_docs'],
+                    self.rag_config['min_similarity_threshold']
+                )
+            cached = self.response_cache.get(original_query, cache_scope, generation) if use_cache else None
+            if cached is not None:
+                (retrieved_docs, sources, confidence_score, retrieval_time), cache_similarity = cached
+                self.rag_stats['total_rag_requests'] += 1
+                self.rag_stats['cache_hits'] += 1
+                return RAGEnhancedResponse(
+                    original_response=agent_response,
+                    retrieved_knowledge=retrieved_docs,
+                    enhanced_response=await self._enhance_response_with_knowledge(
+                        original_query, agent_response, retrieved_docs, context
+                    ),
+                    confidence_score=confidence_score,
+                    sources=sources,
+                    metadata={
+                        'retrieval_time': retrieval_time,
+                        'total_retrieved': len(retrieved_docs),
+                        'enhancement_time': (datetime.now() - start_time).total_seconds(),
+                        'agent_id': agent_id,
+                        'cache_hit': True,
+                        'cache_similarity': cache_similarity
+                    }
+                )
             
             # Retrieve relevant knowledge
             retrieval_message = AgentMessage(
@@ -179,9 +340,10 @@ class RAGOrchestrator:
                 / self.rag_stats['total_rag_requests']
             )
             
-            # Cache result
-            if len(self.response_cache) < self.cache_size_limit:
-                self.response_cache[cache_key] = rag_enhanced
+            # Cache the retrieval outcome; a hit re-applies it to that request's agent response
+            if use_cache:
+                self.response_cache.put(original_query, cache_scope, generation, 
+                                        (retrieved_docs, sources, confidence_score, retrieval_result['retrieval_time']))
             
             return rag_enhanced
         
@@ -343,7 +505,8 @@ class RAGOrchestrator:
             'retrieval_agent_stats': self.retrieval_agent.get_status(),
             'cache_stats': {
                 'response_cache_size': len(self.response_cache),
-                'cache_hit_rate': self.rag_stats.get('cache_hits', 0) / max(self.rag_stats.get('total_rag_requests', 1), 1)
+                'cache_hit_rate': self.rag_stats.get('cache_hits', 0) / max(self.rag_stats.get('total_rag_requests', 1), 1),
+                'response_cache': self.response_cache.get_statistics()
             },
             'configuration': self.rag_config
         }
@@ -351,6 +514,9 @@ class RAGOrchestrator:
     def update_rag_config(self, new_config: Dict[str, Any]):
         """Update RAG configuration"""
         self.rag_config.update(new_config)
+        self.response_cache.similarity_threshold = self.rag_config['cache_similarity_threshold']
+        self.response_cache.max_entries = self.rag_config['cache_size']
+        self.response_cache.ttl_seconds = self.rag_config['cache_ttl_seconds']
         self.logger.info(f"Updated RAG configuration: {new_config}")
     
     async def rebuild_knowledge_index(self):
@@ -4,7 +4,10 @@ Handles intelligent knowledge retrieval and query understanding
 """
 
 import re
+import time
 import logging
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Any, Optional, Tuple, Union
 from dataclasses import dataclass
 from datetime import datetime
@@ -14,6 +17,7 @@ import asyncio
 from src.agents.base_agent import BaseAgent, AgentMessage, AgentStatus
 from Agentic_Rag.rag.knowledge_base import PokerKnowledgeBase, KnowledgeDocument, DocumentType, SkillLevel
 from .vector_store import VectorStore, EmbeddingService
+from .bm25_index import reciprocal_rank_fusion
 
 class QueryType(Enum):
     """Types of queries the system can handle"""
@@ -268,13 +272,82 @@ class QueryProcessor:
         
         return min(base_confidence, 1.0)
 
+class QueryCache:
+    """
+    Thread-safe LRU cache with a time-to-live per entry
+    Keys carry the knowledge base generation, so results computed before a
+    mutation are never served; they expire or get evicted like any other entry
+    """
+    
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[Any, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, key, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
 class RetrievalAgent(BaseAgent):
     """
     Specialized agent for knowledge retrieval and RAG processing
     Inherits from BaseAgent to integrate with the existing agent system
     """
     
-    def __init__(self, knowledge_base: PokerKnowledgeBase = None, vector_store: VectorStore = None):
+    def __init__(self, 
+                 knowledge_base: PokerKnowledgeBase = None, 
+                 vector_store: VectorStore = None,
+                 cache_size: int = 256,
+                 cache_ttl: float = 300.0,
+                 hybrid_search: bool = True,
+                 candidate_multiplier: int = 4,
+                 min_bm25_score: float = 0.0):
         super().__init__(
             agent_id="retrieval_agent",
             name="Knowledge Retrieval Agent",
@@ -285,6 +358,12 @@ class RetrievalAgent(BaseAgent):
         self.vector_store = vector_store or VectorStore()
         self.query_processor = QueryProcessor()
         
+        # Hybrid retrieval: BM25 and vector top-(k * candidate_multiplier) lists fused by reciprocal rank
+        self.hybrid_search = hybrid_search
+        self.candidate_multiplier = candidate_multiplier
+        # Keyword hits are gated on their own BM25 score; min_similarity only applies to the vector list
+        self.min_bm25_score = min_bm25_score
+        
         # Initialize vector store with knowledge base documents
         self._initialize_vector_store()
         
@@ -296,17 +375,16 @@ class RetrievalAgent(BaseAgent):
             'cache_hits': 0
         }
         
-        # Simple cache for frequent queries
-        self.query_cache = {}
-        self.cache_size_limit = 100
+        # LRU + TTL cache of retrieval responses, keyed by knowledge base generation
+        self.query_cache = QueryCache(max_entries=cache_size, ttl_seconds=cache_ttl)
     
     def _initialize_vector_store(self):
-        """Initialize vector store with knowledge base documents"""
+        """Initialize vector store with knowledge base documents, reusing persisted embeddings"""
         try:
             documents = list(self.knowledge_base.documents.values())
             if documents:
-                self.vector_store.rebuild_index(documents)
-                self.logger.info(f"Initialized vector store with {len(documents)} documents")
+                summary = self.vector_store.sync_documents(documents)
+                self.logger.info(f"Initialized vector store with {len(documents)} documents: {summary}")
         except Exception as e:
             self.logger.error(f"Error initializing vector store: {e}")
     
@@ -338,73 +416,56 @@ class RetrievalAgent(BaseAgent):
             max_results = content.get('max_results', 5)
             min_similarity = content.get('min_similarity', 0.1)
             
-            # Check cache first
-            cache_key = f"{query}_{max_results}_{min_similarity}"
-            if cache_key in self.query_cache:
-                self.retrieval_stats['cache_hits'] += 1
-                cached_result = self.query_cache[cache_key]
-                return self._create_response(message, cached_result)
-            
             # Process query
             processed_query = self.query_processor.process_query(query, context)
+            filters = self._filters_for(processed_query)
             
-            # Retrieve relevant documents using vector similarity
-            similar_docs = self.vector_store.search_similar(
-                query=query,
-                top_k=max_results,
-                min_similarity=min_similarity,
-                filters={
-                    'skill_level': [processed_query.skill_level.value, SkillLevel.ALL_LEVELS.value]
-                }
-            )
-            
-            # Get full documents
-            retrieved_documents = []
-            similarity_scores = []
-            
-            for doc_id, similarity in similar_docs:
-                document = self.knowledge_base.get_document(doc_id)
-                if document:
-                    retrieved_documents.append(document)
-                    similarity_scores.append(similarity)
-            
-            # Create retrieval result
-            retrieval_time = (datetime.now() - start_time).total_seconds()
-            
-            result = RetrievalResult(
-                query=processed_query,
-                retrieved_documents=retrieved_documents,
-                similarity_scores=similarity_scores,
-                total_results=len(retrieved_documents),
-                retrieval_time=retrieval_time,
-                metadata={
+            # Check cache first; it holds only the search outcome, the processed query is per request
+            cache_key = self._cache_key(query, max_results, min_similarity, filters)
+            cached = self.query_cache.get(cache_key)
+            if cached is not None:
+                self.retrieval_stats['cache_hits'] += 1
+                documents, similarity_scores, search_metadata = cached
+                retrieval_time = (datetime.now() - start_time).total_seconds()
+            else:
+                # Retrieve relevant documents using vector similarity (fused with BM25 in hybrid mode)
+                similar_docs = self._search(query, max_results, min_similarity, filters)
+                
+                # Get full documents
+                documents = []
+                similarity_scores = []
+                
+                for doc_id, similarity in similar_docs:
+                    document = self.knowledge_base.get_document(doc_id)
+                    if document:
+                        documents.append(document.to_dict())
+                        similarity_scores.append(similarity)
+                
+                retrieval_time = (datetime.now() - start_time).total_seconds()
+                search_metadata = {
                     'vector_search_results': len(similar_docs),
-                    'filtered_results': len(retrieved_documents),
-                    'query_confidence': processed_query.confidence
+                    'filtered_results': len(documents),
+                    'retrieval_mode': 'hybrid' if self.hybrid_search else 'vector'
                 }
-            )
-            
-            # Update stats
-            self.retrieval_stats['total_queries'] += 1
-            self.retrieval_stats['successful_retrievals'] += 1
-            self.retrieval_stats['average_retrieval_time'] = (
-                (self.retrieval_stats['average_retrieval_time'] * (self.retrieval_stats['total_queries'] - 1) + retrieval_time)
-                / self.retrieval_stats['total_queries']
-            )
-            
-            # Cache result if cache is not full
-            if len(self.query_cache) < self.cache_size_limit:
-                self.query_cache[cache_key] = result
+                self.query_cache.put(cache_key, (documents, similarity_scores, search_metadata))
+                
+                # Update stats
+                self.retrieval_stats['total_queries'] += 1
+                self.retrieval_stats['successful_retrievals'] += 1
+                self.retrieval_stats['average_retrieval_time'] = (
+                    (self.retrieval_stats['average_retrieval_time'] * (self.retrieval_stats['total_queries'] - 1) + retrieval_time)
+                    / self.retrieval_stats['total_queries']
+                )
             
             # Prepare response
             response_content = {
                 'retrieval_result': {
                     'processed_query': processed_query.to_dict(),
-                    'documents': [doc.to_dict() for doc in retrieved_documents],
-                    'similarity_scores': similarity_scores,
-                    'total_results': len(retrieved_documents),
+                    'documents': list(documents),
+                    'similarity_scores': list(similarity_scores),
+                    'total_results': len(documents),
                     'retrieval_time': retrieval_time,
-                    'metadata': result.metadata
+                    'metadata': {**search_metadata, 'query_confidence': processed_query.confidence}
                 },
                 'success': True
             }
@@ -471,9 +532,6 @@ class RetrievalAgent(BaseAgent):
                 if document:
                     self.vector_store.update_embedding(document)
                 
-                # Clear cache
-                self.query_cache.clear()
-                
                 response_content = {
                     'success': True,
                     'document_id': document_id,
@@ -528,10 +586,97 @@ class RetrievalAgent(BaseAgent):
             'knowledge_base_stats': self.knowledge_base.get_statistics(),
             'vector_store_stats': self.vector_store.get_statistics(),
             'retrieval_stats': self.retrieval_stats,
-            'cache_size': len(self.query_cache)
+            'cache_size': len(self.query_cache),
+            'query_cache_stats': self.query_cache.get_statistics()
         })
         return base_status
     
+    def _search(self, 
+                query: str, 
+                top_k: int, 
+                min_similarity: float, 
+                filters: Dict[str, Any]) -> List[Tuple[str, float]]:
+        """
+        Top-k (document id, cosine similarity); in hybrid mode the order comes from
+        reciprocal rank fusion of the vector and BM25 candidate lists, so exact
+        terms ("3-bet", "SPR") surface even when their cosine similarity is low.
+        min_similarity only gates the vector candidates; keyword hits need a BM25
+        score above min_bm25_score instead
+        """
+        if not self.hybrid_search:
+            return self.vector_store.search_similar(query=query, top_k=top_k, min_similarity=min_similarity, filters=filters)
+        
+        candidate_k = top_k * self.candidate_multiplier
+        vector_hits = self.vector_store.search_similar(
+            query=query, top_k=candidate_k, min_similarity=min_similarity, filters=filters
+        )
+        keyword_hits = self.knowledge_base.text_index.search(
+            query, top_k=candidate_k, accept=lambda doc_id: self._matches_filters(doc_id, filters)
+        )
+        keyword_hits = [hit for hit in keyword_hits if hit[1] > self.min_bm25_score]
+        # Zero-similarity vector hits share no terms with the query; ranking them would only add noise
+        fused = reciprocal_rank_fusion([[hit for hit in vector_hits if hit[1] > 0], keyword_hits], top_k)
+        
+        similarities = dict(vector_hits)
+        missing = [doc_id for doc_id, _ in fused if doc_id not in similarities]
+        if missing:
+            similarities.update(self.vector_store.score_documents(query, missing))
+        return [(doc_id, similarities.get(doc_id, 0.0)) for doc_id, _ in fused]
+    
+    def _matches_filters(self, document_id: str, filters: Dict[str, Any]) -> bool:
+        """Same filter semantics as VectorStore, applied to knowledge base documents"""
+        document = self.knowledge_base.get_document(document_id)
+        if document is None:
+            return False
+        for key, accepted in filters.items():
+            accepted = accepted if isinstance(accepted, list) else [accepted]
+            value = getattr(document, key, None)
+            value = value.value if isinstance(value, Enum) else value
+            if isinstance(value, list):
+                if not any(item in accepted for item in value):
+                    return False
+            elif value not in accepted:
+                return False
+        return True
+    
+    def search_filters(self, query: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Filters a retrieval of this query applies (skill level inferred from the query text and context)"""
+        return self._filters_for(self.query_processor.process_query(query, context or {}))
+    
+    @staticmethod
+    def _filters_for(processed_query: ProcessedQuery) -> Dict[str, Any]:
+        return {
+            'skill_level': [processed_query.skill_level.value, SkillLevel.ALL_LEVELS.value]
+        }
+    
+    @staticmethod
+    def freeze_filters(filters: Dict[str, Any]) -> Tuple:
+        """Hashable, order-independent form of search filters"""
+        return tuple(sorted(
+            (key, tuple(value) if isinstance(value, list) else value) for key, value in filters.items()
+        ))
+    
+    def _cache_key(self, 
+                   query: str, 
+                   max_results: int, 
+                   min_similarity: float, 
+                   filters: Dict[str, Any]) -> Tuple:
+        """
+        Normalized query, search parameters, and the generations the results depend on:
+        documents (knowledge base), indexed vectors (vector store) and the vectorizer
+        """
+        normalized_query = " ".join(query.lower().split())
+        normalized_filters = self.freeze_filters(filters)
+        return (
+            self.knowledge_base.generation,
+            self.vector_store.generation,
+            self.vector_store.embedding_service.vectorizer_version,
+            normalized_query,
+            max_results,
+            min_similarity,
+            normalized_filters
+        )
+    
     def _create_response(self, original_message: AgentMessage, content: Any) -> AgentMessage:
         """Create response message"""
         return AgentMessage(
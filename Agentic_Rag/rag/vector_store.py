@@ -5,25 +5,27 @@ Provides semantic search capabilities for RAG retrieval
 
 import numpy as np
 import json
-import pickle
 import logging
 from typing import Dict, List, Any, Optional, Tuple, Union
 from dataclasses import dataclass
 from datetime import datetime
 import hashlib
 import requests
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.preprocessing import normalize as sk_normalize
 import sqlite3
 import threading
+from collections import OrderedDict
 
 from .knowledge_base import KnowledgeDocument
+from .ann_index import IVFIndex
 
 @dataclass
 class EmbeddingVector:
     """Represents a document embedding vector"""
     document_id: str
-    vector: np.ndarray
+    vector: Union[np.ndarray, sparse.csr_matrix]
     metadata: Dict[str, Any]
     created_at: datetime
     model_name: str
@@ -33,7 +35,7 @@ class EmbeddingVector:
         """Convert to dictionary for storage"""
         return {
             'document_id': self.document_id,
-            'vector': self.vector.tolist(),
+            'vector': (self.vector.toarray()[0] if sparse.issparse(self.vector) else self.vector).tolist(),
             'metadata': self.metadata,
             'created_at': self.created_at.isoformat(),
             'model_name': self.model_name,
@@ -52,16 +54,96 @@ class EmbeddingVector:
             vector_dimension=data['vector_dimension']
         )
 
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of embeddings bounded by entry count and by bytes
+    Callers put the vectorizer version in the key, so entries from before a
+    refit are never returned and simply age out
+    """
+    
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Any, Tuple[Any, int]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    @staticmethod
+    def vector_nbytes(vector: Union[np.ndarray, sparse.spmatrix]) -> int:
+        if sparse.issparse(vector):
+            return vector.data.nbytes + vector.indices.nbytes + vector.indptr.nbytes
+        return np.asarray(vector).nbytes
+    
+    def get(self, key) -> Optional[Union[np.ndarray, sparse.spmatrix]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, vector: Union[np.ndarray, sparse.spmatrix]):
+        nbytes = self.vector_nbytes(vector)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (vector, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
 class EmbeddingService:
     """
     Service for generating embeddings from text
     Supports multiple embedding models and caching
+    
+    "hashing" is the online alternative to "tfidf": terms are hashed into a
+    fixed n_features space, so there is no vocabulary to fit, and the IDF
+    weights come from document frequencies maintained as documents are added
     """
     
-    def __init__(self, model_name: str = "tfidf", cache_embeddings: bool = True):
+    def __init__(self, 
+                 model_name: str = "tfidf", 
+                 cache_embeddings: bool = True, 
+                 n_features: int = 2 ** 18,
+                 cache_size: int = 10000,
+                 cache_max_bytes: int = 64 * 1024 * 1024):
         self.model_name = model_name
         self.cache_embeddings = cache_embeddings
-        self.embedding_cache = {}
+        self.embedding_cache = EmbeddingCache(max_entries=cache_size, max_bytes=cache_max_bytes)
+        self.fit_version = 0
         self.logger = logging.getLogger("embedding_service")
         
         # Initialize embedding model
@@ -71,45 +153,157 @@ class EmbeddingService:
                 stop_words='english',
                 ngram_range=(1, 2),
                 min_df=1,
-                max_df=0.95
+                max_df=0.95,
+                dtype=np.float32
             )
             self.is_fitted = False
+        elif model_name == "hashing":
+            self.vectorizer = HashingVectorizer(
+                n_features=n_features,
+                stop_words='english',
+                ngram_range=(1, 2),
+                alternate_sign=False,
+                norm=None,
+                dtype=np.float32
+            )
+            self.document_frequency = np.zeros(n_features, dtype=np.int64)
+            self.num_documents = 0
+            self.idf = np.ones(n_features, dtype=np.float32)
+            self.idf_version = 0
+            self.is_fitted = True
         else:
             # For future integration with other embedding models
             self.vectorizer = None
             self.is_fitted = False
     
+    @property
+    def sparse_output(self) -> bool:
+        """TF-IDF and hashing embeddings are returned as 1 x d CSR rows instead of dense arrays"""
+        return self.model_name in ("tfidf", "hashing")
+    
+    @property
+    def vectorizer_version(self) -> Tuple[int, int]:
+        """Changes whenever the same text would embed differently (refit, restored state, new IDF)"""
+        return self.fit_version, getattr(self, 'idf_version', 0)
+    
+    @property
+    def online_idf(self) -> bool:
+        """Stored vectors are raw term frequencies, weighted by the current IDF when indexed"""
+        return self.model_name == "hashing"
+    
     def fit_vectorizer(self, documents: List[str]):
         """Fit the vectorizer on a corpus of documents"""
         if self.model_name == "tfidf":
             self.vectorizer.fit(documents)
             self.is_fitted = True
+            self.fit_version += 1
             self.logger.info(f"Fitted TF-IDF vectorizer on {len(documents)} documents")
+        elif self.model_name == "hashing":
+            self.fit_document_frequency(self.term_frequencies(documents))
+    
+    def get_state(self) -> Optional[Dict[str, Any]]:
+        """JSON-serializable vectorizer state that stored vectors depend on (None until fitted)"""
+        if self.model_name == "tfidf":
+            if not self.is_fitted:
+                return None
+            return {
+                'model_name': self.model_name,
+                'vocabulary': {term: int(column) for term, column in self.vectorizer.vocabulary_.items()},
+                'idf': self.vectorizer.idf_.tolist()
+            }
+        if self.model_name == "hashing":
+            # The IDF is derived from the stored term frequencies, only the hashing space matters
+            return {'model_name': self.model_name, 'n_features': self.vectorizer.n_features}
+        return {'model_name': self.model_name}
+    
+    def set_state(self, state: Dict[str, Any]) -> bool:
+        """Restore a state saved by get_state; False if it belongs to another configuration"""
+        if state.get('model_name') != self.model_name:
+            return False
+        if self.model_name == "tfidf":
+            self.vectorizer.vocabulary_ = state['vocabulary']
+            self.vectorizer.idf_ = np.asarray(state['idf'], dtype=np.float32)
+            self.is_fitted = True
+            self.fit_version += 1
+        elif self.model_name == "hashing":
+            return state.get('n_features') == self.vectorizer.n_features
+        return True
+    
+    @staticmethod
+    def state_fingerprint(state: Optional[Dict[str, Any]]) -> Optional[str]:
+        if state is None:
+            return None
+        return hashlib.md5(json.dumps(state, sort_keys=True).encode()).hexdigest()
+    
+    # Online IDF (hashing model)
     
-    def generate_embedding(self, text: str) -> np.ndarray:
+    def term_frequencies(self, texts: List[str]) -> sparse.csr_matrix:
+        """Hashed term counts, one CSR row per text"""
+        return self.vectorizer.transform(texts)
+    
+    def fit_document_frequency(self, term_frequencies: sparse.spmatrix):
+        """Recount document frequencies from a whole corpus and install its IDF"""
+        self.document_frequency[:] = 0
+        self.num_documents = 0
+        self.update_document_frequency(term_frequencies)
+        self.set_idf(self.compute_idf())
+        self.logger.info(f"Computed hashed IDF over {self.num_documents} documents")
+    
+    def update_document_frequency(self, term_frequencies: sparse.spmatrix, sign: int = 1):
+        """Count (sign=1) or forget (sign=-1) documents in the document frequencies"""
+        term_frequencies = sparse.csr_matrix(term_frequencies)
+        term_frequencies.sum_duplicates()
+        np.add.at(self.document_frequency, term_frequencies.indices, sign)
+        self.num_documents += sign * term_frequencies.shape[0]
+    
+    def compute_idf(self) -> np.ndarray:
+        """Smoothed IDF from the current document frequencies, as in TfidfVectorizer"""
+        idf = np.log((1 + self.num_documents) / (1 + self.document_frequency)) + 1
+        return idf.astype(np.float32)
+    
+    def set_idf(self, idf: np.ndarray):
+        """Install new IDF weights; bumping idf_version retires embeddings cached with the old ones"""
+        self.idf = idf
+        self.idf_version += 1
+    
+    def apply_idf(self, term_frequencies: sparse.spmatrix, idf: Optional[np.ndarray] = None) -> sparse.csr_matrix:
+        """Weight term frequencies by idf (default: the installed weights)"""
+        weighted = sparse.csr_matrix(term_frequencies, dtype=np.float32, copy=True)
+        weighted.data *= (self.idf if idf is None else idf)[weighted.indices]
+        return weighted
+    
+    def generate_embedding(self, text: str) -> Union[np.ndarray, sparse.csr_matrix]:
         """Generate embedding vector for text"""
         try:
-            # Check cache first
+            if self.model_name == "tfidf" and not self.is_fitted:
+                # Fit on single document if not fitted
+                self.vectorizer.fit([text])
+                self.is_fitted = True
+                self.fit_version += 1
+            
+            # Check cache first; the key pins the vectorizer version the vector was computed with
             if self.cache_embeddings:
-                text_hash = hashlib.md5(text.encode()).hexdigest()
-                if text_hash in self.embedding_cache:
-                    return self.embedding_cache[text_hash]
+                cache_key = (self.vectorizer_version, hashlib.md5(text.encode()).hexdigest())
+                cached = self.embedding_cache.get(cache_key)
+                if cached is not None:
+                    return cached
             
             # Generate embedding based on model
             if self.model_name == "tfidf":
-                if not self.is_fitted:
-                    # Fit on single document if not fitted
-                    self.vectorizer.fit([text])
-                    self.is_fitted = True
-                
-                vector = self.vectorizer.transform([text]).toarray()[0]
+                vector = self.vectorizer.transform([text])
                 
                 # Cache the result
                 if self.cache_embeddings:
-                    self.embedding_cache[text_hash] = vector
+                    self.embedding_cache.put(cache_key, vector)
                 
                 return vector
             
+            elif self.model_name == "hashing":
+                vector = self.apply_idf(self.term_frequencies([text]))
+                if self.cache_embeddings:
+                    self.embedding_cache.put(cache_key, vector)
+                return vector
+            
             else:
                 # Placeholder for other embedding models
                 # Could integrate with OpenAI, Sentence Transformers, etc.
@@ -120,16 +314,21 @@ class EmbeddingService:
             # Return zero vector as fallback
             return np.zeros(100)
     
-    def generate_batch_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+    def generate_batch_embeddings(self, texts: List[str]) -> List[Union[np.ndarray, sparse.csr_matrix]]:
         """Generate embeddings for multiple texts efficiently"""
         try:
             if self.model_name == "tfidf":
                 if not self.is_fitted:
                     self.vectorizer.fit(texts)
                     self.is_fitted = True
+                    self.fit_version += 1
                 
-                vectors = self.vectorizer.transform(texts).toarray()
-                return [vector for vector in vectors]
+                vectors = self.vectorizer.transform(texts)
+                return [vectors[i] for i in range(vectors.shape[0])]
+            
+            elif self.model_name == "hashing":
+                vectors = self.apply_idf(self.term_frequencies(texts))
+                return [vectors[i] for i in range(vectors.shape[0])]
             
             else:
                 # For other models, generate individually
@@ -143,54 +342,505 @@ class EmbeddingService:
         """Get the dimension of embedding vectors"""
         if self.model_name == "tfidf" and self.is_fitted:
             return len(self.vectorizer.get_feature_names_out())
+        if self.model_name == "hashing":
+            return self.vectorizer.n_features
         return 100  # Default dimension
 
+# Storage formats of the embeddings.vector_format column
+VECTOR_FORMATS = ('dense', 'csr')
+
+def vector_dimension(vector: Union[np.ndarray, sparse.spmatrix]) -> int:
+    """Dimension of a dense vector or a 1 x d sparse row"""
+    return vector.shape[-1]
+
+def document_fingerprint(document: KnowledgeDocument) -> str:
+    """Hash of everything an embedding is built from: embedded text and filter metadata"""
+    fingerprint_str = json.dumps([
+        document.title, document.content, document.document_type.value,
+        document.skill_level.value, document.tags, document.confidence_score
+    ])
+    return hashlib.md5(fingerprint_str.encode()).hexdigest()
+
+class EmbeddingMatrix:
+    """
+    Contiguous float32 matrix of L2-normalized vectors with a parallel id list
+    Rows stay packed: removing a row moves the last row into its slot
+    An optional IVFIndex (ann) restricts searches to the rows of the closest lists
+    """
+    
+    def __init__(self, initial_capacity: int = 1024, ann: Optional[IVFIndex] = None):
+        self.initial_capacity = initial_capacity
+        self.ann = ann
+        self.dimension: Optional[int] = None
+        self.ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self._reset_storage()
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self.row_of
+    
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the occupied rows"""
+        return self._vectors[:len(self.ids)]
+    
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """L2-normalize rows as float32, leaving zero rows at zero"""
+        if sparse.issparse(vectors):
+            vectors = vectors.toarray()
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+    
+    # Storage hooks, overridden by SparseEmbeddingMatrix
+    
+    def normalize_query(self, query_vector: np.ndarray) -> np.ndarray:
+        """Unit-length query, in the form rows are multiplied with"""
+        return self.normalize(query_vector)[0]
+    
+    @staticmethod
+    def _score(rows: np.ndarray, normalized_query: np.ndarray) -> np.ndarray:
+        return rows @ normalized_query
+    
+    def _reset_storage(self):
+        self._vectors = np.zeros((0, self.dimension or 0), dtype=np.float32)
+    
+    @staticmethod
+    def _stack(vectors: List[np.ndarray]) -> np.ndarray:
+        return np.stack([v.toarray()[0] if sparse.issparse(v) else v for v in vectors]) if vectors else None
+    
+    def _store_rows(self, vectors: np.ndarray):
+        self._reserve(vectors.shape[0])
+        self._vectors[:vectors.shape[0]] = self.normalize(vectors)
+    
+    def _set_row(self, row: int, vector: np.ndarray):
+        self._reserve(row + 1)
+        self._vectors[row] = self.normalize(vector)[0]
+    
+    def _move_row(self, source: int, target: int):
+        self._vectors[target] = self._vectors[source]
+    
+    def _pop_row(self):
+        pass
+    
+    def _reserve(self, rows: int):
+        if rows <= self._vectors.shape[0]:
+            return
+        capacity = max(rows, 2 * self._vectors.shape[0], self.initial_capacity)
+        grown = np.zeros((capacity, self.dimension), dtype=np.float32)
+        if self.ids:
+            grown[:len(self.ids)] = self.matrix
+        self._vectors = grown
+    
+    def build(self, 
+              document_ids: List[str], 
+              vectors: Union[List[np.ndarray], np.ndarray, sparse.spmatrix],
+              retrain_ann: bool = True):
+        """
+        Replace every row at once, from a list of vectors or an n x d (sparse) matrix
+        retrain_ann=False keeps the ANN centroids (e.g. when reloading the same vectors)
+        """
+        self.clear()
+        if not document_ids:
+            return
+        if isinstance(vectors, list):
+            self.dimension = vector_dimension(vectors[0])
+            kept = [(doc_id, vector) for doc_id, vector in zip(document_ids, vectors)
+                    if vector_dimension(vector) == self.dimension]
+            document_ids = [doc_id for doc_id, _ in kept]
+            vectors = self._stack([vector for _, vector in kept])
+        else:
+            self.dimension = vectors.shape[1]
+        self._reset_storage()
+        if document_ids:
+            self._store_rows(vectors)
+        self.ids = list(document_ids)
+        self.row_of = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        if self.ann is not None:
+            self.ann.reset_rows(self.matrix if self.ids else None, retrain=retrain_ann)
+    
+    def upsert(self, document_id: str, vector: np.ndarray) -> bool:
+        """Insert or overwrite a row; returns False on a dimension mismatch"""
+        if self.dimension is None or not self.ids:
+            self.dimension = vector_dimension(vector)
+            self._reset_storage()
+        if vector_dimension(vector) != self.dimension:
+            self.remove(document_id)
+            return False
+        
+        row = self.row_of.get(document_id)
+        if row is None:
+            row = len(self.ids)
+            self._set_row(row, vector)
+            self.ids.append(document_id)
+            self.row_of[document_id] = row
+        else:
+            self._set_row(row, vector)
+        if self.ann is not None:
+            self.ann.set_row(row, vector)
+        return True
+    
+    def remove(self, document_id: str) -> bool:
+        row = self.row_of.pop(document_id, None)
+        if row is None:
+            return False
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self._move_row(last, row)
+            self.ids[row] = moved_id
+            self.row_of[moved_id] = row
+            if self.ann is not None:
+                self.ann.move_row(last, row)
+        self.ids.pop()
+        self._pop_row()
+        if self.ann is not None:
+            self.ann.pop_row()
+        return True
+    
+    def clear(self):
+        self.ids = []
+        self.row_of = {}
+        self._reset_storage()
+        if self.ann is not None:
+            self.ann.reset_rows(None, retrain=False)
+    
+    def scores(self, query_vector: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the query with every row"""
+        return self._score(self.matrix, self.normalize_query(query_vector))
+    
+    def score_rows(self, rows: List[int], query_vector: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the query with the given rows"""
+        return self._score(self.matrix[rows], self.normalize_query(query_vector))
+    
+    def top_k(self, 
+              query_vector: np.ndarray, 
+              top_k: int, 
+              min_similarity: float, 
+              candidates: Optional[np.ndarray] = None,
+              exact: bool = False) -> List[Tuple[str, float]]:
+        """
+        Cosine top-k: one matrix-vector product plus argpartition
+        With an ANN index only the rows of the probed lists are scored, unless exact=True
+        """
+        if not self.ids or top_k <= 0:
+            return []
+        if vector_dimension(query_vector) != self.dimension:
+            raise ValueError(
+                f"Query dimension {vector_dimension(query_vector)} does not match index dimension {self.dimension}"
+            )
+        
+        normalized_query = self.normalize_query(query_vector)
+        if not exact and self.ann is not None:
+            if self.ann.ready(len(self)):
+                rows = self.ann.candidate_rows(normalized_query)
+                # A filter selecting fewer rows than the probed lists is cheaper (and exact) to scan
+                if candidates is None or np.count_nonzero(candidates) > len(rows):
+                    if candidates is not None:
+                        rows = rows[candidates[rows]]
+                    return self._select(rows, self._score(self.matrix[rows], normalized_query), top_k, min_similarity)
+        
+        if candidates is None:
+            return self._select(np.arange(len(self)), self._score(self.matrix, normalized_query), top_k, min_similarity)
+        # Only the rows passing the filters are scored
+        rows = np.flatnonzero(candidates)
+        return self._select(rows, self._score(self.matrix[rows], normalized_query), top_k, min_similarity)
+    
+    def _select(self, 
+                rows: np.ndarray, 
+                scores: np.ndarray, 
+                top_k: int, 
+                min_similarity: float) -> List[Tuple[str, float]]:
+        """Top-k (id, score) among rows, where scores[i] belongs to rows[i]"""
+        keep = scores >= min_similarity
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        return [(self.ids[row], float(score)) for row, score in zip(rows[order], scores[order])]
+
+class SparseEmbeddingMatrix(EmbeddingMatrix):
+    """
+    CSR counterpart of EmbeddingMatrix for sparse (TF-IDF) vectors
+    Rows are kept as normalized (indices, data) pairs and stacked into one CSR
+    matrix lazily, on the first search after a change; queries stay 1 x d CSR
+    rows, so scoring is sparse @ sparse, proportional to the stored non-zeros
+    An IVF index works as for dense rows while the vocabulary fits its max_dimension
+    """
+    
+    @staticmethod
+    def normalize_sparse(vectors: Union[np.ndarray, sparse.spmatrix]) -> sparse.csr_matrix:
+        """L2-normalize rows as a float32 CSR matrix, leaving zero rows at zero"""
+        # Copy so cached / stored embeddings are never normalized in place
+        vectors = sparse.csr_matrix(vectors, dtype=np.float32, copy=True)
+        return sk_normalize(vectors, norm='l2', copy=False)
+    
+    def normalize_query(self, query_vector: Union[np.ndarray, sparse.spmatrix]) -> sparse.csr_matrix:
+        """Unit-length 1 x d CSR query, never densified (a hashing query has 2^18 columns)"""
+        query = sparse.csr_matrix(query_vector, dtype=np.float32)
+        norm = np.sqrt(query.data @ query.data)
+        return query.multiply(1.0 / norm).tocsr() if norm else query
+    
+    @staticmethod
+    def _score(rows: sparse.csr_matrix, normalized_query: sparse.csr_matrix) -> np.ndarray:
+        return (rows @ normalized_query.T).toarray().ravel()
+    
+    @property
+    def matrix(self) -> sparse.csr_matrix:
+        if self._stacked is None:
+            lengths = np.fromiter((len(indices) for indices, _ in self._rows), dtype=np.int64, count=len(self._rows))
+            indptr = np.zeros(len(self._rows) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=indptr[1:])
+            indices = np.concatenate([i for i, _ in self._rows]) if self._rows else np.zeros(0, dtype=np.int32)
+            data = np.concatenate([d for _, d in self._rows]) if self._rows else np.zeros(0, dtype=np.float32)
+            self._stacked = sparse.csr_matrix((data, indices, indptr), shape=(len(self._rows), self.dimension or 0))
+        return self._stacked
+    
+    def _reset_storage(self):
+        self._rows: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._stacked = None
+    
+    @staticmethod
+    def _stack(vectors: List[Union[np.ndarray, sparse.spmatrix]]) -> sparse.csr_matrix:
+        return sparse.vstack([sparse.csr_matrix(v) for v in vectors], format='csr') if vectors else None
+    
+    def _store_rows(self, vectors: Union[np.ndarray, sparse.spmatrix]):
+        stacked = self.normalize_sparse(vectors)
+        stacked.sort_indices()
+        splits = stacked.indptr[1:-1]
+        self._rows = list(zip(np.split(stacked.indices, splits), np.split(stacked.data, splits)))
+        self._stacked = stacked
+    
+    def _set_row(self, row: int, vector: Union[np.ndarray, sparse.spmatrix]):
+        normalized = self.normalize_sparse(vector)
+        entry = (normalized.indices, normalized.data)
+        if row == len(self._rows):
+            self._rows.append(entry)
+        else:
+            self._rows[row] = entry
+        self._stacked = None
+    
+    def _move_row(self, source: int, target: int):
+        self._rows[target] = self._rows[source]
+        self._stacked = None
+    
+    def _pop_row(self):
+        self._rows.pop()
+        self._stacked = None
+
+class MetadataBitmaps:
+    """
+    Row bitmaps over indexed metadata fields, aligned with EmbeddingMatrix rows
+    Each (field, value) pair maps to a Python int whose bit i is set when row i
+    has that value, so filters are big-int AND/OR unpacked to one boolean mask
+    List-valued metadata (tags) sets one bit per element
+    """
+    
+    FIELDS = ('skill_level', 'document_type', 'tags')
+    
+    def __init__(self, fields: Tuple[str, ...] = FIELDS):
+        self.fields = fields
+        self.clear()
+    
+    def clear(self):
+        self.bitmaps: Dict[Tuple[str, Any], int] = {}
+        self.row_keys: List[List[Tuple[str, Any]]] = []
+    
+    def __len__(self) -> int:
+        return len(self.row_keys)
+    
+    def _keys(self, metadata: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        keys = []
+        for field in self.fields:
+            value = metadata.get(field)
+            if value is None:
+                # A missing field matches any filter on it, as in VectorStore._matches_filters
+                keys.append((field, None))
+            elif isinstance(value, (list, tuple, set)):
+                keys.extend((field, item) for item in value)
+            else:
+                keys.append((field, value))
+        return keys
+    
+    def _set_bits(self, row: int, keys: List[Tuple[str, Any]]):
+        bit = 1 << row
+        for key in keys:
+            self.bitmaps[key] = self.bitmaps.get(key, 0) | bit
+    
+    def _clear_bits(self, row: int, keys: List[Tuple[str, Any]]):
+        bit = 1 << row
+        for key in keys:
+            remaining = self.bitmaps.get(key, 0) & ~bit
+            if remaining:
+                self.bitmaps[key] = remaining
+            else:
+                self.bitmaps.pop(key, None)
+    
+    def build(self, metadata_rows: List[Dict[str, Any]]):
+        """Replace every row, packing each bitmap once instead of setting bits one at a time"""
+        self.clear()
+        self.row_keys = [self._keys(metadata) for metadata in metadata_rows]
+        rows_by_key: Dict[Tuple[str, Any], List[int]] = {}
+        for row, keys in enumerate(self.row_keys):
+            for key in keys:
+                rows_by_key.setdefault(key, []).append(row)
+        for key, rows in rows_by_key.items():
+            bits = np.zeros(len(self.row_keys), dtype=bool)
+            bits[rows] = True
+            self.bitmaps[key] = int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+    
+    def set_row(self, row: int, metadata: Dict[str, Any]):
+        keys = self._keys(metadata)
+        if row == len(self.row_keys):
+            self.row_keys.append(keys)
+        else:
+            self._clear_bits(row, self.row_keys[row])
+            self.row_keys[row] = keys
+        self._set_bits(row, keys)
+    
+    def remove_row(self, row: int):
+        """Swap-remove, mirroring EmbeddingMatrix.remove: the last row moves into row"""
+        last = len(self.row_keys) - 1
+        self._clear_bits(row, self.row_keys[row])
+        if row != last:
+            moved_keys = self.row_keys[last]
+            self._clear_bits(last, moved_keys)
+            self._set_bits(row, moved_keys)
+            self.row_keys[row] = moved_keys
+        self.row_keys.pop()
+    
+    def bitmap(self, filters: Dict[str, Any]) -> Optional[int]:
+        """AND across indexed fields of the OR across each field's accepted values (None: no indexed filter)"""
+        result = None
+        for field, value in filters.items():
+            if field not in self.fields:
+                continue
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            field_bits = self.bitmaps.get((field, None), 0)
+            for item in values:
+                field_bits |= self.bitmaps.get((field, item), 0)
+            result = field_bits if result is None else result & field_bits
+        return result
+    
+    def mask(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Boolean row mask for the indexed part of filters"""
+        bits = self.bitmap(filters)
+        if bits is None:
+            return None
+        num_rows = len(self.row_keys)
+        packed = np.frombuffer(bits.to_bytes((num_rows + 7) // 8, 'little'), dtype=np.uint8)
+        return np.unpackbits(packed, count=num_rows, bitorder='little').astype(bool)
+
 class VectorStore:
     """
     Vector database for storing and searching document embeddings
     Provides similarity search and retrieval capabilities
     """
     
-    def __init__(self, storage_path: str = None, embedding_service: EmbeddingService = None):
+    def __init__(self, 
+                 storage_path: str = None, 
+                 embedding_service: EmbeddingService = None,
+                 ann_index: Optional[IVFIndex] = None,
+                 reweight_interval: int = 1000):
         self.storage_path = storage_path or "/tmp/vector_store.db"
         self.embedding_service = embedding_service or EmbeddingService()
         self.vectors: Dict[str, EmbeddingVector] = {}
+        
+        # Optional approximate search; centroids persist next to the database
+        self.ann_index = ann_index
+        self._ann_thread: Optional[threading.Thread] = None
+        if ann_index is not None:
+            ann_index.path = ann_index.path or f"{self.storage_path}.ivf.npz"
+        matrix_class = SparseEmbeddingMatrix if self.embedding_service.sparse_output else EmbeddingMatrix
+        self.index = matrix_class(ann=ann_index)
+        self.metadata_index = MetadataBitmaps()
         self.logger = logging.getLogger("vector_store")
         self._lock = threading.Lock()
         
+        # Bumped on every change to the searchable vectors, so cached search results can tell they are stale
+        self.generation = 0
+        
+        # Online IDF (hashing model): re-weight the index in the background every reweight_interval changes
+        self.reweight_interval = reweight_interval
+        self._changes_since_reweight = 0
+        self._reweight_thread: Optional[threading.Thread] = None
+        
+        # One long-lived WAL connection shared by all writes, serialized by _db_lock
+        self._db_lock = threading.Lock()
+        self._conn = self._connect()
+        
+        # Fingerprint of the vectorizer state the stored vectors were built with
+        self._stored_vectorizer_fingerprint: Optional[str] = None
+        self._saved_fit_version = -1
+        
         # Initialize SQLite database for persistent storage
         self._init_database()
         
-        # Load existing vectors
+        # Restore the vectorizer, the IVF centroids trained under it, then load existing vectors
+        self._load_vectorizer_state()
+        if ann_index is not None:
+            ann_index.load(self._stored_vectorizer_fingerprint)
         self.load_vectors()
+        self._maybe_train_ann_in_background()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open the shared connection in WAL mode"""
+        conn = sqlite3.connect(self.storage_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    def close(self):
+        """Close the database connection"""
+        with self._db_lock:
+            self._conn.close()
     
     def _init_database(self):
         """Initialize SQLite database for vector storage"""
         try:
-            conn = sqlite3.connect(self.storage_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS embeddings (
-                    document_id TEXT PRIMARY KEY,
-                    vector BLOB,
-                    metadata TEXT,
-                    created_at TEXT,
-                    model_name TEXT,
-                    vector_dimension INTEGER
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_model_name ON embeddings(model_name)
-            ''')
-            
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_created_at ON embeddings(created_at)
-            ''')
-            
-            conn.commit()
-            conn.close()
+            with self._db_lock, self._conn as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        document_id TEXT PRIMARY KEY,
+                        vector BLOB,
+                        metadata TEXT,
+                        created_at TEXT,
+                        model_name TEXT,
+                        vector_dimension INTEGER
+                    )
+                ''')
+                
+                # Raw little-endian float32 vectors: vector holds the values, and for
+                # CSR rows vector_indices holds the int32 column indices
+                columns = {row[1] for row in cursor.execute("PRAGMA table_info(embeddings)")}
+                if 'vector_format' not in columns:
+                    cursor.execute("ALTER TABLE embeddings ADD COLUMN vector_format TEXT")
+                if 'vector_indices' not in columns:
+                    cursor.execute("ALTER TABLE embeddings ADD COLUMN vector_indices BLOB")
+                
+                # Key/value state saved with the vectors (fitted vectorizer)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS index_state (
+                        key TEXT PRIMARY KEY,
+                        value TEXT
+                    )
+                ''')
+                
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_model_name ON embeddings(model_name)
+                ''')
+                
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_created_at ON embeddings(created_at)
+                ''')
             
             self.logger.info(f"Initialized vector database at {self.storage_path}")
             
@@ -205,74 +855,100 @@ class VectorStore:
                 text_content = f"{document.title} {document.content}"
                 
                 # Generate embedding
-                vector = self.embedding_service.generate_embedding(text_content)
+                vector = self._document_vectors([text_content])[0]
                 
                 # Create embedding vector object
-                embedding_vector = EmbeddingVector(
-                    document_id=document.id,
-                    vector=vector,
-                    metadata={
-                        'document_type': document.document_type.value,
-                        'skill_level': document.skill_level.value,
-                        'tags': document.tags,
-                        'title': document.title,
-                        'confidence_score': document.confidence_score
-                    },
-                    created_at=datetime.now(),
-                    model_name=self.embedding_service.model_name,
-                    vector_dimension=len(vector)
-                )
+                embedding_vector = self._make_embedding_vector(document, vector)
                 
                 # Store in memory
-                self.vectors[document.id] = embedding_vector
+                self._store_in_memory(embedding_vector)
                 
                 # Store in database
                 self._save_vector_to_db(embedding_vector)
                 
                 self.logger.info(f"Added embedding for document: {document.id}")
-                return True
+            
+            self._maybe_reweight_in_background()
+            self._maybe_train_ann_in_background()
+            return True
         
         except Exception as e:
             self.logger.error(f"Error adding document embedding: {e}")
             return False
     
+    def add_embeddings(self, documents: List[KnowledgeDocument]) -> bool:
+        """Embed documents in one batch and store them in a single transaction"""
+        try:
+            if not documents:
+                return True
+            
+            texts = [f"{doc.title} {doc.content}" for doc in documents]
+            vectors = self._document_vectors(texts)
+            embedding_vectors = [self._make_embedding_vector(doc, vector) for doc, vector in zip(documents, vectors)]
+            
+            with self._lock:
+                self._save_vectors_to_db(embedding_vectors)
+                for embedding_vector in embedding_vectors:
+                    self._store_in_memory(embedding_vector)
+            
+            self.logger.info(f"Added {len(embedding_vectors)} embeddings")
+            self._maybe_reweight_in_background()
+            self._maybe_train_ann_in_background()
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error adding embeddings: {e}")
+            return False
+    
     def search_similar(self, 
                       query: str, 
                       top_k: int = 5,
                       min_similarity: float = 0.1,
-                      filters: Dict[str, Any] = None) -> List[Tuple[str, float]]:
-        """Search for similar documents using vector similarity"""
+                      filters: Dict[str, Any] = None,
+                      exact: bool = False) -> List[Tuple[str, float]]:
+        """Search for similar documents using vector similarity (exact=True bypasses the ANN index)"""
         try:
             # Generate query embedding
             query_vector = self.embedding_service.generate_embedding(query)
             
-            if len(self.vectors) == 0:
-                return []
-            
-            # Calculate similarities
-            similarities = []
-            for doc_id, embedding_vector in self.vectors.items():
-                # Apply filters if provided
-                if filters and not self._matches_filters(embedding_vector, filters):
-                    continue
+            with self._lock:
+                if len(self.index) == 0:
+                    return []
                 
-                # Calculate cosine similarity
-                similarity = cosine_similarity(
-                    query_vector.reshape(1, -1),
-                    embedding_vector.vector.reshape(1, -1)
-                )[0][0]
+                # Apply filters if provided: bitmaps for indexed fields, per-row checks for the rest
+                candidates = None
+                if filters:
+                    candidates = self.metadata_index.mask(filters)
+                    other_filters = {k: v for k, v in filters.items() if k not in self.metadata_index.fields}
+                    if other_filters:
+                        if candidates is None:
+                            candidates = np.ones(len(self.index), dtype=bool)
+                        for row in np.flatnonzero(candidates):
+                            candidates[row] = self._matches_filters(self.vectors[self.index.ids[row]], other_filters)
+                    if not candidates.any():
+                        return []
                 
-                if similarity >= min_similarity:
-                    similarities.append((doc_id, similarity))
-            
-            # Sort by similarity and return top_k
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            return similarities[:top_k]
+                return self.index.top_k(query_vector, top_k, min_similarity, candidates, exact=exact)
         
         except Exception as e:
             self.logger.error(f"Error searching similar documents: {e}")
             return []
     
+    def score_documents(self, query: str, document_ids: List[str]) -> Dict[str, float]:
+        """Cosine similarity of the query with specific indexed documents (e.g. keyword-only hits)"""
+        try:
+            query_vector = self.embedding_service.generate_embedding(query)
+            with self._lock:
+                rows = [self.index.row_of[doc_id] for doc_id in document_ids if doc_id in self.index.row_of]
+                if not rows or vector_dimension(query_vector) != self.index.dimension:
+                    return {}
+                scores = self.index.score_rows(rows, query_vector)
+                return {self.index.ids[row]: float(score) for row, score in zip(rows, scores)}
+        
+        except Exception as e:
+            self.logger.error(f"Error scoring documents: {e}")
+            return {}
+    
     def get_embedding(self, document_id: str) -> Optional[EmbeddingVector]:
         """Get embedding vector for a document"""
         return self.vectors.get(document_id)
@@ -281,18 +957,24 @@ class VectorStore:
         """Remove embedding for a document"""
         try:
             with self._lock:
-                if document_id in self.vectors:
-                    del self.vectors[document_id]
+                removed = self.vectors.pop(document_id, None)
+                if removed is not None and self.embedding_service.online_idf:
+                    self.embedding_service.update_document_frequency(removed.vector, sign=-1)
+                    self._changes_since_reweight += 1
+                row = self.index.row_of.get(document_id)
+                if self.index.remove(document_id):
+                    self.metadata_index.remove_row(row)
+                self.generation += 1
                 
                 # Remove from database
-                conn = sqlite3.connect(self.storage_path)
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM embeddings WHERE document_id = ?", (document_id,))
-                conn.commit()
-                conn.close()
+                with self._db_lock, self._conn as conn:
+                    conn.execute("DELETE FROM embeddings WHERE document_id = ?", (document_id,))
                 
                 self.logger.info(f"Removed embedding for document: {document_id}")
-                return True
+            
+            self._maybe_reweight_in_background()
+            self._maybe_train_ann_in_background()
+            return True
             
         except Exception as e:
             self.logger.error(f"Error removing embedding: {e}")
@@ -314,6 +996,23 @@ class VectorStore:
             'by_skill_level': {}
         }
         
+        if self.embedding_service.cache_embeddings:
+            stats['embedding_cache'] = self.embedding_service.embedding_cache.get_statistics()
+        
+        if self.embedding_service.online_idf:
+            stats['idf_version'] = self.embedding_service.idf_version
+            stats['changes_since_reweight'] = self._changes_since_reweight
+        
+        if self.ann_index is not None:
+            stats['ann_index'] = {
+                'type': 'ivf',
+                'trained': self.ann_index.is_trained,
+                'nlist': len(self.ann_index.centroids) if self.ann_index.is_trained else 0,
+                'nprobe': self.ann_index.nprobe,
+                'active': self.ann_index.ready(len(self.index)),
+                'training': self._ann_thread is not None and self._ann_thread.is_alive()
+            }
+        
         # Count by document type and skill level
         for embedding_vector in self.vectors.values():
             doc_type = embedding_vector.metadata.get('document_type', 'unknown')
@@ -324,21 +1023,61 @@ class VectorStore:
         
         return stats
     
+    def _load_vectorizer_state(self):
+        """Restore the vectorizer the stored vectors were built with, unless the service is already fitted"""
+        try:
+            with self._db_lock:
+                row = self._conn.execute("SELECT value FROM index_state WHERE key = 'vectorizer'").fetchone()
+            if row is None:
+                return
+            state = json.loads(row[0])
+            self._stored_vectorizer_fingerprint = EmbeddingService.state_fingerprint(state)
+            if self.embedding_service.get_state() is None and self.embedding_service.set_state(state):
+                self._saved_fit_version = self.embedding_service.fit_version
+                self.logger.info("Restored vectorizer state from the vector database")
+        except Exception as e:
+            self.logger.error(f"Error loading vectorizer state: {e}")
+    
+    def sync_documents(self, documents: List[KnowledgeDocument], rebuild_threshold: float = 0.5) -> Dict[str, Any]:
+        """
+        Warm start: bring the persisted index in line with documents
+        Unchanged documents keep their stored vectors and only new or edited ones are
+        embedded; a different vectorizer, or more than rebuild_threshold of the corpus
+        changed (refit worth it for TF-IDF), falls back to rebuild_index
+        """
+        fingerprints = {doc.id: document_fingerprint(doc) for doc in documents}
+        with self._lock:
+            changed = [doc for doc in documents
+                       if doc.id not in self.vectors
+                       or self.vectors[doc.id].metadata.get('fingerprint') != fingerprints[doc.id]]
+            removed = [doc_id for doc_id in self.vectors if doc_id not in fingerprints]
+        
+        summary = {'rebuilt': False, 'embedded': len(changed), 'removed': len(removed),
+                   'unchanged': len(documents) - len(changed)}
+        vectorizer_fingerprint = EmbeddingService.state_fingerprint(self.embedding_service.get_state())
+        too_many_changes = (not self.embedding_service.online_idf 
+                            and len(changed) + len(removed) > rebuild_threshold * max(1, len(documents)))
+        if (vectorizer_fingerprint is None 
+                or vectorizer_fingerprint != self._stored_vectorizer_fingerprint 
+                or too_many_changes):
+            self.rebuild_index(documents)
+            summary.update(rebuilt=True, embedded=len(documents), unchanged=0)
+            return summary
+        
+        for doc_id in removed:
+            self.remove_embedding(doc_id)
+        if changed:
+            self.add_embeddings(changed)
+        self.logger.info(
+            f"Synced vector index: {summary['unchanged']} unchanged, {len(changed)} embedded, {len(removed)} removed"
+        )
+        return summary
+    
     def rebuild_index(self, documents: List[KnowledgeDocument]) -> bool:
         """Rebuild the entire vector index"""
         try:
             self.logger.info("Rebuilding vector index...")
             
-            # Clear existing vectors
-            self.vectors.clear()
-            
-            # Clear database
-            conn = sqlite3.connect(self.storage_path)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM embeddings")
-            conn.commit()
-            conn.close()
-            
             # Prepare texts for batch embedding
             texts = [f"{doc.title} {doc.content}" for doc in documents]
             
@@ -347,29 +1086,21 @@ class VectorStore:
                 self.embedding_service.fit_vectorizer(texts)
             
             # Generate embeddings for all documents
-            vectors = self.embedding_service.generate_batch_embeddings(texts)
+            vectors = self._document_vectors(texts)
+            embedding_vectors = [self._make_embedding_vector(doc, vector) for doc, vector in zip(documents, vectors)]
             
-            # Store embeddings
-            for document, vector in zip(documents, vectors):
-                embedding_vector = EmbeddingVector(
-                    document_id=document.id,
-                    vector=vector,
-                    metadata={
-                        'document_type': document.document_type.value,
-                        'skill_level': document.skill_level.value,
-                        'tags': document.tags,
-                        'title': document.title,
-                        'confidence_score': document.confidence_score
-                    },
-                    created_at=datetime.now(),
-                    model_name=self.embedding_service.model_name,
-                    vector_dimension=len(vector)
-                )
-                
-                self.vectors[document.id] = embedding_vector
-                self._save_vector_to_db(embedding_vector)
+            # Replace the stored embeddings in one transaction, then swap the in-memory index
+            with self._lock:
+                self._save_vectors_to_db(embedding_vectors, replace_all=True)
+                self.vectors = {ev.document_id: ev for ev in embedding_vectors}
+                self.index.build(list(self.vectors.keys()), self._index_rows([v.vector for v in self.vectors.values()]))
+                self._changes_since_reweight = 0
+                self.generation += 1
+                # Rows of another dimension are left out of the index, so follow its ids
+                self.metadata_index.build([self.vectors[doc_id].metadata for doc_id in self.index.ids])
             
             self.logger.info(f"Rebuilt vector index with {len(documents)} documents")
+            self._maybe_train_ann_in_background()
             return True
         
         except Exception as e:
@@ -377,33 +1108,50 @@ class VectorStore:
             return False
     
     def load_vectors(self) -> bool:
-        """Load vectors from database"""
+        """Load vectors from database in one query, decoding each group of rows with np.frombuffer"""
         try:
-            conn = sqlite3.connect(self.storage_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT * FROM embeddings")
-            rows = cursor.fetchall()
+            with self._db_lock:
+                rows = self._conn.execute('''
+                    SELECT document_id, vector, vector_indices, vector_format, metadata, 
+                           created_at, model_name, vector_dimension 
+                    FROM embeddings ORDER BY rowid
+                ''').fetchall()
             
+            # Group rows by storage format and dimension so each group decodes in bulk
+            groups: Dict[Tuple[str, int], List[tuple]] = {}
+            legacy_rows = 0
             for row in rows:
-                document_id, vector_blob, metadata_json, created_at, model_name, vector_dimension = row
-                
-                # Deserialize vector
-                vector = pickle.loads(vector_blob)
-                metadata = json.loads(metadata_json)
-                
-                embedding_vector = EmbeddingVector(
-                    document_id=document_id,
-                    vector=vector,
-                    metadata=metadata,
-                    created_at=datetime.fromisoformat(created_at),
-                    model_name=model_name,
-                    vector_dimension=vector_dimension
+                if row[3] not in VECTOR_FORMATS:
+                    legacy_rows += 1
+                    continue
+                groups.setdefault((row[3], row[7]), []).append(row)
+            
+            if legacy_rows:
+                self.logger.warning(
+                    f"Skipped {legacy_rows} embeddings in the old pickle format; rebuild the index to re-embed them"
                 )
-                
-                self.vectors[document_id] = embedding_vector
             
-            conn.close()
+            # The search index holds the largest group, as build() keeps the first dimension it sees
+            index_group = max(groups, key=lambda key: len(groups[key])) if groups else None
+            for (vector_format, dimension), group in groups.items():
+                matrix = self._decode_vectors(vector_format, dimension, group)
+                for i, (document_id, _, _, _, metadata_json, created_at, model_name, _) in enumerate(group):
+                    self.vectors[document_id] = EmbeddingVector(
+                        document_id=document_id,
+                        vector=matrix[i] if vector_format == 'dense' else matrix.getrow(i),
+                        metadata=json.loads(metadata_json),
+                        created_at=datetime.fromisoformat(created_at),
+                        model_name=model_name,
+                        vector_dimension=dimension
+                    )
+                if (vector_format, dimension) == index_group:
+                    if self.embedding_service.online_idf:
+                        self.embedding_service.fit_document_frequency(matrix)
+                        self._changes_since_reweight = 0
+                    self.index.build([row[0] for row in group], self._index_rows(matrix), retrain_ann=False)
+                    self.metadata_index.build([self.vectors[row[0]].metadata for row in group])
+            
+            self.generation += 1
             self.logger.info(f"Loaded {len(self.vectors)} vectors from database")
             return True
         
@@ -411,44 +1159,246 @@ class VectorStore:
             self.logger.error(f"Error loading vectors: {e}")
             return False
     
+    @staticmethod
+    def _decode_vectors(vector_format: str, 
+                        dimension: int, 
+                        rows: List[tuple]) -> Union[np.ndarray, sparse.csr_matrix]:
+        """Decode the vector blobs of rows sharing a format and dimension into one matrix"""
+        values = np.frombuffer(b"".join(row[1] for row in rows), dtype='<f4')
+        if vector_format == 'dense':
+            return values.reshape(len(rows), dimension)
+        
+        indices = np.frombuffer(b"".join(row[2] for row in rows), dtype='<i4')
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row[2]) // 4 for row in rows], out=indptr[1:])
+        return sparse.csr_matrix((values, indices, indptr), shape=(len(rows), dimension))
+    
+    @staticmethod
+    def _encode_vector(vector: Union[np.ndarray, sparse.spmatrix]) -> Tuple[bytes, Optional[bytes], str]:
+        """(values, indices, format) blobs for one vector; indices is None for dense vectors"""
+        if sparse.issparse(vector):
+            row = sparse.csr_matrix(vector, dtype=np.float32)
+            row.sort_indices()
+            return row.data.astype('<f4').tobytes(), row.indices.astype('<i4').tobytes(), 'csr'
+        return np.asarray(vector, dtype='<f4').tobytes(), None, 'dense'
+    
+    def _document_vectors(self, texts: List[str]) -> List[Union[np.ndarray, sparse.csr_matrix]]:
+        """Vectors stored for documents: embeddings, or raw term frequencies with online IDF"""
+        if self.embedding_service.online_idf:
+            term_frequencies = self.embedding_service.term_frequencies(texts)
+            return [term_frequencies[i] for i in range(term_frequencies.shape[0])]
+        if len(texts) == 1:
+            return [self.embedding_service.generate_embedding(texts[0])]
+        return self.embedding_service.generate_batch_embeddings(texts)
+    
+    def _index_rows(self, vectors: Union[List[Union[np.ndarray, sparse.spmatrix]], np.ndarray, sparse.spmatrix]):
+        """Stored vectors as searched: term frequencies are weighted by the installed IDF"""
+        if not self.embedding_service.online_idf:
+            return vectors
+        if isinstance(vectors, list):
+            if not vectors:
+                return vectors
+            vectors = sparse.vstack(vectors, format='csr')
+        return self.embedding_service.apply_idf(vectors)
+    
+    def _store_in_memory(self, embedding_vector: EmbeddingVector):
+        """Insert or replace an embedding in self.vectors, the indexes and the IDF statistics"""
+        previous = self.vectors.get(embedding_vector.document_id)
+        self.vectors[embedding_vector.document_id] = embedding_vector
+        self._index_vector(embedding_vector)
+        self.generation += 1
+        if self.embedding_service.online_idf:
+            if previous is not None:
+                self.embedding_service.update_document_frequency(previous.vector, sign=-1)
+            self.embedding_service.update_document_frequency(embedding_vector.vector)
+            self._changes_since_reweight += 1
+    
+    def reweight_index(self) -> bool:
+        """
+        Re-weight the indexed term frequencies with IDF recomputed from the current
+        document frequencies (hashing model); the matrix is built outside the lock
+        unless documents keep changing meanwhile
+        """
+        if not self.embedding_service.online_idf:
+            return False
+        try:
+            for _ in range(2):
+                with self._lock:
+                    changes = self._changes_since_reweight
+                    snapshot = self._reweight_snapshot()
+                rows = self._reweighted_rows(*snapshot)
+                with self._lock:
+                    if self._changes_since_reweight == changes:
+                        self._install_reweight(snapshot[0], rows, snapshot[2])
+                        return True
+            
+            # Still racing with writers: re-weight while holding the lock
+            with self._lock:
+                snapshot = self._reweight_snapshot()
+                self._install_reweight(snapshot[0], self._reweighted_rows(*snapshot), snapshot[2])
+                return True
+        
+        except Exception as e:
+            self.logger.error(f"Error re-weighting index: {e}")
+            return False
+    
+    def _reweight_snapshot(self) -> Tuple[List[str], List[sparse.spmatrix], np.ndarray]:
+        document_ids = list(self.index.ids)
+        term_frequencies = [self.vectors[doc_id].vector for doc_id in document_ids]
+        return document_ids, term_frequencies, self.embedding_service.compute_idf()
+    
+    def _reweighted_rows(self, 
+                         document_ids: List[str], 
+                         term_frequencies: List[sparse.spmatrix], 
+                         idf: np.ndarray) -> Optional[sparse.csr_matrix]:
+        if not document_ids:
+            return None
+        return self.embedding_service.apply_idf(sparse.vstack(term_frequencies, format='csr'), idf)
+    
+    def _install_reweight(self, document_ids: List[str], rows: Optional[sparse.csr_matrix], idf: np.ndarray):
+        self.embedding_service.set_idf(idf)
+        if rows is not None:
+            self.index.build(document_ids, rows, retrain_ann=False)
+        self._changes_since_reweight = 0
+        self.generation += 1
+        self.logger.info(f"Re-weighted {len(document_ids)} vectors with IDF version {self.embedding_service.idf_version}")
+    
+    def _maybe_reweight_in_background(self):
+        """Start a background re-weighting once reweight_interval documents changed since the last one"""
+        if self._changes_since_reweight < self.reweight_interval:
+            return
+        if self._reweight_thread is not None and self._reweight_thread.is_alive():
+            return
+        self._reweight_thread = threading.Thread(target=self.reweight_index, name="vector-store-reweight", daemon=True)
+        self._reweight_thread.start()
+    
+    def train_ann_index(self) -> bool:
+        """
+        (Re)train the IVF index when it is missing, stale or outgrown: k-means runs
+        on a copied sample outside the lock, only the row assignment holds it
+        """
+        if self.ann_index is None:
+            return False
+        try:
+            with self._lock:
+                if not self.ann_index.needs_training(len(self.index), self.index.dimension):
+                    return False
+                num_rows = len(self.index)
+                fingerprint = self._stored_vectorizer_fingerprint
+                sample = self.ann_index.training_sample(self.index.matrix)
+            centroids = self.ann_index.fit_centroids(sample, num_rows)
+            with self._lock:
+                refitted = fingerprint != self._stored_vectorizer_fingerprint
+                if not refitted and centroids.shape[1] == self.index.dimension:
+                    self.ann_index.fingerprint = fingerprint
+                    self.ann_index.install(centroids, self.index.matrix)
+                    return True
+            # A refit while k-means ran leaves these centroids in the old vocabulary; train on the new rows
+            return self.train_ann_index() if refitted else False
+        
+        except Exception as e:
+            self.logger.error(f"Error training IVF index: {e}")
+            return False
+    
+    def _maybe_train_ann_in_background(self):
+        """Start background IVF training after writes that leave the index untrained or outgrown"""
+        if self.ann_index is None or not self.ann_index.needs_training(len(self.index), self.index.dimension):
+            return
+        if self._ann_thread is not None and self._ann_thread.is_alive():
+            return
+        self._ann_thread = threading.Thread(target=self.train_ann_index, name="vector-store-ivf-train", daemon=True)
+        self._ann_thread.start()
+    
+    def _index_vector(self, embedding_vector: EmbeddingVector):
+        """Keep the search matrix in sync with self.vectors"""
+        vector = embedding_vector.vector
+        if self.embedding_service.online_idf:
+            vector = self.embedding_service.apply_idf(vector)
+        previous_row = self.index.row_of.get(embedding_vector.document_id)
+        if self.index.upsert(embedding_vector.document_id, vector):
+            self.metadata_index.set_row(self.index.row_of[embedding_vector.document_id], embedding_vector.metadata)
+        else:
+            # upsert swap-removed the stale row; mirror it so the bitmaps stay row-aligned
+            if previous_row is not None:
+                self.metadata_index.remove_row(previous_row)
+            self.logger.warning(
+                f"Embedding for {embedding_vector.document_id} has dimension {embedding_vector.vector_dimension}, "
+                f"index expects {self.index.dimension}; rebuild the index to make it searchable"
+            )
+    
+    def _make_embedding_vector(self, document: KnowledgeDocument, vector) -> EmbeddingVector:
+        """Wrap a document's vector with the metadata used for filtering"""
+        return EmbeddingVector(
+            document_id=document.id,
+            vector=vector,
+            metadata={
+                'document_type': document.document_type.value,
+                'skill_level': document.skill_level.value,
+                'tags': document.tags,
+                'title': document.title,
+                'confidence_score': document.confidence_score,
+                'fingerprint': document_fingerprint(document)
+            },
+            created_at=datetime.now(),
+            model_name=self.embedding_service.model_name,
+            vector_dimension=vector_dimension(vector)
+        )
+    
     def _save_vector_to_db(self, embedding_vector: EmbeddingVector):
         """Save embedding vector to database"""
         try:
-            conn = sqlite3.connect(self.storage_path)
-            cursor = conn.cursor()
-            
+            self._save_vectors_to_db([embedding_vector])
+        except Exception as e:
+            self.logger.error(f"Error saving vector to database: {e}")
+    
+    def _save_vectors_to_db(self, embedding_vectors: List[EmbeddingVector], replace_all: bool = False):
+        """Write embedding vectors with one executemany in a single transaction"""
+        rows = []
+        for embedding_vector in embedding_vectors:
             # Serialize vector and metadata
-            vector_blob = pickle.dumps(embedding_vector.vector)
-            metadata_json = json.dumps(embedding_vector.metadata)
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO embeddings 
-                (document_id, vector, metadata, created_at, model_name, vector_dimension)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
+            vector_blob, indices_blob, vector_format = self._encode_vector(embedding_vector.vector)
+            rows.append((
                 embedding_vector.document_id,
                 vector_blob,
-                metadata_json,
+                indices_blob,
+                vector_format,
+                json.dumps(embedding_vector.metadata),
                 embedding_vector.created_at.isoformat(),
                 embedding_vector.model_name,
                 embedding_vector.vector_dimension
             ))
-            
-            conn.commit()
-            conn.close()
         
-        except Exception as e:
-            self.logger.error(f"Error saving vector to database: {e}")
+        with self._db_lock, self._conn as conn:
+            if replace_all:
+                conn.execute("DELETE FROM embeddings")
+            conn.executemany('''
+                INSERT OR REPLACE INTO embeddings 
+                (document_id, vector, vector_indices, vector_format, metadata, created_at, model_name, vector_dimension)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            
+            # Record the vectorizer these vectors come from, in the same transaction
+            if self.embedding_service.fit_version != self._saved_fit_version or replace_all:
+                state = self.embedding_service.get_state()
+                if state is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO index_state (key, value) VALUES ('vectorizer', ?)",
+                        (json.dumps(state, sort_keys=True),)
+                    )
+                    self._stored_vectorizer_fingerprint = EmbeddingService.state_fingerprint(state)
+                    self._saved_fit_version = self.embedding_service.fit_version
     
     def _matches_filters(self, embedding_vector: EmbeddingVector, filters: Dict[str, Any]) -> bool:
-        """Check if embedding vector matches the provided filters"""
+        """Check if embedding vector matches the provided filters (reference for MetadataBitmaps)"""
         for key, value in filters.items():
             if key in embedding_vector.metadata:
-                if isinstance(value, list):
-                    if embedding_vector.metadata[key] not in value:
-                        return False
-                else:
-                    if embedding_vector.metadata[key] != value:
+                accepted = value if isinstance(value, list) else [value]
+                actual = embedding_vector.metadata[key]
+                # List-valued metadata (tags) matches when any element is accepted
+                if isinstance(actual, list):
+                    if not any(item in accepted for item in actual):
                         return False
+                elif actual not in accepted:
+                    return False
         return True
 
@@ -1,23 +1,217 @@
 from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+from collections import OrderedDict
 import torch
+import os
+import copy
+import hashlib
+import threading
 
 # Load model and tokenizer once at module level for efficiency
 MODEL_NAME = "SoelMgd/Poker_SmolLM"
 TOKENIZER_NAME = "HuggingFaceTB/SmolLM2-135M"
 
+# Inference backend, selected with POKER_MODEL_BACKEND:
+#   "torch" - full-precision PyTorch model (default)
+#   "int8"  - PyTorch model with dynamically quantized int8 Linear layers (CPU only)
+#   "onnx"  - ONNX export run through ONNX Runtime (see scripts/convert_poker_model.py)
+BACKENDS = ("torch", "int8", "onnx")
+MODEL_BACKEND = os.environ.get("POKER_MODEL_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = os.environ.get(
+    "POKER_ONNX_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "poker_smollm_onnx")
+)
+ONNX_FP32_FILE = "model.onnx"
+ONNX_QUANTIZED_FILE = "model_quantized.onnx"
+
+# Prefix KV cache for the PyTorch backends (torch / int8); opt-in with POKER_PREFIX_CACHE=1
+PREFIX_CACHE_ENABLED = os.environ.get("POKER_PREFIX_CACHE", "0") == "1"
+PREFIX_CACHE_SIZE = int(os.environ.get("POKER_PREFIX_CACHE_SIZE", "64"))
+PREFIX_BLOCK_TOKENS = 16
+
 device = 0 if torch.cuda.is_available() else -1
 
 tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
 tokenizer.pad_token = tokenizer.eos_token
-model = AutoModelForCausalLM.from_pretrained(MODEL_NAME)
-
-text_gen = pipeline(
-    "text-generation",
-    model=model,
-    tokenizer=tokenizer,
-    return_full_text=False,
-    device=device
-)
+
+
+def quantize_int8(model):
+    """Apply dynamic int8 quantization to the Linear layers of a PyTorch model."""
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_model(backend: str = MODEL_BACKEND, onnx_dir: str = None, onnx_file: str = None):
+    """
+    Load the causal LM for the requested inference backend.
+
+    Args:
+        backend (str): One of BACKENDS.
+        onnx_dir (str): ONNX export directory (defaults to ONNX_MODEL_DIR).
+        onnx_file (str): ONNX graph to load from onnx_dir (defaults to the int8 graph when present).
+
+    Returns:
+        A model usable by the transformers text-generation pipeline.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown POKER_MODEL_BACKEND '{backend}', expected one of {BACKENDS}")
+
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForCausalLM
+
+        onnx_dir = onnx_dir or ONNX_MODEL_DIR
+        if not os.path.isdir(onnx_dir):
+            raise FileNotFoundError(
+                f"No ONNX export found at {onnx_dir}. "
+                "Run scripts/convert_poker_model.py --backend onnx first."
+            )
+        if onnx_file is None:
+            # Prefer the int8 graph when the conversion script produced one
+            quantized = os.path.exists(os.path.join(onnx_dir, ONNX_QUANTIZED_FILE))
+            onnx_file = ONNX_QUANTIZED_FILE if quantized else ONNX_FP32_FILE
+        if not os.path.exists(os.path.join(onnx_dir, onnx_file)):
+            raise FileNotFoundError(f"No ONNX graph {onnx_file} in {onnx_dir}")
+        return ORTModelForCausalLM.from_pretrained(onnx_dir, file_name=onnx_file)
+
+    model = AutoModelForCausalLM.from_pretrained(MODEL_NAME)
+    if backend == "int8":
+        model = quantize_int8(model)
+    return model
+
+
+def build_text_generator(model, backend: str = MODEL_BACKEND):
+    """Wrap a loaded model in a greedy text-generation pipeline."""
+    # Quantized and ONNX Runtime models only run on CPU here
+    pipe_device = device if backend == "torch" else -1
+    return pipeline(
+        "text-generation",
+        model=model,
+        tokenizer=tokenizer,
+        return_full_text=False,
+        device=pipe_device
+    )
+
+
+class PrefixKVCache:
+    """
+    LRU cache of attention key/value states keyed by a hash of the prompt prefix.
+
+    Prefixes are hashed on fixed token-block boundaries, so a longer prompt that
+    shares a prefix with an earlier one (e.g. the same hand re-analyzed at a later
+    stop_turn) resumes generation from the longest cached block instead of
+    recomputing prefill over it.
+    """
+
+    def __init__(self, max_entries: int = PREFIX_CACHE_SIZE, block_tokens: int = PREFIX_BLOCK_TOKENS):
+        self.max_entries = max_entries
+        self.block_tokens = block_tokens
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    def _block_hashes(self, input_ids):
+        """Chained hashes of input_ids[:k * block_tokens] for every full block."""
+        # Keep at least one prompt token uncached so generate() has an input to feed
+        usable = (len(input_ids) - 1) // self.block_tokens
+        ids = input_ids.detach().to("cpu", torch.int64).numpy()
+        hasher = hashlib.sha1()
+        hashes = []
+        for block in range(usable):
+            hasher.update(ids[block * self.block_tokens:(block + 1) * self.block_tokens].tobytes())
+            hashes.append(hasher.hexdigest())
+        return hashes
+
+    def lookup(self, input_ids):
+        """Return (prefix_length, past_key_values) for the longest cached prefix, or (0, None)."""
+        hashes = self._block_hashes(input_ids)
+        with self._lock:
+            for n_blocks in range(len(hashes), 0, -1):
+                entry = self._entries.get(hashes[n_blocks - 1])
+                if entry is not None:
+                    self._entries.move_to_end(hashes[n_blocks - 1])
+                    self.hits += 1
+                    prefix_length = n_blocks * self.block_tokens
+                    self.reused_tokens += prefix_length
+                    # generate() extends the cache in place, so hand out a copy
+                    return prefix_length, copy.deepcopy(entry)
+            self.misses += 1
+        return 0, None
+
+    def store(self, input_ids, past_key_values):
+        """Cache the key/value states of the longest full-block prefix of input_ids."""
+        hashes = self._block_hashes(input_ids)
+        if not hashes or not hasattr(past_key_values, "crop"):
+            return
+        key = hashes[-1]
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+        # Negative crop drops the trailing prompt/generated tokens beyond the prefix
+        past_key_values.crop(len(hashes) * self.block_tokens - past_key_values.get_seq_length())
+        with self._lock:
+            self._entries[key] = past_key_values
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_statistics(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "reused_tokens": self.reused_tokens,
+            }
+
+
+model = load_model(MODEL_BACKEND)
+text_gen = build_text_generator(model, MODEL_BACKEND)
+prefix_cache = PrefixKVCache() if PREFIX_CACHE_ENABLED and MODEL_BACKEND != "onnx" else None
+
+
+def generate_from_prefix(lm, inputs: dict, cache: PrefixKVCache, max_new_tokens: int, pad_token_id: int):
+    """
+    Greedy generation that resumes from the longest prompt prefix in cache.
+
+    Args:
+        lm: PyTorch causal LM.
+        inputs (dict): Tokenizer output for a single prompt (input_ids, attention_mask).
+        cache (PrefixKVCache): Prefix cache to read from and update.
+        max_new_tokens (int): Maximum number of tokens to generate.
+        pad_token_id (int): Padding token id passed to generate().
+
+    Returns:
+        torch.Tensor: The generated token ids, without the prompt.
+    """
+    input_ids = inputs["input_ids"][0]
+    _, past_key_values = cache.lookup(input_ids)
+
+    generate_kwargs = {
+        "max_new_tokens": max_new_tokens,
+        "do_sample": False,
+        "return_dict_in_generate": True,
+        "pad_token_id": pad_token_id,
+    }
+    if past_key_values is not None:
+        generate_kwargs["past_key_values"] = past_key_values
+
+    with torch.no_grad():
+        output = lm.generate(**inputs, **generate_kwargs)
+
+    cache.store(input_ids, output.past_key_values)
+    return output.sequences[0, input_ids.shape[0]:]
+
+
+def _generate_with_prefix_cache(hand_text: str, max_new_tokens: int) -> str:
+    inputs = tokenizer(hand_text, return_tensors="pt").to(model.device)
+    new_tokens = generate_from_prefix(model, inputs, prefix_cache, max_new_tokens, tokenizer.eos_token_id)
+    return tokenizer.decode(new_tokens, skip_special_tokens=True)
+
 
 def analyze_hand(hand_text: str, max_new_tokens: int = 32) -> str:
     """
@@ -30,5 +224,7 @@ def analyze_hand(hand_text: str, max_new_tokens: int = 32) -> str:
     Returns:
         str: Model's natural-language interpretation.
     """
+    if prefix_cache is not None:
+        return _generate_with_prefix_cache(hand_text, max_new_tokens)
     result = text_gen(hand_text, max_new_tokens=max_new_tokens, do_sample=False)
     return result[0]["generated_text"] if result and "generated_text" in result[0] else ""
@@ -0,0 +1,324 @@
+import os
+import re
+import json
+import mmap
+import time
+import argparse
+import traceback
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+HAND_MARKER = b"Game started at:"
+
+# Order matters: the first key found in the line wins, as in format_dataset_to_struct
+MAPPING_ACTIONS = (("bets", "BET"), ("raises", "RAISE"), ("checks", "CHECK"), ("folds", "FOLD"),
+                   ("calls", "CALL"), ("allin", "ALLIN"), ("caps", "RAISE"))
+
+SUMMARY_KEYS = (' does', ' shows', ' mucks')
+
+
+def iter_raw_hands(path):
+    """
+    Yield the text of every hand in a raw Holdem Manager export.
+
+    The file is memory-mapped and split on "Game started at:" at the start of a
+    line, so large exports are never loaded into a Python string at once.
+    """
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = mm.find(HAND_MARKER)
+        while start != -1:
+            end = mm.find(b"\n" + HAND_MARKER, start + len(HAND_MARKER))
+            stop = len(mm) if end == -1 else end + 1
+            yield mm[start:stop].decode("utf-8", errors="replace").strip()
+            start = -1 if end == -1 else end + 1
+
+
+def parse_hand(hand_txt, player_name='IlxxxlI'):
+    """
+    Single-pass equivalent of format_dataset_to_struct.
+
+    Waiting players are dropped with one regex pass (instead of one pass per
+    player) and the hand is then parsed in one forward scan. Produces exactly the
+    same dict, and raises on the same malformed hands.
+    """
+    raw_lines = hand_txt.split("\n")
+    people_to_remove = []
+    if 'wait' in hand_txt:
+        people_to_remove = [line.split("Player ")[1].split(" wait")[0] for line in raw_lines if 'wait' in line]
+    hand_txt = [line for line in raw_lines
+                if 'wait' not in line and 'is timed out' not in line and 'mucks cards' not in line
+                and 'posts' not in line and 'straddle' not in line]
+    if people_to_remove:
+        removed_pattern = re.compile("|".join(re.escape(p) for p in people_to_remove))
+        hand_txt = [line for line in hand_txt if not removed_pattern.search(line)]
+    n = len(hand_txt)
+    hand = {}
+
+    header = hand_txt[1]
+    hand['date'] = hand_txt[0].split(": ")[1]
+    hand['game_id'] = header.split(": ")[1].split(" ")[0]
+    paren_parts = header.split("(")
+    hand['variant'] = paren_parts[1].split(")")[0]
+    hand['table_name'] = header.split(")")[1].split("(")[0].replace(" ", "")
+    hand['type_game'] = paren_parts[2].split(")")[0]
+
+    hand['button_seat'] = int(hand_txt[2].split("Seat ")[1].split(" ")[0])
+
+    hand['players'] = []
+    hand['players_seats'] = []
+    hand['starting_stacks'] = []
+    line = 3
+    while line < n:
+        text = hand_txt[line]
+        if text.split(" ")[0] != "Seat":
+            break
+        player = text.split(": ")[1].split(" (")[0]
+        if player not in people_to_remove:
+            hand['players'].append(player)
+            hand['players_seats'].append(int(text.split("Seat ")[1].split(":")[0]))
+            hand['starting_stacks'].append(float(text.split("(")[1].split(")")[0]))
+        line += 1
+
+    while line < n and "small blind" not in hand_txt[line]:
+        line += 1
+    text = hand_txt[line]
+    hand['player_small_blind'] = text.split("Player ")[1].split(" has")[0]
+    hand['small_blind'] = float(text.split("(")[1].split(")")[0])
+
+    while line < n and "big blind" not in hand_txt[line]:
+        line += 1
+    text = hand_txt[line]
+    hand['player_big_blind'] = text.split("Player ")[1].split(" has")[0]
+    hand['big_blind'] = float(text.split("(")[1].split(")")[0])
+
+    hand['player'] = player_name
+    hand['cards_player'] = []
+    while line < n:
+        if "[" in hand_txt[line]:
+            hand['cards_player'].append(hand_txt[line].split("[")[1].split("]")[0])
+        line += 1
+        if 'received' not in hand_txt[line]:
+            break
+
+    dealed_cards = {"flop": [], "turn": [], "river": []}
+    actions = {'pre-flop': {'players': [], 'actions': [], 'values': []},
+               'post-flop': {'players': [], 'actions': [], 'values': []},
+               'post-turn': {'players': [], 'actions': [], 'values': []},
+               'post-river': {'players': [], 'actions': [], 'values': []}}
+    street = actions['pre-flop']
+    while line < n:
+        text = hand_txt[line]
+        if "***" in text:
+            cards = text.split("[")[-1].split("]")[0].split(" ")
+            if "FLOP" in text:
+                dealed_cards['flop'] = cards
+                street = actions['post-flop']
+            elif "TURN" in text:
+                dealed_cards['turn'] = cards
+                street = actions['post-turn']
+            elif "RIVER" in text:
+                dealed_cards['river'] = cards
+                street = actions['post-river']
+        elif "Player" not in text:
+            break
+        else:
+            action = None
+            mapped = None
+            for action_, mapped_ in MAPPING_ACTIONS:
+                if action_ in text:
+                    action, mapped = action_, mapped_
+                    break
+            street['players'].append(text.split("Player ")[1].split(f" {action}")[0])
+            street['actions'].append(mapped)
+            street['values'].append(float(text.split("(")[1].split(")")[0]) if "(" in text else None)
+        line += 1
+
+    hand['dealed_cards'] = dealed_cards
+    hand['actions'] = actions
+
+    while line < n and "Summary" not in hand_txt[line]:
+        line += 1
+
+    finishing_stack = hand['starting_stacks'].copy()
+    seat_of = {player: i for i, player in reversed(list(enumerate(hand['players'])))}
+    hand['card_shown_by_players'] = []
+    while line < n:
+        text = hand_txt[line]
+        if 'Player' in text:
+            after_player = text.split("Player ")[1]
+            for keys in SUMMARY_KEYS:
+                if keys in text:
+                    player = after_player.split(keys)[0]
+                    break
+            else:
+                player = after_player.split(" ")[0]
+            bets = text.split("Bets: ")[1].split(" ")[0]
+            bets = float(bets[:-1] if bets[-1] == '.' else bets)
+            collects = text.split("Collects: ")[1].split(" ")[0]
+            collects = float(collects[:-1] if collects[-1] == '.' else collects)
+            hand['card_shown_by_players'].append(text.split("[")[1].split("]")[0] if '[' in text else None)
+
+            if player not in seat_of:
+                raise ValueError(f"{player!r} is not in list")
+            finishing_stack[seat_of[player]] -= bets
+            finishing_stack[seat_of[player]] += collects
+        line += 1
+
+    hand['finishing_stack'] = finishing_stack
+    return hand
+
+
+def _parse_batch(source, first_index, hands, player_name):
+    """Parse a batch of hands in a worker. Returns (structs, failures)."""
+    structs = []
+    failures = []
+    for offset, hand_txt in enumerate(hands):
+        try:
+            hand = parse_hand(hand_txt, player_name)
+            hand['source_file'] = source
+            hand['source_index'] = first_index + offset
+            structs.append(hand)
+        except Exception as e:
+            failures.append({
+                "source_file": source,
+                "source_index": first_index + offset,
+                "first_line": hand_txt.split("\n", 1)[0],
+                "error": f"{type(e).__name__}: {e}",
+                "traceback": traceback.format_exc(limit=2)
+            })
+    return structs, failures
+
+
+class ShardedJsonlWriter:
+    """Write dicts to structs-00000.jsonl, structs-00001.jsonl, ... with shard_size records each."""
+
+    def __init__(self, output_dir, shard_size=10000, prefix="structs"):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.prefix = prefix
+        self.shard_index = 0
+        self.count_in_shard = 0
+        self.shards = []
+        self._file = None
+        self._tmp_path = None
+
+    def _open_shard(self):
+        path = self.output_dir / f"{self.prefix}-{self.shard_index:05d}.jsonl"
+        self._tmp_path = path.with_suffix(".jsonl.tmp")
+        self._file = open(self._tmp_path, "w", encoding="utf-8")
+        self.shards.append(str(path))
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.close()
+            # Only completed shards get their final name
+            os.replace(self._tmp_path, self.shards[-1])
+            self._file = None
+            self.shard_index += 1
+            self.count_in_shard = 0
+
+    def write(self, record):
+        if self._file is None:
+            self._open_shard()
+        self._file.write(json.dumps(record))
+        self._file.write("\n")
+        self.count_in_shard += 1
+        if self.count_in_shard >= self.shard_size:
+            self._close_shard()
+
+    def close(self):
+        self._close_shard()
+
+
+def convert_exports(input_paths, output_dir, workers=None, batch_size=500, shard_size=10000, player_name='IlxxxlI'):
+    """
+    Convert raw exports to sharded JSONL structs with a process pool.
+
+    Per-hand parse failures are written to failures.jsonl instead of stopping the
+    run, and throughput figures are written to stats.json.
+    """
+    start = time.perf_counter()
+    writer = ShardedJsonlWriter(output_dir, shard_size=shard_size)
+    failures_path = Path(output_dir) / "failures.jsonl"
+    total_bytes = sum(os.path.getsize(p) for p in input_paths)
+    parsed = 0
+    failed = 0
+
+    def batches():
+        for path in input_paths:
+            source = os.path.basename(path)
+            batch = []
+            first_index = 0
+            for index, hand_txt in enumerate(iter_raw_hands(path)):
+                if not batch:
+                    first_index = index
+                batch.append(hand_txt)
+                if len(batch) >= batch_size:
+                    yield source, first_index, batch
+                    batch = []
+            if batch:
+                yield source, first_index, batch
+
+    with open(failures_path, "w", encoding="utf-8") as failures_file, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        max_pending = 2 * (workers or os.cpu_count() or 1)
+
+        def drain(block_until):
+            nonlocal parsed, failed
+            while len(pending) > block_until:
+                structs, failures = pending.pop(0).result()
+                for hand in structs:
+                    writer.write(hand)
+                for failure in failures:
+                    failures_file.write(json.dumps(failure) + "\n")
+                parsed += len(structs)
+                failed += len(failures)
+
+        for source, first_index, batch in batches():
+            pending.append(pool.submit(_parse_batch, source, first_index, batch, player_name))
+            # Bound in-flight batches so memory stays flat on huge exports
+            drain(max_pending)
+        drain(0)
+
+    writer.close()
+    elapsed = time.perf_counter() - start
+    stats = {
+        "input_files": len(input_paths),
+        "hands_parsed": parsed,
+        "hands_failed": failed,
+        "elapsed_s": elapsed,
+        "hands_per_s": (parsed + failed) / elapsed if elapsed else 0.0,
+        "mb_per_s": total_bytes / (1024 * 1024) / elapsed if elapsed else 0.0,
+        "shards": writer.shards,
+        "failures_file": str(failures_path)
+    }
+    with open(Path(output_dir) / "stats.json", "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
+
+if __name__ == "__main__":
+    PATH_DATA = Path(__file__).resolve().parents[2] / "data" / "raw" / "poker_dataset"
+    PATH_DATA_OUT = Path(__file__).resolve().parents[2] / "data" / "structured" / "poker_dataset_jsonl"
+
+    parser = argparse.ArgumentParser(description="Convert raw hand exports to sharded JSONL structs.")
+    parser.add_argument("inputs", nargs="*", help="Raw export files (default: every .txt in data/raw/poker_dataset)")
+    parser.add_argument("--output-dir", default=str(PATH_DATA_OUT))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=500, help="Hands per worker task")
+    parser.add_argument("--shard-size", type=int, default=10000, help="Hands per JSONL shard")
+    parser.add_argument("--player", default='IlxxxlI')
+    args = parser.parse_args()
+
+    inputs = args.inputs or sorted(str(p) for p in PATH_DATA.glob("*.txt"))
+    stats = convert_exports(inputs, args.output_dir, workers=args.workers, batch_size=args.batch_size,
+                            shard_size=args.shard_size, player_name=args.player)
+
+    print(f"Parsed {stats['hands_parsed']} hands ({stats['hands_failed']} failures) "
+          f"in {stats['elapsed_s']:.1f}s: {stats['hands_per_s']:.0f} hands/s, {stats['mb_per_s']:.1f} MB/s")
+    print(f"Shards: {len(stats['shards'])} in {args.output_dir}")
+    print(f"Failures: {stats['failures_file']}")
@@ -15,11 +15,7 @@ def struct_to_format_llm(hand, stop_turn=1):
     
     out_str = ""
     # [TABLE_CONFIGURATION]
-    table_config = f""" 
-[TABLE_CONFIGURATION]
-BTN={players_seat_to_ano[hand['button_seat']]}
-SB={players_names_to_ano[hand['player_small_blind']]} 0.5BB
-BB={players_names_to_ano[hand['player_big_blind']]} 1BB\n"""
+    table_config = compute_table_config(hand, players_names_to_ano, players_seat_to_ano)
     pot = 1.5*BB_amount
     turn = 0
     dealed_cards = []
@@ -38,6 +34,13 @@ BB={players_names_to_ano[hand['player_big_blind']]} 1BB\n"""
             return out_str, value_strt
     return out_str, None
     
+def compute_table_config(hand, players_names_to_ano, players_seat_to_ano):
+    return f""" 
+[TABLE_CONFIGURATION]
+BTN={players_seat_to_ano[hand['button_seat']]}
+SB={players_names_to_ano[hand['player_small_blind']]} 0.5BB
+BB={players_names_to_ano[hand['player_big_blind']]} 1BB\n"""
+
 def compute_stacks(hand, pot, stacks_player, BB_amount, players_names_to_ano, players_in_game):
     stacks_str = "\n[STACKS]\n"
     for i, player in enumerate(hand['players']):
@@ -52,7 +55,7 @@ def compute_stacks(hand, pot, stacks_player, BB_amount, players_names_to_ano, pl
     stacks_str += f"POT={pot_bb:.1f}BB\n"
     return stacks_str, pot
 
-def compute_actions(hand, street_actions, street, stacks_player, pot, players_names_to_ano, BB_amount, turn, stop_turn, deeled_cards, players_in_game):
+def compute_street_header(street, deeled_cards):
     actions_str = f"\n[{street}]"
     if deeled_cards:
         actions_str += "["
@@ -60,26 +63,34 @@ def compute_actions(hand, street_actions, street, stacks_player, pot, players_na
             actions_str += f" {card}"
         actions_str += "]"
     actions_str += "\n"
-    actions_str = actions_str.replace("[ ", "[")
+    return actions_str.replace("[ ", "[")
+
+def compute_value_str(value, BB_amount):
+    if value:
+        value_bb = int(value/BB_amount)
+        return f" {value_bb}BB\n"
+    return "\n"
+
+def apply_action(hand, player, action, value, stacks_player, pot, players_in_game):
+    """Update stacks / players in game for one action and return the new pot."""
+    if action in ["BET", "RAISE", "CALL"]:
+        stacks_player[hand['players'].index(player)] -= value
+        pot += value
+    elif action == 'ALLIN':
+        stacks_player[hand['players'].index(player)] = 0
+        pot += value
+    elif action == 'FOLD':
+        players_in_game.remove(player)
+    return pot
+
+def compute_actions(hand, street_actions, street, stacks_player, pot, players_names_to_ano, BB_amount, turn, stop_turn, deeled_cards, players_in_game):
+    actions_str = compute_street_header(street, deeled_cards)
     
     for i, player in enumerate(street_actions['players']):
         action = street_actions['actions'][i]
-        
         value = street_actions['values'][i]
-        value_str = ""
-        if value:
-            value_bb = int(value/BB_amount)
-            value_str += f" {value_bb}BB\n"
-        else:
-            value_str += "\n"
-        if action in ["BET", "RAISE", "CALL"]:
-            stacks_player[hand['players'].index(player)] -= value
-            pot += value
-        elif action == 'ALLIN':
-            stacks_player[hand['players'].index(player)] = 0
-            pot += value
-        elif action == 'FOLD':
-            players_in_game.remove(player)
+        value_str = compute_value_str(value, BB_amount)
+        pot = apply_action(hand, player, action, value, stacks_player, pot, players_in_game)
             
         if player == hand['player']:
             turn += 1
@@ -89,6 +100,49 @@ def compute_actions(hand, street_actions, street, stacks_player, pot, players_na
         actions_str += f"{players_names_to_ano[player]}: {action}{value_str}"
     return actions_str, stacks_player, pot, turn, None
 
+def iter_training_samples(hand):
+    """
+    Yield (context, truth) for every decision of hand['player'], in order.
+
+    Same pairs as struct_to_format_llm(hand, stop_turn) for stop_turn = 1..count_nb_turn(hand),
+    but the hand is walked once and every context is joined from one shared list
+    of parts, instead of rebuilding the whole string for each stop_turn.
+    """
+    nb_turn = count_nb_turn(hand)
+    if nb_turn == 0:
+        return
+    players_names_to_ano = {hand['players'][i]: f"P{i+1}" for i in range(len(hand['players']))}
+    players_seat_to_ano = {hand['players_seats'][i]: f"P{i+1}" for i in range(len(hand['players']))}
+    BB_amount = hand['big_blind']
+    stacks_player = hand['starting_stacks'].copy()
+    players_in_game = hand['players'].copy()
+
+    parts = [compute_table_config(hand, players_names_to_ano, players_seat_to_ano)]
+    pot = 1.5*BB_amount
+    dealed_cards = []
+    stacks_player[hand['players'].index(hand['player'])] -= 1*BB_amount
+    stacks_player[hand['players'].index(hand['player_small_blind'])] -= 0.5*BB_amount
+    for street_key, street_upercase, steet in zip(['pre-flop', 'post-flop', 'post-turn', 'post-river'], ['PREFLOP', 'FLOP', 'TURN', 'RIVER'], [None, 'flop', 'turn', 'river']):
+        stacks_str, pot = compute_stacks(hand, pot, stacks_player, BB_amount, players_names_to_ano, players_in_game)
+        parts.append(stacks_str)
+        dealed_cards += hand['dealed_cards'].get(steet, [])
+        parts.append(compute_street_header(street_upercase, dealed_cards))
+
+        street_actions = hand['actions'][street_key]
+        for i, player in enumerate(street_actions['players']):
+            action = street_actions['actions'][i]
+            value = street_actions['values'][i]
+            value_str = compute_value_str(value, BB_amount)
+            pot = apply_action(hand, player, action, value, stacks_player, pot, players_in_game)
+
+            parts.append(f"{players_names_to_ano[player]}: ")
+            if player == hand['player']:
+                yield "".join(parts), f"{action}{value_str}"
+                nb_turn -= 1
+                if nb_turn == 0:
+                    return
+            parts.append(f"{action}{value_str}")
+
 def count_nb_turn(hand):
     count = 0
     for street in hand['actions'].values():
@@ -113,10 +167,8 @@ if __name__ == "__main__":
         print(f"Processing {file}")
         with open(file, "r") as f:
             hand = json.load(f)
-        nb_turn = count_nb_turn(hand)
-        for i in range(1, nb_turn+1):
+        for i, (out_str, value_str) in enumerate(iter_training_samples(hand), 1):
             print(f"Processing turn {i}")
-            out_str, value_str = struct_to_format_llm(hand, i)
             out = {'context': out_str, 'truth': value_str}
             name = file.name.split(".")[0]
             with open(PATH_DATA_OUT / f'{name}_{i}.json', "w") as f:
@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import math
 
 class PositionalEmbedding(nn.Module):
@@ -14,11 +15,13 @@ class PositionalEmbedding(nn.Module):
         d_model: the embed dim (required).
         dropout: the dropout value (default=0.1).
         max_len: the max. length of the incoming sequence (default=5000).
+        batch_first: inputs are [batch size, sequence length, embed dim] (default=False).
     """
 
-    def __init__(self, d_model, dropout=0.1, max_len=5000):
+    def __init__(self, d_model, dropout=0.1, max_len=5000, batch_first=False):
         super(PositionalEmbedding, self).__init__()
         self.dropout = nn.Dropout(p=dropout)
+        self.batch_first = batch_first
 
         pe = torch.zeros(max_len, d_model)
         position = torch.arange(0, max_len, dtype=torch.float).unsqueeze(1)
@@ -28,15 +31,19 @@ class PositionalEmbedding(nn.Module):
         pe = pe.unsqueeze(0).transpose(0, 1)
         self.register_buffer('pe', pe)
 
-    def forward(self, x):
+    def forward(self, x, offset=0):
         """Inputs of forward function
         Args:
             x: the sequence fed to the positional encoder model (required).
+            offset: absolute position of the first element of x (default=0).
         Shape:
-            x: [sequence length, batch size, embed dim]
-            output: [sequence length, batch size, embed dim]
+            x: [sequence length, batch size, embed dim] ([batch size, sequence length, embed dim] if batch_first)
+            output: same shape as x
         """
-        x = x + self.pe[:x.size(0), :]
+        if self.batch_first:
+            x = x + self.pe[offset:offset + x.size(1), :].transpose(0, 1)
+        else:
+            x = x + self.pe[offset:offset + x.size(0), :]
         return self.dropout(x)
     
 class TransformerModel(nn.Transformer):
@@ -45,15 +52,19 @@ class TransformerModel(nn.Transformer):
                                                nhead=nhead,
                                                dim_feedforward=nhid,
                                                num_encoder_layers=nlayers,
-                                              dropout=dropout)
+                                              dropout=dropout,
+                                               batch_first=True)
         self.input_emb = nn.Embedding(ntoken, ninp)
-        self.pos_encoder = PositionalEmbedding(ninp, dropout)
+        self.pos_encoder = PositionalEmbedding(ninp, dropout, batch_first=True)
         # self.pos_encoder = LearnedPositionalEmbedding(ninp, dropout)
         self.decoder = nn.Linear(ninp, ntoken)
 
         self.ninp = ninp
+        self.nhead = nhead
         self.init_weights()
         self.device = device
+        # Causal masks keyed by device, rebuilt only when a longer sequence comes in
+        self._mask_cache = {}
 
     def init_weights(self):
         initrange = 0.1
@@ -64,12 +75,108 @@ class TransformerModel(nn.Transformer):
     def _generate_square_subsequent_mask(self, sz):
         return torch.log(torch.tril(torch.ones(sz,sz)))
 
+    def _causal_mask(self, sz, device):
+        # One mask per device, grown on demand; shorter lengths are views of its top-left corner
+        key = str(device)
+        mask = self._mask_cache.get(key)
+        if mask is None or mask.size(0) < sz:
+            mask = self._generate_square_subsequent_mask(sz).to(device)
+            self._mask_cache[key] = mask
+        return mask[:sz, :sz]
+
     def forward(self, src):
-        mask = self._generate_square_subsequent_mask(len(src)).to(self.device)
+        """src: [batch size, sequence length] token ids -> [batch size, sequence length, ntoken] logits"""
+        mask = self._causal_mask(src.size(1), self.device)
         self.src_mask = mask
 
         src = self.input_emb(src) * math.sqrt(self.ninp)
         src = self.pos_encoder(src)
         output_enc = self.encoder(src, mask=self.src_mask)
         output_dec = self.decoder(output_enc)
-        return output_dec
\ No newline at end of file
+        return output_dec
+
+    def _layer_step(self, layer, x, layer_state, offset):
+        """One encoder layer over the new positions x, attending to cached keys/values."""
+        def self_attention(h):
+            attn = layer.self_attn
+            q, k, v = F.linear(h, attn.in_proj_weight, attn.in_proj_bias).chunk(3, dim=-1)
+            if layer_state:
+                k = torch.cat([layer_state["k"], k], dim=1)
+                v = torch.cat([layer_state["v"], v], dim=1)
+            layer_state["k"], layer_state["v"] = k, v
+
+            batch_size, new_len, _ = q.shape
+            total_len = k.size(1)
+            head_dim = self.ninp // self.nhead
+            q = q.view(batch_size, new_len, self.nhead, head_dim).transpose(1, 2)
+            k = k.view(batch_size, total_len, self.nhead, head_dim).transpose(1, 2)
+            v = v.view(batch_size, total_len, self.nhead, head_dim).transpose(1, 2)
+            # Rows offset..offset+new_len of the cached causal mask
+            mask = None if new_len == 1 else self._causal_mask(total_len, h.device)[offset:offset + new_len, :total_len]
+            out = F.scaled_dot_product_attention(q, k, v, attn_mask=mask)
+            out = out.transpose(1, 2).reshape(batch_size, new_len, self.ninp)
+            return attn.out_proj(out)
+
+        def feed_forward(h):
+            return layer.linear2(layer.activation(layer.linear1(h)))
+
+        if layer.norm_first:
+            x = x + self_attention(layer.norm1(x))
+            x = x + feed_forward(layer.norm2(x))
+        else:
+            x = layer.norm1(x + self_attention(x))
+            x = layer.norm2(x + feed_forward(x))
+        return x
+
+    def incremental_forward(self, tokens, state):
+        """
+        Run only the new tokens through the encoder, reusing per-layer key/value state.
+
+        Args:
+            tokens: [batch size, new length] token ids following the positions already in state.
+            state: dict holding per-layer caches; pass {} for a fresh sequence. Updated in place.
+        Returns:
+            [batch size, new length, ntoken] logits (inference only; call in eval mode).
+        """
+        offset = state.get("length", 0)
+        layer_states = state.setdefault("layers", [{} for _ in self.encoder.layers])
+
+        x = self.pos_encoder(self.input_emb(tokens) * math.sqrt(self.ninp), offset=offset)
+        for layer, layer_state in zip(self.encoder.layers, layer_states):
+            x = self._layer_step(layer, x, layer_state, offset)
+        if self.encoder.norm is not None:
+            x = self.encoder.norm(x)
+
+        state["length"] = offset + tokens.size(1)
+        return self.decoder(x)
+
+    @torch.no_grad()
+    def generate(self, src, max_new_tokens, eos_token_id=None):
+        """
+        Greedy autoregressive decoding with incremental state: the prompt is encoded
+        once, then each step only processes the newly generated token.
+
+        Args:
+            src: [batch size, sequence length] prompt token ids.
+            max_new_tokens: maximum number of tokens to generate.
+            eos_token_id: stop once every sequence has produced this token.
+        Returns:
+            [batch size, generated length] token ids (empty when max_new_tokens <= 0).
+        """
+        if max_new_tokens <= 0:
+            return src[:, :0]
+        state = {}
+        logits = self.incremental_forward(src, state)
+        next_token = logits[:, -1, :].argmax(dim=-1, keepdim=True)
+        generated = [next_token]
+        finished = next_token.squeeze(1) == eos_token_id if eos_token_id is not None else None
+
+        for _ in range(max_new_tokens - 1):
+            if finished is not None and bool(finished.all()):
+                break
+            logits = self.incremental_forward(next_token, state)
+            next_token = logits[:, -1, :].argmax(dim=-1, keepdim=True)
+            generated.append(next_token)
+            if finished is not None:
+                finished |= next_token.squeeze(1) == eos_token_id
+        return torch.cat(generated, dim=1)
@@ -1,9 +1,11 @@
 import re
+import numpy as np
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, Sampler
 import json
 import os
 import random
+import functools
 
 
 long_vocab = ['[TABLE_CONFIGURATION]', '[PREFLOP]', '[STACKS]', '[RIVER]', '[FLOP]', 
@@ -20,6 +22,12 @@ short_vocab = ['[TABLE_CONFIGURATION]', '[PREFLOP]', '[STACKS]', '[RIVER]', '[FL
                 'POT', 'BTN', 'BET', 'BB', 'SB', 'P', 's', 'h', 'd', 'c', 'T', 'J', 'Q', 'K', 'A', '0', '1', 
                 '2', '3', '4', '5', '6', '7', '8', '9', '.']
 
+# Même position de [PAD] dans les deux vocabs
+DEFAULT_PAD_TOKEN_ID = long_vocab.index('[PAD]')
+assert short_vocab.index('[PAD]') == DEFAULT_PAD_TOKEN_ID
+
+_TERMINAL = ""  # Clé des noeuds du trie qui terminent un token (aucun caractère n'est vide)
+
 class PokerTokenizer:
     def __init__(self, vocab):
         self.vocab = vocab
@@ -27,19 +35,131 @@ class PokerTokenizer:
         self.id_to_token = {k: v for k, v in enumerate(self.vocab)}
         self.ntokens = len(self.vocab)
         self.pattern = re.compile(r"(" + "|".join(re.escape(token) for token in self.vocab) + r")")
+        self.pad_token_id = self.token_to_id.get("[PAD]", 0)
+        self.dtype = np.uint8 if self.ntokens <= np.iinfo(np.uint8).max + 1 else np.int32
+        self.trie = self._build_trie()
+        self.single_char_ids = {char: node[_TERMINAL] for char, node in self.trie.items()
+                                if list(node) == [_TERMINAL]}
+        self._id_to_token_array = np.array(self.vocab, dtype=object)
+
+    def _build_trie(self):
+        """Construit un trie caractère par caractère ; les feuilles portent l'ID du token."""
+        root = {}
+        for token, token_id in self.token_to_id.items():
+            node = root
+            for char in token:
+                node = node.setdefault(char, {})
+            node[_TERMINAL] = token_id
+        return root
+
+    def _encode_into(self, text, out):
+        """
+        Plus longue correspondance dans le trie, IDs écrits directement dans `out`.
+        Les caractères hors vocabulaire sont ignorés, comme avec la regex.
+        Retourne le nombre de tokens écrits.
+        """
+        root = self.trie
+        leaves = self.single_char_ids
+        n = len(text)
+        i = 0
+        k = 0
+        while i < n:
+            char = text[i]
+            # Chemin rapide : token d'un seul caractère qui n'en préfixe aucun autre
+            token_id = leaves.get(char)
+            if token_id is not None:
+                out[k] = token_id
+                k += 1
+                i += 1
+                continue
+            node = root.get(char)
+            if node is None:
+                i += 1
+                continue
+            j = i + 1
+            match_id = node.get(_TERMINAL, -1)
+            match_end = j
+            while j < n:
+                node = node.get(text[j])
+                if node is None:
+                    break
+                j += 1
+                token_id = node.get(_TERMINAL)
+                if token_id is not None:
+                    match_id = token_id
+                    match_end = j
+            if match_id < 0:
+                i += 1
+                continue
+            out[k] = match_id
+            k += 1
+            i = match_end
+        return k
 
     def pre_tokenization(self, text):
-        """Tokenize le texte en utilisant la regex basée sur les tokens du vocab."""
-        return self.pattern.findall(text)
+        """Tokenize le texte par plus longue correspondance dans le trie du vocab."""
+        return [self.id_to_token[x] for x in self.encode_array(text).tolist()]
+
+    def encode_array(self, text):
+        """Convertit une séquence de texte en tableau NumPy d'IDs."""
+        # Il y a au plus un token par caractère
+        out = np.empty(len(text), dtype=self.dtype)
+        return out[:self._encode_into(text, out)]
 
     def encode(self, text):
         """Convertit une séquence de texte en liste d'IDs."""
-        tokens = self.pre_tokenization(text)
-        return [self.token_to_id[token] for token in tokens if token in self.token_to_id]
+        return self.encode_array(text).tolist()
 
     def decode(self, token_list):
         """Convertit une liste d'IDs en texte."""
         return "".join([self.id_to_token[x] for x in token_list])
+
+    def batch_encode(self, texts, padding_side="right", max_length=None):
+        """
+        Encode plusieurs textes dans une matrice paddée avec [PAD].
+
+        Args:
+            texts (list[str]): Textes à encoder.
+            padding_side (str): 'right' ou 'left' (les contextes sont paddés à gauche).
+            max_length (int, optional): Tronque les séquences trop longues.
+
+        Returns:
+            (np.ndarray, np.ndarray): Matrice (batch, longueur) d'IDs et longueurs réelles.
+        """
+        if padding_side not in ("right", "left"):
+            raise ValueError("padding_side doit être 'right' ou 'left'")
+
+        buffer = np.empty(max((len(t) for t in texts), default=0), dtype=self.dtype)
+        lengths = np.empty(len(texts), dtype=np.int64)
+        encoded = []
+        for idx, text in enumerate(texts):
+            n = self._encode_into(text, buffer)
+            if max_length is not None:
+                n = min(n, max_length)
+            lengths[idx] = n
+            encoded.append(buffer[:n].copy())
+
+        width = int(lengths.max()) if len(texts) else 0
+        matrix = np.full((len(texts), width), self.pad_token_id, dtype=self.dtype)
+        for idx, ids in enumerate(encoded):
+            if padding_side == "right":
+                matrix[idx, :len(ids)] = ids
+            else:
+                matrix[idx, width - len(ids):] = ids
+        return matrix, lengths
+
+    def batch_decode(self, matrix, lengths=None, padding_side="right"):
+        """Inverse de batch_encode : retire le padding et reconvertit chaque ligne en texte."""
+        matrix = np.asarray(matrix)
+        if lengths is None:
+            lengths = (matrix != self.pad_token_id).sum(axis=1)
+        width = matrix.shape[1] if matrix.ndim == 2 else 0
+        texts = []
+        for row, n in zip(matrix, lengths):
+            n = int(n)
+            ids = row[:n] if padding_side == "right" else row[width - n:]
+            texts.append("".join(self._id_to_token_array[ids.astype(np.intp)]))
+        return texts
     
 class PokerDataset(Dataset):
     def __init__(self, data_dir, tokenizer, split='train', train_ratio=0.8, max_files=None, seed=42):
@@ -83,12 +203,198 @@ class PokerDataset(Dataset):
         context = data["context"]
         truth = data["truth"]
 
-        context_tokens = self.tokenizer.encode(context)
-        truth_tokens = self.tokenizer.encode(truth) + [self.tokenizer.token_to_id["[EOS]"]]  # Ajout de [EOS]
+        context_tokens = self.tokenizer.encode_array(context)
+        truth_tokens = np.append(self.tokenizer.encode_array(truth), self.tokenizer.token_to_id["[EOS]"])  # Ajout de [EOS]
+
+        return torch.from_numpy(context_tokens.astype(np.int64)), torch.from_numpy(truth_tokens.astype(np.int64))
+
+def corpus_dtype(tokenizer):
+    """Plus petit type entier non signé capable de stocker tous les IDs du vocab."""
+    return np.uint8 if tokenizer.ntokens <= np.iinfo(np.uint8).max + 1 else np.uint16
+
+def build_token_corpus(data_dir, tokenizer, output_prefix, max_files=None):
+    """
+    Pré-tokenize une seule fois tous les fichiers JSON {context, truth} du dossier.
+
+    Écrit trois fichiers :
+        <output_prefix>.bin       tous les IDs à la suite (contexte puis truth + [EOS])
+        <output_prefix>.idx.npy   offsets (N, 3) : début contexte, début truth, fin
+        <output_prefix>.json      métadonnées (vocab, dtype, nombre d'exemples)
+
+    Les fichiers sont pris dans l'ordre de os.listdir, comme PokerDataset, pour que
+    le même seed donne le même split train/test.
+    """
+    data_files = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.endswith(".json")]
+    if max_files:
+        data_files = data_files[:max_files]
+
+    dtype = corpus_dtype(tokenizer)
+    eos_id = tokenizer.token_to_id["[EOS]"]
+    offsets = np.empty((len(data_files), 3), dtype=np.int64)
+    position = 0
+
+    with open(f"{output_prefix}.bin", "wb") as fout:
+        for i, path in enumerate(data_files):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            context_tokens = tokenizer.encode_array(data["context"]).astype(dtype, copy=False)
+            truth_tokens = np.append(tokenizer.encode_array(data["truth"]), eos_id).astype(dtype)
+            offsets[i] = (position, position + len(context_tokens), position + len(context_tokens) + len(truth_tokens))
+            fout.write(context_tokens.tobytes())
+            fout.write(truth_tokens.tobytes())
+            position = offsets[i, 2]
+
+    np.save(f"{output_prefix}.idx.npy", offsets)
+    with open(f"{output_prefix}.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "vocab": tokenizer.vocab,
+            "dtype": np.dtype(dtype).name,
+            "num_samples": len(data_files),
+            "num_tokens": int(position)
+        }, f)
+    return len(data_files)
+
+class MemmapPokerDataset(Dataset):
+    def __init__(self, corpus_prefix, tokenizer, split='train', train_ratio=0.8, seed=42):
+        """
+        Dataset adossé au corpus pré-tokenizé de build_token_corpus.
+
+        __getitem__ découpe des vues dans un np.memmap : aucune lecture de fichier
+        ni tokenization par exemple, et les workers du DataLoader partagent les
+        pages du fichier via le cache du système.
+
+        Args:
+            corpus_prefix (str): Préfixe passé à build_token_corpus.
+            tokenizer (PokerTokenizer): Doit avoir le même vocab que lors de la construction.
+            split (str): 'train' ou 'test'.
+            train_ratio (float): Proportion d'exemples à utiliser pour l'entraînement.
+            seed (int): Graine pour le shuffle des exemples.
+        """
+        with open(f"{corpus_prefix}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["vocab"] != tokenizer.vocab:
+            raise ValueError("Le corpus a été construit avec un autre vocab que celui du tokenizer")
+
+        self.tokenizer = tokenizer
+        self.split = split
+        self.bin_path = f"{corpus_prefix}.bin"
+        self.dtype = np.dtype(meta["dtype"])
+        self.offsets = np.load(f"{corpus_prefix}.idx.npy")
+        self._tokens = None
+
+        # Même shuffle reproductible que PokerDataset, appliqué aux indices
+        indices = list(range(len(self.offsets)))
+        random.seed(seed)
+        random.shuffle(indices)
 
-        return torch.tensor(context_tokens, dtype=torch.long), torch.tensor(truth_tokens, dtype=torch.long)
+        split_idx = int(len(indices) * train_ratio)
+        if split == 'train':
+            self.indices = indices[:split_idx]
+        elif split == 'test':
+            self.indices = indices[split_idx:]
+        else:
+            raise ValueError("split doit être 'train' ou 'test'")
 
-def collate_fn(batch):
+    @property
+    def tokens(self):
+        # Ouvert paresseusement pour que chaque worker ait son propre mapping
+        if self._tokens is None:
+            if os.path.getsize(self.bin_path) == 0:
+                # Corpus vide : np.memmap refuse un fichier de 0 octet
+                self._tokens = np.zeros(0, dtype=self.dtype)
+            else:
+                self._tokens = np.memmap(self.bin_path, dtype=self.dtype, mode="r")
+        return self._tokens
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tokens"] = None
+        return state
+
+    def __len__(self):
+        return len(self.indices)
+
+    def lengths(self):
+        """Longueurs (contexte, truth) de chaque exemple du split, sans toucher au memmap."""
+        offsets = self.offsets[self.indices]
+        return offsets[:, 1] - offsets[:, 0], offsets[:, 2] - offsets[:, 1]
+
+    def __getitem__(self, idx):
+        """Retourne les séquences tokenizées découpées dans le memmap."""
+        context_start, truth_start, end = self.offsets[self.indices[idx]]
+        tokens = self.tokens
+        context_tokens = torch.from_numpy(tokens[context_start:truth_start].astype(np.int64))
+        truth_tokens = torch.from_numpy(tokens[truth_start:end].astype(np.int64))
+        return context_tokens, truth_tokens
+
+class BucketBatchSampler(Sampler):
+    def __init__(self, lengths, batch_size, shuffle=True, drop_last=False, bucket_batches=50, seed=42):
+        """
+        Regroupe les exemples de longueurs (contexte, truth) proches dans les mêmes batches
+        pour réduire le padding.
+
+        Les indices sont mélangés, découpés en pools de `bucket_batches` batches, triés par
+        longueur à l'intérieur de chaque pool, puis l'ordre des batches est re-mélangé.
+
+        Args:
+            lengths (tuple[np.ndarray, np.ndarray]): Longueurs des contextes et des truths.
+            batch_size (int): Taille des batches.
+            shuffle (bool): Mélange à chaque epoch (sinon tri global par longueur).
+            drop_last (bool): Ignore le dernier batch incomplet.
+            bucket_batches (int): Nombre de batches par pool trié.
+            seed (int): Graine de base ; l'epoch courante (set_epoch, comme DistributedSampler) s'y ajoute.
+        """
+        self.context_lengths = np.asarray(lengths[0])
+        self.truth_lengths = np.asarray(lengths[1])
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.bucket_batches = bucket_batches
+        self.seed = seed
+        self.epoch = 0
+
+    @classmethod
+    def from_dataset(cls, dataset, batch_size, **kwargs):
+        """Utilise dataset.lengths() si disponible (MemmapPokerDataset), sinon parcourt le dataset."""
+        if hasattr(dataset, "lengths"):
+            lengths = dataset.lengths()
+        else:
+            pairs = [(len(context), len(truth)) for context, truth in dataset]
+            lengths = (np.array([p[0] for p in pairs]), np.array([p[1] for p in pairs]))
+        return cls(lengths, batch_size, **kwargs)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _sort_by_length(self, indices):
+        order = np.lexsort((self.truth_lengths[indices], self.context_lengths[indices]))
+        return indices[order]
+
+    def __iter__(self):
+        n = len(self.context_lengths)
+        if self.shuffle:
+            rng = np.random.default_rng(self.seed + self.epoch)
+            indices = rng.permutation(n)
+            pool_size = self.batch_size * self.bucket_batches
+            indices = np.concatenate([self._sort_by_length(indices[i:i + pool_size])
+                                      for i in range(0, n, pool_size)]) if n else indices
+        else:
+            indices = self._sort_by_length(np.arange(n))
+
+        batches = [indices[i:i + self.batch_size] for i in range(0, n, self.batch_size)]
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        if self.shuffle:
+            rng.shuffle(batches)
+        for batch in batches:
+            yield batch.tolist()
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.context_lengths) // self.batch_size
+        return (len(self.context_lengths) + self.batch_size - 1) // self.batch_size
+
+def collate_fn(batch, pad_token_id=DEFAULT_PAD_TOKEN_ID):
     """
     Padding des contextes à gauche et des truths à droite pour créer des batches de taille uniforme.
     """
@@ -98,12 +404,26 @@ def collate_fn(batch):
     max_context_len = max(len(seq) for seq in context_batch)
     max_truth_len = max(len(seq) for seq in truth_batch)
 
-    pad_token_id = tokenizer.token_to_id["[PAD]"]
+    padded_contexts = torch.full((len(batch), max_context_len), pad_token_id, dtype=torch.long)
+    padded_truths = torch.full((len(batch), max_truth_len), pad_token_id, dtype=torch.long)
+    for i, (context, truth) in enumerate(zip(context_batch, truth_batch)):
+        # Padding à gauche pour les contextes
+        if len(context):
+            padded_contexts[i, -len(context):] = context
+        # Padding à droite pour les truths
+        padded_truths[i, :len(truth)] = truth
+
+    return padded_contexts, padded_truths
+
+def make_collate_fn(pad_token_id):
+    """collate_fn avec l'ID de [PAD] fixé explicitement (picklable pour les workers du DataLoader)."""
+    return functools.partial(collate_fn, pad_token_id=pad_token_id)
 
-    # Padding à gauche pour les contextes
-    padded_contexts = [torch.cat([torch.full((max_context_len - len(seq),), pad_token_id, dtype=torch.long), seq]) for seq in context_batch]
+if __name__ == "__main__":
+    from pathlib import Path
 
-    # Padding à droite pour les truths
-    padded_truths = [torch.cat([seq, torch.full((max_truth_len - len(seq),), pad_token_id, dtype=torch.long)]) for seq in truth_batch]
+    PATH_DATA = Path(__file__).resolve().parents[1] / "data" / "train" / "poker_dataset"
+    PATH_CORPUS = Path(__file__).resolve().parents[1] / "data" / "train" / "poker_corpus"
 
-    return torch.stack(padded_contexts), torch.stack(padded_truths)
\ No newline at end of file
+    n = build_token_corpus(PATH_DATA, PokerTokenizer(long_vocab), str(PATH_CORPUS))
+    print(f"Corpus pré-tokenizé : {n} exemples -> {PATH_CORPUS}.bin")
@@ -1,10 +1,55 @@
 import torch
 import tqdm
 
-def train(model, dataloader_train, dataloader_test, criterion, optimizer, scheduler, pad_token_id, num_epochs=10, device='cpu'):
+def teacher_forced_logits(model, context_batch, truth_batch):
+    """
+    Une seule passe causale sur contexte + truth[:-1].
+    La position C-1+t ne voit que le contexte et truth[:t], exactement comme
+    la boucle token par token.
+
+    Returns:
+        logits (batch, truth_len, vocab_size) prédisant chaque token de truth.
+    """
+    context_len = context_batch.size(1)
+    input_seq = torch.cat([context_batch, truth_batch[:, :-1]], dim=1)
+    output = model(input_seq)  # (batch, context_len + truth_len - 1, vocab_size)
+    return output[:, context_len - 1:, :]
+
+def teacher_forced_loss(criterion, logits, truth_batch):
+    """Même définition que la boucle : moyenne sur les positions du criterion appliqué à chaque position."""
+    max_truth_len = truth_batch.size(1)
+    loss = 0
+    for t in range(max_truth_len):
+        loss += criterion(logits[:, t, :], truth_batch[:, t])
+    return loss / max_truth_len
+
+def masked_accuracy_counts(logits, truth_batch, pad_token_id):
+    """(bonnes prédictions, tokens non-PAD) sur tout le truth en une fois."""
+    mask = truth_batch != pad_token_id  # On ignore les PAD
+    pred_tokens = logits.argmax(dim=-1)
+    correct = (pred_tokens == truth_batch).masked_select(mask).sum().item()
+    return correct, mask.sum().item()
+
+def step_by_step_logits(model, context_batch, truth_batch):
+    """Ancienne boucle : une passe complète par token de truth (O(T) passes)."""
+    input_seq = context_batch.clone()
+    outputs = []
+    for t in range(truth_batch.size(1)):
+        output = model(input_seq)  # (batch, seq_len, vocab_size)
+        outputs.append(output[:, -1, :])  # (batch, vocab_size)
+        # Teacher forcing
+        input_seq = torch.cat([input_seq, truth_batch[:, t].unsqueeze(1)], dim=1)
+    return torch.stack(outputs, dim=1)
+
+def train(model, dataloader_train, dataloader_test, criterion, optimizer, scheduler, pad_token_id, num_epochs=10, device='cpu', single_pass=True):
     model.train()
+    forward = teacher_forced_logits if single_pass else step_by_step_logits
 
     for epoch in range(num_epochs):
+        # Nouveau mélange à chaque epoch (BucketBatchSampler, DistributedSampler)
+        for sampler in (dataloader_train.batch_sampler, dataloader_train.sampler):
+            if hasattr(sampler, "set_epoch"):
+                sampler.set_epoch(epoch)
         total_loss = 0
         correct_train = 0
         total_tokens_train = 0
@@ -13,31 +58,14 @@ def train(model, dataloader_train, dataloader_test, criterion, optimizer, schedu
 
         for context_batch, truth_batch in pbar:
             context_batch, truth_batch = context_batch.to(device), truth_batch.to(device)
-            
-            optimizer.zero_grad()
-            batch_size, max_truth_len = truth_batch.shape
-            input_seq = context_batch.clone()
-            loss = 0
-            correct = 0
-            total_tokens = 0
-
-            for t in range(max_truth_len):
-                output = model(input_seq)  # (batch, seq_len, vocab_size)
-                output = output[:, -1, :]  # (batch, vocab_size)
 
-                target = truth_batch[:, t]  # (batch,)
-                loss += criterion(output, target)
-
-                # Calcul de l'accuracy
-                pred_token = output.argmax(dim=-1)  # (batch,)
-                mask = target != pad_token_id       # On ignore les PAD
-                correct += (pred_token == target).masked_select(mask).sum().item()
-                total_tokens += mask.sum().item()
+            optimizer.zero_grad()
+            logits = forward(model, context_batch, truth_batch)
+            loss = teacher_forced_loss(criterion, logits, truth_batch)
 
-                # Teacher forcing
-                input_seq = torch.cat([input_seq, target.unsqueeze(1)], dim=1)
+            # Calcul de l'accuracy
+            correct, total_tokens = masked_accuracy_counts(logits.detach(), truth_batch, pad_token_id)
 
-            loss /= max_truth_len
             loss.backward()
             optimizer.step()
             total_loss += loss.item()
@@ -57,20 +85,10 @@ def train(model, dataloader_train, dataloader_test, criterion, optimizer, schedu
         with torch.no_grad():
             for context_batch, truth_batch in tqdm.tqdm(dataloader_test, desc=f"Test Epoch {epoch+1}", leave=False):
                 context_batch, truth_batch = context_batch.to(device), truth_batch.to(device)
-                batch_size, max_truth_len = truth_batch.shape
-                input_seq = context_batch.clone()
-
-                for t in range(max_truth_len):
-                    output = model(input_seq)
-                    output = output[:, -1, :]
-                    target = truth_batch[:, t]
-
-                    pred_token = output.argmax(dim=-1)
-                    mask = target != pad_token_id
-                    correct_test += (pred_token == target).masked_select(mask).sum().item()
-                    total_tokens_test += mask.sum().item()
-
-                    input_seq = torch.cat([input_seq, target.unsqueeze(1)], dim=1)
+                logits = forward(model, context_batch, truth_batch)
+                correct, total_tokens = masked_accuracy_counts(logits, truth_batch, pad_token_id)
+                correct_test += correct
+                total_tokens_test += total_tokens
 
         scheduler.step()
         train_acc = 100 * correct_train / total_tokens_train if total_tokens_train > 0 else 0
@@ -78,4 +96,4 @@ def train(model, dataloader_train, dataloader_test, criterion, optimizer, schedu
         avg_loss = total_loss / len(dataloader_train)
 
         print(f"Epoch {epoch+1}/{num_epochs} | Loss: {avg_loss:.4f} | Train Acc: {train_acc:.2f}% | Test Acc: {test_acc:.2f}%")
-        model.train()  # Remettre en mode entraînement
\ No newline at end of file
+        model.train()  # Remettre en mode entraînement
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Notebooks and scripts import the package as `src` from the Poker_Transformers-main directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+RAW_EXPORT = os.path.join(os.path.dirname(__file__), "..", "data", "raw", "poker_dataset", "File196.txt")
@@ -0,0 +1,45 @@
+import itertools
+import json
+
+from src.data_processing.format_dataset_to_struct import format_dataset_to_struct
+from src.data_processing.raw_to_struct_pipeline import iter_raw_hands, parse_hand, convert_exports
+from src.data_processing.struct_to_format_llm import struct_to_format_llm, iter_training_samples, count_nb_turn
+
+from conftest import RAW_EXPORT
+
+def reference_struct(hand_txt):
+    try:
+        return format_dataset_to_struct(hand_txt)
+    except Exception as e:
+        return type(e)
+
+def test_parse_hand_matches_format_dataset_to_struct():
+    compared = 0
+    for hand_txt in itertools.islice(iter_raw_hands(RAW_EXPORT), 500):
+        expected = reference_struct(hand_txt)
+        if isinstance(expected, type):
+            try:
+                parse_hand(hand_txt)
+            except expected:
+                continue
+            raise AssertionError(f"parse_hand accepted a hand format_dataset_to_struct rejects: {hand_txt[:80]}")
+        assert parse_hand(hand_txt) == expected
+        compared += 1
+    assert compared > 400
+
+def test_convert_exports_writes_parsed_hands(tmp_path):
+    convert_exports([RAW_EXPORT], tmp_path, workers=1, batch_size=100, shard_size=1000)
+    shard = sorted(tmp_path.glob("structs-*.jsonl"))[0]
+    with open(shard, encoding="utf-8") as f:
+        first = json.loads(f.readline())
+    hand_txt = next(iter_raw_hands(RAW_EXPORT))
+    assert {k: v for k, v in first.items() if not k.startswith("source_")} == json.loads(json.dumps(parse_hand(hand_txt)))
+
+def test_training_samples_match_per_stop_turn_formatting():
+    for hand_txt in itertools.islice(iter_raw_hands(RAW_EXPORT), 100):
+        try:
+            hand = parse_hand(hand_txt)
+        except Exception:
+            continue
+        expected = [struct_to_format_llm(hand, stop_turn) for stop_turn in range(1, count_nb_turn(hand) + 1)]
+        assert list(iter_training_samples(hand)) == [tuple(sample) for sample in expected]
@@ -0,0 +1,133 @@
+import sys
+import types
+import importlib
+
+import pytest
+import torch
+import transformers
+
+def make_lm(vocab_size=64):
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=vocab_size, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=4, max_position_embeddings=256
+    )
+    return transformers.LlamaForCausalLM(config).eval()
+
+def stub_hub(monkeypatch):
+    """Serve a tiny random model in place of the Hub checkpoints model_handler loads at import."""
+    monkeypatch.setattr(transformers.AutoTokenizer, "from_pretrained",
+                        lambda name: types.SimpleNamespace(eos_token="</s>", eos_token_id=0))
+    monkeypatch.setattr(transformers.AutoModelForCausalLM, "from_pretrained", lambda name: make_lm())
+    # Resolving the lazy attribute swaps the module in sys.modules, which is what model_handler imports from
+    transformers.pipeline
+    monkeypatch.setattr(sys.modules["transformers"], "pipeline", lambda task, **kwargs: kwargs)
+    monkeypatch.delitem(sys.modules, "model_handler", raising=False)
+
+@pytest.fixture
+def model_handler(monkeypatch):
+    monkeypatch.setenv("POKER_MODEL_BACKEND", "torch")
+    stub_hub(monkeypatch)
+    yield importlib.import_module("model_handler")
+    sys.modules.pop("model_handler", None)
+
+def prompt(length, seed=1):
+    generator = torch.Generator().manual_seed(seed)
+    input_ids = torch.randint(1, 64, (1, length), generator=generator)
+    return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+def uncached_greedy(lm, inputs, max_new_tokens):
+    with torch.no_grad():
+        output = lm.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=0)
+    return output[0, inputs["input_ids"].shape[1]:]
+
+def test_prefix_cache_is_off_by_default(model_handler):
+    assert model_handler.prefix_cache is None
+
+def test_block_hashes_follow_shared_prefixes(model_handler):
+    cache = model_handler.PrefixKVCache(block_tokens=4)
+    ids = prompt(13)["input_ids"][0]
+    # The last prompt token is never cached
+    assert len(cache._block_hashes(ids[:9])) == 2
+    assert len(cache._block_hashes(ids[:8])) == 1
+    assert cache._block_hashes(ids[:9]) == cache._block_hashes(ids)[:2]
+    changed = ids.clone()
+    changed[5] += 1
+    assert cache._block_hashes(changed)[0] == cache._block_hashes(ids)[0]
+    assert cache._block_hashes(changed)[1:] != cache._block_hashes(ids)[1:]
+
+def test_store_crops_to_the_block_prefix_and_lookup_copies(model_handler):
+    lm = make_lm()
+    cache = model_handler.PrefixKVCache(block_tokens=4)
+    inputs = prompt(11)
+    assert cache.lookup(inputs["input_ids"][0]) == (0, None)
+
+    model_handler.generate_from_prefix(lm, inputs, cache, 5, pad_token_id=0)
+    assert cache.get_statistics()["entries"] == 1
+
+    longer = prompt(20)["input_ids"][0]
+    longer[:11] = inputs["input_ids"][0]
+    prefix_length, past_key_values = cache.lookup(longer)
+    assert prefix_length == 8
+    assert past_key_values.get_seq_length() == 8
+    # Mutating the handed-out copy leaves the cached entry alone
+    past_key_values.crop(4)
+    assert cache.lookup(longer)[1].get_seq_length() == 8
+    assert cache.get_statistics()["hits"] == 2
+
+def test_lru_eviction(model_handler):
+    lm = make_lm()
+    cache = model_handler.PrefixKVCache(max_entries=2, block_tokens=4)
+    prompts = [prompt(9, seed) for seed in (1, 2, 3)]
+    for inputs in prompts[:2]:
+        model_handler.generate_from_prefix(lm, inputs, cache, 2, pad_token_id=0)
+    cache.lookup(prompts[0]["input_ids"][0])
+    model_handler.generate_from_prefix(lm, prompts[2], cache, 2, pad_token_id=0)
+
+    assert cache.get_statistics()["entries"] == 2
+    assert cache.lookup(prompts[1]["input_ids"][0]) == (0, None)
+    assert cache.lookup(prompts[0]["input_ids"][0])[0] == 8
+
+def test_cached_generation_matches_uncached_greedy(model_handler):
+    lm = make_lm()
+    cache = model_handler.PrefixKVCache(block_tokens=4)
+    first = prompt(14)
+    later = prompt(23, seed=2)
+    later["input_ids"][0, :14] = first["input_ids"][0]
+
+    for inputs in (first, later, later):
+        expected = uncached_greedy(lm, inputs, 8)
+        actual = model_handler.generate_from_prefix(lm, inputs, cache, 8, pad_token_id=0)
+        assert torch.equal(actual, expected)
+    assert cache.get_statistics()["hits"] == 2
+
+def test_load_model_dispatches_on_backend(model_handler, monkeypatch, tmp_path):
+    assert isinstance(model_handler.load_model("torch"), transformers.LlamaForCausalLM)
+
+    quantized = model_handler.load_model("int8")
+    assert isinstance(quantized.model.layers[0].mlp.up_proj, torch.ao.nn.quantized.dynamic.Linear)
+
+    loaded = []
+    onnxruntime = types.ModuleType("optimum.onnxruntime")
+    onnxruntime.ORTModelForCausalLM = types.SimpleNamespace(
+        from_pretrained=lambda path, file_name: loaded.append((path, file_name)) or "ort model"
+    )
+    monkeypatch.setitem(sys.modules, "optimum", types.ModuleType("optimum"))
+    monkeypatch.setitem(sys.modules, "optimum.onnxruntime", onnxruntime)
+    (tmp_path / model_handler.ONNX_FP32_FILE).write_bytes(b"")
+    assert model_handler.load_model("onnx", onnx_dir=str(tmp_path)) == "ort model"
+    (tmp_path / model_handler.ONNX_QUANTIZED_FILE).write_bytes(b"")
+    model_handler.load_model("onnx", onnx_dir=str(tmp_path))
+    assert loaded == [(str(tmp_path), model_handler.ONNX_FP32_FILE), (str(tmp_path), model_handler.ONNX_QUANTIZED_FILE)]
+
+    with pytest.raises(FileNotFoundError):
+        model_handler.load_model("onnx", onnx_dir=str(tmp_path / "missing"))
+    with pytest.raises(ValueError):
+        model_handler.load_model("fp16")
+
+def test_invalid_backend_env_fails_at_import(monkeypatch):
+    monkeypatch.setenv("POKER_MODEL_BACKEND", "fp16")
+    stub_hub(monkeypatch)
+    with pytest.raises(ValueError, match="POKER_MODEL_BACKEND"):
+        importlib.import_module("model_handler")
+    sys.modules.pop("model_handler", None)
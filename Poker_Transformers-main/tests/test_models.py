@@ -0,0 +1,52 @@
+import torch
+
+from src.models import TransformerModel
+from src.trainer import teacher_forced_logits, step_by_step_logits
+
+def make_model(ntoken=40):
+    torch.manual_seed(0)
+    model = TransformerModel(ntoken=ntoken, ninp=32, nhead=4, nhid=64, nlayers=2, dropout=0.0)
+    return model.eval()
+
+def test_teacher_forced_pass_matches_step_by_step():
+    model = make_model()
+    context = torch.randint(0, 40, (3, 12))
+    truth = torch.randint(0, 40, (3, 5))
+    with torch.no_grad():
+        single_pass = teacher_forced_logits(model, context, truth)
+        stepped = step_by_step_logits(model, context, truth)
+    assert single_pass.shape == (3, 5, 40)
+    torch.testing.assert_close(single_pass, stepped, atol=1e-5, rtol=1e-4)
+
+def test_batch_first_forward_is_causal():
+    model = make_model()
+    tokens = torch.randint(0, 40, (2, 10))
+    with torch.no_grad():
+        full = model(tokens)
+        prefix = model(tokens[:, :6])
+    torch.testing.assert_close(full[:, :6], prefix, atol=1e-5, rtol=1e-4)
+
+def uncached_greedy(model, src, max_new_tokens):
+    sequence = src
+    for _ in range(max_new_tokens):
+        next_token = model(sequence)[:, -1, :].argmax(dim=-1, keepdim=True)
+        sequence = torch.cat([sequence, next_token], dim=1)
+    return sequence[:, src.size(1):]
+
+def test_incremental_forward_matches_full_forward():
+    model = make_model()
+    tokens = torch.randint(0, 40, (2, 14))
+    state = {}
+    with torch.no_grad():
+        pieces = [model.incremental_forward(tokens[:, :9], state)]
+        pieces += [model.incremental_forward(tokens[:, i:i + 1], state) for i in range(9, 14)]
+        full = model(tokens)
+    torch.testing.assert_close(torch.cat(pieces, dim=1), full, atol=1e-5, rtol=1e-4)
+
+def test_cached_generate_matches_uncached_greedy():
+    model = make_model()
+    src = torch.randint(0, 40, (3, 8))
+    with torch.no_grad():
+        expected = uncached_greedy(model, src, 6)
+    assert torch.equal(model.generate(src, 6), expected)
+    assert model.generate(src, 0).shape == (3, 0)
@@ -0,0 +1,101 @@
+import json
+import itertools
+
+import numpy as np
+import pytest
+import torch
+
+from src.tokenizer_data import (PokerTokenizer, PokerDataset, MemmapPokerDataset, BucketBatchSampler,
+                                build_token_corpus, long_vocab, short_vocab)
+from src.data_processing.raw_to_struct_pipeline import iter_raw_hands, parse_hand
+from src.data_processing.struct_to_format_llm import iter_training_samples
+
+from conftest import RAW_EXPORT
+
+def formatted_texts(limit=200):
+    texts = []
+    for hand_txt in itertools.islice(iter_raw_hands(RAW_EXPORT), 400):
+        try:
+            hand = parse_hand(hand_txt)
+        except Exception:
+            continue
+        texts.extend(context + truth for context, truth in iter_training_samples(hand))
+        if len(texts) >= limit:
+            break
+    return texts
+
+def regex_encode(tokenizer, text):
+    return [tokenizer.token_to_id[token] for token in tokenizer.pattern.findall(text)]
+
+@pytest.mark.parametrize("vocab", [long_vocab, short_vocab])
+def test_trie_encoding_matches_regex(vocab):
+    tokenizer = PokerTokenizer(vocab)
+    texts = formatted_texts() + ["[PREFLOP]\nP1: RAISE 2.5 BB", "Kh Qs ?! [RIVER] 10.25", ""]
+    for text in texts:
+        assert tokenizer.encode(text) == regex_encode(tokenizer, text)
+        assert tokenizer.pre_tokenization(text) == tokenizer.pattern.findall(text)
+
+@pytest.mark.parametrize("padding_side", ["right", "left"])
+def test_batch_encode_round_trip(padding_side):
+    tokenizer = PokerTokenizer(long_vocab)
+    texts = formatted_texts(20)
+    matrix, lengths = tokenizer.batch_encode(texts, padding_side=padding_side)
+    assert matrix.shape == (len(texts), max(lengths))
+    assert tokenizer.batch_decode(matrix, lengths, padding_side=padding_side) == [tokenizer.decode(tokenizer.encode(t)) for t in texts]
+    row = int(np.argmin(lengths))
+    padding = matrix[row, lengths[row]:] if padding_side == "right" else matrix[row, :matrix.shape[1] - lengths[row]]
+    assert (padding == tokenizer.pad_token_id).all()
+
+def test_bucket_sampler_epoch_comes_from_set_epoch():
+    lengths = (np.arange(100) % 17, np.arange(100) % 5)
+    sampler = BucketBatchSampler(lengths, batch_size=8, bucket_batches=2)
+    sampler.set_epoch(3)
+    first = list(sampler)
+    assert list(sampler) == first  # iterating does not advance the epoch
+    sampler.set_epoch(4)
+    assert list(sampler) != first
+    assert sorted(i for batch in first for i in batch) == list(range(100))
+
+def write_json_corpus(directory, count=40):
+    directory.mkdir()
+    samples = []
+    for hand_txt in itertools.islice(iter_raw_hands(RAW_EXPORT), 400):
+        try:
+            samples.extend(iter_training_samples(parse_hand(hand_txt)))
+        except Exception:
+            continue
+        if len(samples) >= count:
+            break
+    for i, (context, truth) in enumerate(samples[:count]):
+        (directory / f"sample_{i}.json").write_text(json.dumps({"context": context, "truth": truth}), encoding="utf-8")
+    return directory
+
+@pytest.mark.parametrize("split", ["train", "test"])
+def test_memmap_dataset_matches_poker_dataset(tmp_path, split):
+    tokenizer = PokerTokenizer(long_vocab)
+    data_dir = write_json_corpus(tmp_path / "json")
+    prefix = str(tmp_path / "corpus")
+    assert build_token_corpus(str(data_dir), tokenizer, prefix) == 40
+
+    reference = PokerDataset(str(data_dir), tokenizer, split=split, seed=7)
+    memmap = MemmapPokerDataset(prefix, tokenizer, split=split, seed=7)
+    assert len(memmap) == len(reference) > 0
+    for i in range(len(reference)):
+        for expected, actual in zip(reference[i], memmap[i]):
+            assert actual.dtype == expected.dtype
+            assert torch.equal(actual, expected)
+
+    context_lengths, truth_lengths = memmap.lengths()
+    assert context_lengths.tolist() == [len(reference[i][0]) for i in range(len(reference))]
+    assert truth_lengths.tolist() == [len(reference[i][1]) for i in range(len(reference))]
+
+def test_memmap_dataset_over_an_empty_corpus(tmp_path):
+    tokenizer = PokerTokenizer(long_vocab)
+    (tmp_path / "json").mkdir()
+    prefix = str(tmp_path / "corpus")
+    assert build_token_corpus(str(tmp_path / "json"), tokenizer, prefix) == 0
+
+    dataset = MemmapPokerDataset(prefix, tokenizer)
+    assert len(dataset) == 0
+    assert [len(lengths) for lengths in dataset.lengths()] == [0, 0]
+    assert len(dataset.tokens) == 0
@@ -1,54 +1,164 @@
 import os
 import csv
+import sqlite3
+import hashlib
+import argparse
 import traceback
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# Import analyze_hand from the Poker Transformer handler
+# Import analyze_hand from the Poker Transformer handler (inside each worker, see _init_worker)
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../Poker_Transformers-main")))
-from model_handler import analyze_hand
 
 INPUT_DIR = "Poker_Transformers-main/data/raw"
 OUTPUT_DIR = "logs/model_outputs"
 LOG_FILE = "logs/execution_log.csv"
+MANIFEST_FILE = "logs/batch_manifest.db"
+LOG_HEADER = ["timestamp", "agent", "input_file", "task", "status", "error_message"]
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs("logs", exist_ok=True)
 
+# One model instance per process, loaded lazily so the parent never holds a copy
+_analyze_hand = None
+
+def _init_worker():
+    global _analyze_hand
+    from model_handler import analyze_hand
+    _analyze_hand = analyze_hand
+
+class Manifest:
+    """SQLite checkpoint of the input hash and status of every processed file, keyed by resolved input path."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                input_file TEXT PRIMARY KEY,
+                input_hash TEXT,
+                status TEXT,
+                output_file TEXT,
+                error_message TEXT,
+                updated_at TEXT
+            )
+        ''')
+        self.conn.commit()
+
+    def completed(self):
+        """Map of input path -> input_hash for files that finished successfully."""
+        rows = self.conn.execute("SELECT input_file, input_hash FROM files WHERE status = 'success'")
+        return dict(rows.fetchall())
+
+    def record(self, input_file, input_hash, status, output_file, error_message, updated_at):
+        self.conn.execute('''
+            INSERT OR REPLACE INTO files
+            (input_file, input_hash, status, output_file, error_message, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (input_file, input_hash, status, output_file, error_message, updated_at))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_atomic(path, text):
+    """Write to a temp file next to the target and rename it into place."""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as fout:
+        fout.write(text)
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(tmp_path, path)
+
+def output_path_for(input_path):
+    """Output file for a manifest key; the path hash keeps same-named inputs from different directories apart."""
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    path_hash = hashlib.sha256(input_path.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(OUTPUT_DIR, f"{stem}_{path_hash}_output.txt")
+
+def process_file(input_path, fname):
+    """Run inference on one file. Returns (fname, status, error_message, timestamp)."""
+    timestamp = datetime.now().isoformat()
+    try:
+        with open(input_path, "r", encoding="utf-8") as fin:
+            hand_text = fin.read()
+        result = _analyze_hand(hand_text)
+        write_atomic(output_path_for(input_path), result)
+        return fname, "success", "", timestamp
+    except Exception:
+        return fname, "error", traceback.format_exc(), timestamp
+
 def main():
-    files = [f for f in os.listdir(INPUT_DIR) if f.endswith(".txt")]
+    parser = argparse.ArgumentParser(description="Resumable batch inference over raw hand files.")
+    parser.add_argument("--input-dir", default=INPUT_DIR)
+    parser.add_argument("--workers", type=int, default=1, help="Processes, each holding one model instance")
+    parser.add_argument("--force", action="store_true", help="Reprocess files already completed")
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(args.input_dir) if f.endswith(".txt"))
+    manifest = Manifest(MANIFEST_FILE)
+    done = {} if args.force else manifest.completed()
+
+    # Same file names in another input directory are different inputs
+    input_paths = {fname: os.path.realpath(os.path.join(args.input_dir, fname)) for fname in files}
+    hashes = {fname: file_hash(input_paths[fname]) for fname in files}
+    pending = [
+        fname for fname in files
+        if done.get(input_paths[fname]) != hashes[fname] or not os.path.exists(output_path_for(input_paths[fname]))
+    ]
+
     total = len(files)
+    skipped = total - len(pending)
     success = 0
     failed = 0
     failures = []
 
-    with open(LOG_FILE, "w", newline='', encoding="utf-8") as log_csv:
+    log_exists = os.path.exists(LOG_FILE)
+    with open(LOG_FILE, "a", newline='', encoding="utf-8") as log_csv:
         writer = csv.writer(log_csv)
-        writer.writerow(["timestamp", "agent", "input_file", "task", "status", "error_message"])
-
-        for fname in files:
-            input_path = os.path.join(INPUT_DIR, fname)
-            output_path = os.path.join(OUTPUT_DIR, f"{os.path.splitext(fname)[0]}_output.txt")
-            timestamp = datetime.now().isoformat()
-            try:
-                with open(input_path, "r", encoding="utf-8") as fin:
-                    hand_text = fin.read()
-                result = analyze_hand(hand_text)
-                with open(output_path, "w", encoding="utf-8") as fout:
-                    fout.write(result)
-                writer.writerow([timestamp, "analyze_hand", fname, "model inference", "success", ""])
+        if not log_exists:
+            writer.writerow(LOG_HEADER)
+
+        def record(fname, status, error_msg, timestamp):
+            nonlocal success, failed
+            writer.writerow([timestamp, "analyze_hand", fname, "model inference", status, error_msg])
+            log_csv.flush()
+            output_path = output_path_for(input_paths[fname]) if status == "success" else ""
+            manifest.record(input_paths[fname], hashes[fname], status, output_path, error_msg, timestamp)
+            if status == "success":
                 success += 1
-            except Exception as e:
-                error_msg = traceback.format_exc()
-                writer.writerow([timestamp, "analyze_hand", fname, "model inference", "error", error_msg])
+            else:
                 failed += 1
-                failures.append((fname, str(e)))
+                failures.append((fname, error_msg.strip().splitlines()[-1] if error_msg else ""))
+
+        if args.workers <= 1:
+            if pending:
+                _init_worker()
+            for fname in pending:
+                record(*process_file(input_paths[fname], fname))
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+                futures = [pool.submit(process_file, input_paths[fname], fname) for fname in pending]
+                for future in as_completed(futures):
+                    record(*future.result())
+
+    manifest.close()
 
     # Print summary
     print(f"✅ Hands processed: {total}")
+    print(f"   Skipped (already done): {skipped}")
     print(f"   Succeeded: {success}")
     print(f"   Failed: {failed}")
     print(f"📄 Log file: {LOG_FILE}")
+    print(f"📄 Manifest: {MANIFEST_FILE}")
     if failed:
         print("⚠️ Failures:")
         for fname, err in failures:
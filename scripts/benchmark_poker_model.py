@@ -0,0 +1,226 @@
+import os
+import re
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+import subprocess
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../Poker_Transformers-main")))
+from src.data_processing.raw_to_struct_pipeline import iter_raw_hands, parse_hand
+from src.data_processing.struct_to_format_llm import iter_training_samples
+
+# Held out from training: the last raw export, first NUM_SAMPLES decision points
+HELDOUT_FILE = "Poker_Transformers-main/data/raw/poker_dataset/File204.txt"
+RESULTS_DIR = "logs/benchmarks"
+NUM_SAMPLES = 200
+MAX_NEW_TOKENS = 8
+MODELS = ("analyze_hand", "transformer")
+
+ACTION_PATTERN = re.compile(r"\b(FOLD|CHECK|CALL|BET|RAISE|ALLIN)\b")
+
+os.makedirs(RESULTS_DIR, exist_ok=True)
+
+def load_heldout_samples(path, limit):
+    """Fixed list of {"context", "truth"} decision points from a raw export."""
+    samples = []
+    for hand_txt in iter_raw_hands(path):
+        try:
+            hand = parse_hand(hand_txt)
+            for context, truth in iter_training_samples(hand):
+                samples.append({"context": context, "truth": truth})
+        except Exception:
+            continue
+        if len(samples) >= limit:
+            break
+    return samples[:limit]
+
+def first_action(text):
+    match = ACTION_PATTERN.search(text or "")
+    return match.group(1) if match else None
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+def summarize(name, load_time, latencies, generated_tokens, action_hits, exact_hits, extra=None):
+    n = len(latencies)
+    total_time = sum(latencies)
+    result = {
+        "model": name,
+        "samples": n,
+        "action_accuracy": action_hits / n if n else 0.0,
+        "exact_match": exact_hits / n if n else 0.0,
+        "tokens_per_s": generated_tokens / total_time if total_time else 0.0,
+        "latency_p50_s": float(np.percentile(latencies, 50)) if n else 0.0,
+        "latency_p95_s": float(np.percentile(latencies, 95)) if n else 0.0,
+        "load_time_s": load_time,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    result.update(extra or {})
+    return result
+
+def bench_analyze_hand(samples, max_new_tokens, prefix_cache):
+    """Poker_SmolLM through model_handler.analyze_hand (backend from POKER_MODEL_BACKEND)."""
+    # Set explicitly in the spawned process, so a warm prefix cache never leaks in from the caller's environment
+    os.environ["POKER_PREFIX_CACHE"] = "1" if prefix_cache else "0"
+    start = time.perf_counter()
+    import model_handler
+    load_time = time.perf_counter() - start
+
+    latencies = []
+    generated_tokens = 0
+    action_hits = 0
+    exact_hits = 0
+    for sample in samples:
+        t0 = time.perf_counter()
+        prediction = model_handler.analyze_hand(sample["context"], max_new_tokens=max_new_tokens)
+        latencies.append(time.perf_counter() - t0)
+        generated_tokens += len(model_handler.tokenizer(prediction, add_special_tokens=False)["input_ids"])
+        action_hits += int(first_action(prediction) == first_action(sample["truth"]))
+        exact_hits += int(prediction.strip() == sample["truth"].strip())
+
+    extra = {"backend": model_handler.MODEL_BACKEND, "prefix_cache": model_handler.prefix_cache is not None}
+    if model_handler.prefix_cache is not None:
+        extra["prefix_cache_stats"] = model_handler.prefix_cache.get_statistics()
+    return summarize("analyze_hand", load_time, latencies, generated_tokens, action_hits, exact_hits, extra)
+
+def bench_transformer(samples, max_new_tokens, checkpoint, vocab, ninp, nhead, nhid, nlayers):
+    """From-scratch TransformerModel with greedy incremental generate()."""
+    import torch
+    from src.models import TransformerModel
+    from src.tokenizer_data import PokerTokenizer, short_vocab, long_vocab
+
+    torch.set_grad_enabled(False)
+    tokenizer = PokerTokenizer(short_vocab if vocab == "short" else long_vocab)
+    eos_token_id = tokenizer.token_to_id["[EOS]"]
+
+    torch.manual_seed(0)  # Reproducible random weights when no checkpoint is given
+    start = time.perf_counter()
+    model = TransformerModel(ntoken=tokenizer.ntokens, ninp=ninp, nhead=nhead, nhid=nhid, nlayers=nlayers)
+    if checkpoint:
+        state = torch.load(checkpoint, map_location="cpu")
+        model.load_state_dict(state.get("model_state_dict", state) if isinstance(state, dict) else state)
+    model.eval()
+    load_time = time.perf_counter() - start
+
+    latencies = []
+    generated_tokens = 0
+    action_hits = 0
+    exact_hits = 0
+    for sample in samples:
+        src = torch.from_numpy(tokenizer.encode_array(sample["context"]).astype(np.int64)).unsqueeze(0)
+        truth_ids = tokenizer.encode(sample["truth"])
+        t0 = time.perf_counter()
+        output = model.generate(src, max_new_tokens, eos_token_id=eos_token_id)[0].tolist()
+        latencies.append(time.perf_counter() - t0)
+        generated_tokens += len(output)
+        predicted_ids = output[:output.index(eos_token_id)] if eos_token_id in output else output
+        action_hits += int(bool(predicted_ids) and bool(truth_ids) and predicted_ids[0] == truth_ids[0])
+        exact_hits += int(predicted_ids == truth_ids)
+
+    result = summarize("transformer", load_time, latencies, generated_tokens, action_hits, exact_hits,
+                       {"checkpoint": checkpoint, "random_weights": checkpoint is None,
+                        "latency_only": checkpoint is None, "vocab": vocab})
+    if checkpoint is None:
+        # Random weights: only the timing and memory figures mean anything
+        result["action_accuracy"] = None
+        result["exact_match"] = None
+    return result
+
+def run_isolated(fn, *args):
+    """Run one benchmark in a fresh process so load time and peak RSS are per model."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["model"]: r for r in json.load(f)["results"]}
+    print(f"📊 Compared with {baseline_path}:")
+    for result in results:
+        base = baseline.get(result["model"])
+        if base is None:
+            continue
+        for key in ("backend", "prefix_cache"):
+            if base.get(key) != result.get(key):
+                print(f"   ⚠️ {result['model']} {key} differs: {base.get(key)} -> {result.get(key)}")
+        for key in ("action_accuracy", "tokens_per_s", "latency_p50_s", "latency_p95_s", "peak_rss_mb", "load_time_s"):
+            if base.get(key) is None or result.get(key) is None:
+                continue  # Latency-only runs have no accuracy to compare
+            print(f"   {result['model']} {key}: {base[key]:.4f} -> {result[key]:.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark accuracy and latency of the poker models on a fixed held-out set.")
+    parser.add_argument("--models", nargs="+", choices=MODELS, default=list(MODELS))
+    parser.add_argument("--heldout-file", default=HELDOUT_FILE)
+    parser.add_argument("--num-samples", type=int, default=NUM_SAMPLES)
+    parser.add_argument("--max-new-tokens", type=int, default=MAX_NEW_TOKENS)
+    parser.add_argument("--checkpoint", default=None,
+                        help="TransformerModel state_dict (without it the transformer run is latency-only, random weights)")
+    parser.add_argument("--vocab", choices=["short", "long"], default="short")
+    parser.add_argument("--ninp", type=int, default=768)
+    parser.add_argument("--nhead", type=int, default=8)
+    parser.add_argument("--nhid", type=int, default=3072)
+    parser.add_argument("--nlayers", type=int, default=15)
+    parser.add_argument("--prefix-cache", action="store_true",
+                        help="Run analyze_hand with POKER_PREFIX_CACHE=1 (off by default so latencies compare across runs)")
+    parser.add_argument("--output", default=None, help="Results JSON (default: logs/benchmarks/<commit>_<time>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    samples = load_heldout_samples(args.heldout_file, args.num_samples)
+    results = []
+    for name in args.models:
+        print(f"⏱️ Benchmarking {name} on {len(samples)} samples...")
+        if name == "analyze_hand":
+            results.append(run_isolated(bench_analyze_hand, samples, args.max_new_tokens, args.prefix_cache))
+        else:
+            results.append(run_isolated(bench_transformer, samples, args.max_new_tokens, args.checkpoint,
+                                        args.vocab, args.ninp, args.nhead, args.nhid, args.nlayers))
+
+    commit = git_commit()
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "heldout_file": args.heldout_file,
+        "num_samples": len(samples),
+        "max_new_tokens": args.max_new_tokens,
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'nocommit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        if result.get("latency_only"):
+            print(f"✅ {result['model']} (random weights, latency only)")
+        else:
+            print(f"✅ {result['model']}")
+            print(f"   Action accuracy: {result['action_accuracy']:.1%} (exact: {result['exact_match']:.1%})")
+        print(f"   Tokens/sec: {result['tokens_per_s']:.1f}")
+        print(f"   Latency p50/p95: {result['latency_p50_s'] * 1000:.1f} / {result['latency_p95_s'] * 1000:.1f} ms")
+        print(f"   Peak RSS: {result['peak_rss_mb']:.0f} MB, load time: {result['load_time_s']:.2f}s")
+    print(f"📄 Results: {output}")
+    if args.baseline:
+        print_comparison(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Agentic_Rag.rag.vector_store import VectorStore, EmbeddingMatrix, SparseEmbeddingMatrix
+from Agentic_Rag.rag.ann_index import IVFIndex
+
+REPORT_PATH = "logs/vector_index_report.json"
+NPROBES = [1, 2, 4, 8, 16, 32]
+
+os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+
+def synthetic_vectors(num_vectors, dimension, num_clusters, seed):
+    """Clustered dense vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(num_clusters, dimension))
+    labels = rng.integers(0, num_clusters, size=num_vectors)
+    return (centers[labels] + 0.6 * rng.normal(size=(num_vectors, dimension))).astype(np.float32)
+
+def stored_vectors(storage_path):
+    """Index rows of an existing VectorStore database (dense, or CSR for tfidf / hashing)."""
+    store = VectorStore(storage_path=storage_path)
+    ids, matrix = list(store.index.ids), store.index.matrix
+    store.close()
+    return ids, matrix
+
+def perturbed_queries(vectors, num_queries, rng):
+    """Queries: stored rows with noise on their values (sparse rows keep their pattern)."""
+    base = vectors[rng.integers(0, vectors.shape[0], size=num_queries)]
+    if sparse.issparse(base):
+        base = sparse.csr_matrix(base, dtype=np.float32, copy=True)
+        base.data *= 1 + 0.3 * rng.normal(size=base.data.shape).astype(np.float32)
+        return [base[i] for i in range(num_queries)]
+    return list(base + 0.3 * np.abs(base).mean() * rng.normal(size=base.shape).astype(np.float32))
+
+def timed_search(index, queries, top_k, exact):
+    results, start = [], time.perf_counter()
+    for query in queries:
+        results.append({doc_id for doc_id, _ in index.top_k(query, top_k, -1.0, exact=exact)})
+    return results, (time.perf_counter() - start) / len(queries)
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of the IVF index against exact search.")
+    parser.add_argument("--storage-path", default=None, help="VectorStore database to index (synthetic vectors if omitted)")
+    parser.add_argument("--num-vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None, help="Number of lists (default: 4 * sqrt(n))")
+    parser.add_argument("--nprobes", type=int, nargs="+", default=NPROBES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    if args.storage_path:
+        ids, vectors = stored_vectors(args.storage_path)
+    else:
+        vectors = synthetic_vectors(args.num_vectors, args.dimension, max(1, args.num_vectors // 250), args.seed)
+        ids = [f"vec_{i}" for i in range(len(vectors))]
+    if not ids:
+        print("❌ No vectors to index")
+        return
+
+    queries = perturbed_queries(vectors, args.num_queries, np.random.default_rng(args.seed + 1))
+
+    ann = IVFIndex(nlist=args.nlist, min_train_size=0, seed=args.seed)
+    if not ann.supports(vectors.shape[1]):
+        print(f"❌ {vectors.shape[1]} dimensions is more than the IVF index supports ({ann.max_dimension})")
+        return
+    index = (SparseEmbeddingMatrix if sparse.issparse(vectors) else EmbeddingMatrix)(ann=ann)
+    index.build(ids, vectors)
+    print(f"🏗️ Training IVF index over {len(ids)} vectors...")
+    start = time.perf_counter()
+    ann.train(index.matrix)
+    train_time = time.perf_counter() - start
+
+    exact_results, exact_latency = timed_search(index, queries, args.top_k, exact=True)
+    runs = []
+    for nprobe in args.nprobes:
+        ann.nprobe = nprobe
+        ann_results, latency = timed_search(index, queries, args.top_k, exact=False)
+        recall = np.mean([len(a & e) / max(1, len(e)) for a, e in zip(ann_results, exact_results)])
+        runs.append({
+            "nprobe": nprobe,
+            f"recall_at_{args.top_k}": float(recall),
+            "latency_ms": latency * 1000,
+            "speedup": exact_latency / latency if latency else 0.0,
+        })
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "source": args.storage_path or "synthetic",
+        "num_vectors": len(ids),
+        "dimension": index.dimension,
+        "nlist": len(ann.centroids),
+        "top_k": args.top_k,
+        "num_queries": len(queries),
+        "train_time_s": train_time,
+        "exact_latency_ms": exact_latency * 1000,
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"✅ {report['nlist']} lists, trained in {train_time:.2f}s, exact search {exact_latency * 1000:.2f} ms")
+    for run in runs:
+        print(f"   nprobe={run['nprobe']:>3}: recall@{args.top_k} {run[f'recall_at_{args.top_k}']:.3f}, "
+              f"{run['latency_ms']:.2f} ms ({run['speedup']:.1f}x)")
+    print(f"📄 Report: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# Parity is always measured against the fp32 PyTorch model
+os.environ["POKER_MODEL_BACKEND"] = "torch"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../Poker_Transformers-main")))
+import torch
+import model_handler
+from model_handler import (
+    MODEL_NAME, ONNX_MODEL_DIR, ONNX_FP32_FILE, ONNX_QUANTIZED_FILE,
+    tokenizer, load_model, build_text_generator
+)
+
+REFERENCE_FILE = "Poker_Transformers-main/data/raw/poker_dataset/File196.txt"
+REPORT_FILE = "logs/model_parity_report.json"
+NUM_REFERENCE_HANDS = 20
+MAX_NEW_TOKENS = 32
+
+os.makedirs("logs", exist_ok=True)
+
+def export_onnx(output_dir, quantize=True):
+    """Export Poker_SmolLM to ONNX and optionally add a dynamically quantized int8 graph."""
+    from optimum.onnxruntime import ORTModelForCausalLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    ort_model = ORTModelForCausalLM.from_pretrained(MODEL_NAME, export=True)
+    ort_model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    print(f"✅ ONNX export saved to: {output_dir}")
+
+    if quantize:
+        quantizer = ORTQuantizer.from_pretrained(output_dir)
+        qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        # ORTQuantizer writes <source graph>_quantized.onnx, which load_model() picks up
+        quantizer.quantize(save_dir=output_dir, quantization_config=qconfig)
+        print(f"✅ int8 ONNX graph saved to: {os.path.join(output_dir, ONNX_QUANTIZED_FILE)}")
+
+def load_reference_hands(path, limit):
+    """Split a raw Holdem Manager export into individual hands."""
+    hands = []
+    current_hand = []
+    with open(path, "r", encoding="utf-8") as fin:
+        for line in fin:
+            if line.startswith("Game started at:") and current_hand:
+                hands.append("".join(current_hand).strip())
+                current_hand = []
+                if len(hands) >= limit:
+                    break
+            current_hand.append(line)
+    if current_hand and len(hands) < limit:
+        hands.append("".join(current_hand).strip())
+    return hands
+
+def next_token_logits(model, text):
+    inputs = tokenizer(text, return_tensors="pt")
+    with torch.no_grad():
+        return model(**inputs).logits[0, -1, :].float()
+
+def check_parity(backend, hands, max_new_tokens=MAX_NEW_TOKENS, onnx_dir=None, onnx_file=None):
+    """Compare greedy outputs and next-token logits of a backend against fp32."""
+    reference_model = model_handler.model
+    reference_gen = model_handler.text_gen
+
+    start = time.perf_counter()
+    candidate_model = load_model(backend, onnx_dir=onnx_dir, onnx_file=onnx_file)
+    load_time = time.perf_counter() - start
+    candidate_gen = build_text_generator(candidate_model, backend)
+
+    exact_matches = 0
+    top1_matches = 0
+    max_logit_diff = 0.0
+    ref_latency = 0.0
+    cand_latency = 0.0
+    mismatches = []
+
+    for idx, hand in enumerate(hands, 1):
+        t0 = time.perf_counter()
+        ref_out = reference_gen(hand, max_new_tokens=max_new_tokens, do_sample=False)[0]["generated_text"]
+        t1 = time.perf_counter()
+        cand_out = candidate_gen(hand, max_new_tokens=max_new_tokens, do_sample=False)[0]["generated_text"]
+        t2 = time.perf_counter()
+        ref_latency += t1 - t0
+        cand_latency += t2 - t1
+
+        ref_logits = next_token_logits(reference_model, hand)
+        cand_logits = next_token_logits(candidate_model, hand)
+        max_logit_diff = max(max_logit_diff, (ref_logits - cand_logits).abs().max().item())
+        top1_matches += int(ref_logits.argmax().item() == cand_logits.argmax().item())
+
+        if ref_out == cand_out:
+            exact_matches += 1
+        else:
+            mismatches.append({"hand": idx, "fp32": ref_out, backend: cand_out})
+
+    n = len(hands)
+    return {
+        "backend": backend,
+        "onnx_graph": os.path.join(onnx_dir, onnx_file) if backend == "onnx" else None,
+        "hands": n,
+        "exact_match_rate": exact_matches / n if n else 0.0,
+        "next_token_top1_agreement": top1_matches / n if n else 0.0,
+        "max_next_token_logit_diff": max_logit_diff,
+        "fp32_avg_latency_s": ref_latency / n if n else 0.0,
+        f"{backend}_avg_latency_s": cand_latency / n if n else 0.0,
+        "speedup": ref_latency / cand_latency if cand_latency else 0.0,
+        f"{backend}_load_time_s": load_time,
+        "mismatches": mismatches,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Poker_SmolLM for CPU inference and check parity with fp32.")
+    parser.add_argument("--backend", choices=["int8", "onnx"], default="int8")
+    parser.add_argument("--output-dir", default=ONNX_MODEL_DIR, help="ONNX export directory")
+    parser.add_argument("--no-quantize", action="store_true", help="Keep the ONNX export in fp32")
+    parser.add_argument("--skip-export", action="store_true", help="Only run the parity check")
+    parser.add_argument("--reference-file", default=REFERENCE_FILE)
+    parser.add_argument("--num-hands", type=int, default=NUM_REFERENCE_HANDS)
+    parser.add_argument("--min-agreement", type=float, default=0.9,
+                        help="Minimum next-token top-1 agreement with fp32 to pass")
+    args = parser.parse_args()
+
+    if args.backend == "onnx" and not args.skip_export:
+        export_onnx(args.output_dir, quantize=not args.no_quantize)
+
+    # Measure exactly the graph requested, not whichever one happens to be in the directory
+    onnx_file = ONNX_FP32_FILE if args.no_quantize else ONNX_QUANTIZED_FILE
+    hands = load_reference_hands(args.reference_file, args.num_hands)
+    report = check_parity(args.backend, hands, onnx_dir=args.output_dir, onnx_file=onnx_file)
+
+    with open(REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"✅ Parity check ({args.backend} vs fp32) on {report['hands']} hands")
+    print(f"   Exact output match: {report['exact_match_rate']:.1%}")
+    print(f"   Next-token top-1 agreement: {report['next_token_top1_agreement']:.1%}")
+    print(f"   Max next-token logit diff: {report['max_next_token_logit_diff']:.4f}")
+    print(f"   Speedup: {report['speedup']:.2f}x")
+    print(f"📄 Report: {REPORT_FILE}")
+
+    if report["next_token_top1_agreement"] < args.min_agreement:
+        print(f"⚠️ Agreement below {args.min_agreement:.0%}, do not deploy this backend.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
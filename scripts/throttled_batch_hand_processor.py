@@ -1,26 +1,44 @@
 import os
 import csv
 import time
+import argparse
+import threading
 import traceback
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import sys
 import psutil
 
+# analyze_hand is imported inside each worker process, see _init_worker
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../Poker_Transformers-main")))
-from model_handler import analyze_hand
 
 INPUT_DIR = "Poker_Transformers-main/data/raw/poker_dataset"
 OUTPUT_DIR = "logs/model_outputs"
 HEALTH_LOG = "logs/system_health_log.csv"
 HARMONY_LOG = "logs/harmony_input_log.csv"
 ERROR_LOG = "logs/errors.csv"
-BATCH_SIZE = 5
 CPU_THRESHOLD = 90.0
 MEM_THRESHOLD = 80.0
+RSS_THRESHOLD_MB = None  # Optional cap on the RSS of this process plus its workers, in MB
+SAMPLE_INTERVAL = 1.0  # Seconds between background resource samples
+SLOT_IDLE_SECONDS = 30.0  # Surplus slots stay warm this long after a back-off before their process exits
+MAX_CONCURRENCY = os.cpu_count() or 4
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs("logs", exist_ok=True)
 
+# One model instance per process: the HF pipeline is not safe to share across threads
+_analyze_hand = None
+_torch = None
+
+def _init_worker():
+    global _analyze_hand, _torch
+    import torch
+    from model_handler import analyze_hand
+    _torch = torch
+    _analyze_hand = analyze_hand
+
 def detect_format(text):
     # Heuristics for poker hand history format
     if "PokerStars Hand #" in text or "PokerStars" in text:
@@ -31,26 +49,298 @@ def detect_format(text):
         return "Holdem Manager"
     return "Unknown"
 
-def get_stats():
-    mem = psutil.virtual_memory()
-    cpu = psutil.cpu_percent(interval=1)
-    return cpu, mem.used / (1024 * 1024)  # MB
+_log_lock = threading.Lock()
 
 def log_csv(path, row, header=None):
-    exists = os.path.exists(path)
-    with open(path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        if not exists and header:
-            writer.writerow(header)
-        writer.writerow(row)
+    with _log_lock:
+        exists = os.path.exists(path)
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if not exists and header:
+                writer.writerow(header)
+            if row:
+                writer.writerow(row)
+
+class ResourceSampler(threading.Thread):
+    """
+    Background thread that samples CPU and memory every SAMPLE_INTERVAL seconds,
+    so workers read the latest figures without blocking on psutil.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.process = psutil.Process()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        psutil.cpu_percent(interval=None)  # Prime the CPU counter
+        # Taken right after priming, so its CPU figure is meaningless; the controller skips it
+        self._sample = self._take_sample(warmup=True)
+
+    def _tree_rss(self):
+        """RSS of this process and every worker under it; the workers hold the models."""
+        try:
+            processes = [self.process] + self.process.children(recursive=True)
+        except psutil.NoSuchProcess:
+            processes = [self.process]
+        rss = 0
+        for proc in processes:
+            try:
+                rss += proc.memory_info().rss
+            except psutil.NoSuchProcess:
+                # A retired worker exited between listing and reading it
+                continue
+        return rss
+
+    def _take_sample(self, warmup=False):
+        mem = psutil.virtual_memory()
+        return {
+            "timestamp": time.monotonic(),
+            "warmup": warmup,
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "mem_percent": mem.percent,
+            "mem_used_mb": mem.used / (1024 * 1024),
+            "rss_mb": self._tree_rss() / (1024 * 1024),
+        }
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            sample = self._take_sample()
+            with self._lock:
+                self._sample = sample
+
+    def latest(self):
+        with self._lock:
+            return dict(self._sample)
+
+    def stop(self):
+        self._stop_event.set()
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease limit on in-flight analyses.
+
+    Each resource sample under the targets raises the limit by one; a sample over
+    any target halves it. Workers wait for a free slot instead of aborting.
+    """
+
+    def __init__(self, max_limit=MAX_CONCURRENCY, cpu_target=CPU_THRESHOLD,
+                 mem_target=MEM_THRESHOLD, rss_target_mb=RSS_THRESHOLD_MB):
+        self.max_limit = max(1, max_limit)
+        self.cpu_target = cpu_target
+        self.mem_target = mem_target
+        self.rss_target_mb = rss_target_mb
+        self.limit = 1
+        self.peak_limit = 1
+        self.in_flight = 0
+        self.decreases = 0
+        self._last_sample_ts = None
+        self._cond = threading.Condition()
+
+    def over_target(self, sample):
+        if sample["cpu_percent"] > self.cpu_target or sample["mem_percent"] > self.mem_target:
+            return True
+        return self.rss_target_mb is not None and sample["rss_mb"] > self.rss_target_mb
+
+    def update(self, sample):
+        """Adjust the limit at most once per resource sample."""
+        with self._cond:
+            if sample["warmup"] or sample["timestamp"] == self._last_sample_ts:
+                return
+            self._last_sample_ts = sample["timestamp"]
+            if self.over_target(sample):
+                self.limit = max(1, self.limit // 2)
+                self.decreases += 1
+            elif self.in_flight >= self.limit:
+                # Only grow when the current limit is actually in use
+                self.limit = min(self.max_limit, self.limit + 1)
+                self.peak_limit = max(self.peak_limit, self.limit)
+            self._cond.notify_all()
+
+    def acquire(self, sampler):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait(timeout=SAMPLE_INTERVAL)
+                # Re-read resources while waiting so a saturated limit can grow
+                self.update(sampler.latest())
+            self.in_flight += 1
+
+    def release(self, sample):
+        with self._cond:
+            self.update(sample)
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+class WorkerSlots:
+    """
+    One single-process executor per concurrency slot.
+
+    A fixed pool sized to the controller's maximum would keep every model-holding
+    process alive after a back-off; here slots are started as the limit grows and
+    idle ones are retired once the live count exceeds the current limit. A surplus
+    slot is only retired after idle_seconds, so a back-off followed by a quick
+    recovery reuses the warm process instead of reloading the model.
+    """
+
+    def __init__(self, controller, idle_seconds=SLOT_IDLE_SECONDS, initializer=_init_worker):
+        self.controller = controller
+        self.idle_seconds = idle_seconds
+        self.initializer = initializer
+        self.peak_live = 0
+        self.retired = 0
+        self._idle = []  # (executor, idle since), most recently used last
+        self._busy = set()
+        self._lock = threading.Lock()
+
+    @property
+    def live(self):
+        with self._lock:
+            return len(self._idle) + len(self._busy)
+
+    def _trim(self):
+        now = time.monotonic()
+        # Oldest idle slots first; the most recently used one is the last to go
+        while (self._idle and len(self._idle) + len(self._busy) > self.controller.limit
+               and now - self._idle[0][1] >= self.idle_seconds):
+            executor, _ = self._idle.pop(0)
+            executor.shutdown(wait=False)
+            self.retired += 1
+
+    def submit(self, fn, *args):
+        with self._lock:
+            self._trim()
+            if self._idle:
+                executor, _ = self._idle.pop()
+            else:
+                executor = ProcessPoolExecutor(max_workers=1, initializer=self.initializer)
+            self._busy.add(executor)
+            self.peak_live = max(self.peak_live, len(self._idle) + len(self._busy))
+        future = executor.submit(fn, *args)
+        # Registered before the caller's callbacks, so the slot is idle again before the controller frees it
+        future.add_done_callback(lambda done: self._release(executor, done))
+        return future
+
+    def _release(self, executor, future):
+        broken = not future.cancelled() and isinstance(future.exception(), BrokenProcessPool)
+        with self._lock:
+            self._busy.discard(executor)
+            # A dead worker's executor refuses new work and has already torn itself down
+            # (this callback runs on its manager thread, so shutdown() here would deadlock);
+            # dropping it makes the next submit start a fresh slot
+            if not broken:
+                self._idle.append((executor, time.monotonic()))
+
+    def shutdown(self):
+        with self._lock:
+            executors = [executor for executor, _ in self._idle] + list(self._busy)
+            self._idle, self._busy = [], set()
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+def split_hands(text):
+    # Split on "Game started at:"
+    hands = []
+    current_hand = []
+    for line in text.splitlines(keepends=True):
+        if "Game started at:" in line and current_hand:
+            hands.append("".join(current_hand))
+            current_hand = []
+        current_hand.append(line)
+    if current_hand:
+        hands.append("".join(current_hand))
+    return hands
+
+def log_health(fname, sample):
+    log_csv(HEALTH_LOG, [datetime.now().isoformat(), fname, sample["cpu_percent"], sample["mem_used_mb"]])
+
+def process_file(fname, torch_threads):
+    """
+    Analyze one file in a worker process, using torch_threads intra-op threads.
+
+    Returns (succeeded, failed, needs_normalization, harmony_row, error_rows); the
+    parent writes the CSV rows so only one process appends to each log.
+    """
+    input_path = os.path.join(INPUT_DIR, fname)
+    output_path = os.path.join(OUTPUT_DIR, f"{os.path.splitext(fname)[0]}_output.txt")
+    success = 0
+    failed = 0
+    harmony_row = None
+    error_rows = []
+    # Split the cores between the slots active at submit time instead of every process using all of them
+    _torch.set_num_threads(torch_threads)
+
+    try:
+        with open(input_path, "r", encoding="utf-8") as fin:
+            text = fin.read()
+        lines = text.count("\n") + 1
+        chars = len(text)
+        fmt = detect_format(text)
+        status = "ready" if fmt != "Unknown" else "needs normalization"
+
+        # Harmony prep row
+        harmony_row = [fname, fmt, lines, chars, status]
+
+        # Inference (split if too large)
+        if chars > 8000 or lines > 500:  # Heuristic: split into hands if too large
+            outputs = []
+            for idx, hand in enumerate(split_hands(text), 1):
+                try:
+                    out = _analyze_hand(hand)
+                    outputs.append(f"--- Hand {idx} ---\n{out}\n")
+                    success += 1
+                except Exception:
+                    failed += 1
+                    error_rows.append([datetime.now().isoformat(), f"{fname} (hand {idx})", traceback.format_exc()])
+            with open(output_path, "w", encoding="utf-8") as fout:
+                fout.writelines(outputs)
+        else:
+            out = _analyze_hand(text)
+            with open(output_path, "w", encoding="utf-8") as fout:
+                fout.write(out)
+            success += 1
+
+    except Exception as e:
+        error_rows.append([datetime.now().isoformat(), fname, traceback.format_exc()])
+        print(f"Error processing {fname}: {e}")
+        return success, failed + 1, False, harmony_row, error_rows
+
+    return success, failed, status == "needs normalization", harmony_row, error_rows
+
+def on_file_done(future, fname, controller, sampler):
+    """Log a finished file from the parent and free its slot."""
+    after = sampler.latest()
+    if future.cancelled():
+        log_csv(ERROR_LOG, [datetime.now().isoformat(), fname, "cancelled"])
+    elif future.exception() is not None:
+        # The worker itself failed (e.g. crashed while loading the model), process_file never returned
+        error = future.exception()
+        log_csv(ERROR_LOG, [datetime.now().isoformat(), fname,
+                            "".join(traceback.format_exception(type(error), error, error.__traceback__))])
+    else:
+        _, _, _, harmony_row, error_rows = future.result()
+        if harmony_row:
+            log_csv(HARMONY_LOG, harmony_row)
+        for row in error_rows:
+            log_csv(ERROR_LOG, row)
+    # System health after
+    log_health(fname, after)
+    controller.release(after)
 
 def main():
-    files = [f for f in os.listdir(INPUT_DIR) if f.endswith(".txt")]
-    files = sorted(files)[:BATCH_SIZE]
+    parser = argparse.ArgumentParser(description="Resource-aware batch inference over raw hand files.")
+    parser.add_argument("--limit", type=int, default=None, help="Only process the first N files")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--cpu-target", type=float, default=CPU_THRESHOLD)
+    parser.add_argument("--mem-target", type=float, default=MEM_THRESHOLD)
+    parser.add_argument("--rss-target-mb", type=float, default=RSS_THRESHOLD_MB)
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(INPUT_DIR) if f.endswith(".txt"))
+    if args.limit:
+        files = files[:args.limit]
     total = len(files)
     success = 0
     failed = 0
-    skipped = 0
     needs_norm = []
 
     # Prepare logs
@@ -58,88 +348,57 @@ def main():
     log_csv(HARMONY_LOG, [], header=["filename", "format_detected", "lines", "chars", "status"])
     log_csv(ERROR_LOG, [], header=["timestamp", "filename", "error"])
 
-    for fname in files:
-        input_path = os.path.join(INPUT_DIR, fname)
-        output_path = os.path.join(OUTPUT_DIR, f"{os.path.splitext(fname)[0]}_output.txt")
-        timestamp = datetime.now().isoformat()
+    sampler = ResourceSampler()
+    sampler.start()
+    controller = AIMDController(
+        max_limit=args.max_concurrency,
+        cpu_target=args.cpu_target,
+        mem_target=args.mem_target,
+        rss_target_mb=args.rss_target_mb
+    )
 
-        # System health before
-        cpu_before, mem_before = get_stats()
-        log_csv(HEALTH_LOG, [timestamp, fname, cpu_before, mem_before])
-
-        # Safety check
-        if cpu_before > CPU_THRESHOLD or mem_before > (psutil.virtual_memory().total / (1024 * 1024)) * (MEM_THRESHOLD / 100):
-            print(f"System resources exceeded before processing {fname}. Aborting batch.")
-            break
+    futures = {}
+    slots = WorkerSlots(controller)
+    try:
+        for fname in files:
+            controller.acquire(sampler)
+            # System health before (latest background sample, no blocking)
+            log_health(fname, sampler.latest())
+            torch_threads = max(1, (os.cpu_count() or 1) // controller.limit)
+            future = slots.submit(process_file, fname, torch_threads)
+            future.add_done_callback(
+                lambda done, fname=fname: on_file_done(done, fname, controller, sampler)
+            )
+            futures[future] = fname
+    finally:
+        slots.shutdown()
 
+    sampler.stop()
+    for future, fname in futures.items():
         try:
-            with open(input_path, "r", encoding="utf-8") as fin:
-                text = fin.read()
-            lines = text.count("\n") + 1
-            chars = len(text)
-            fmt = detect_format(text)
-            status = "ready" if fmt != "Unknown" else "needs normalization"
-            if status == "needs normalization":
-                needs_norm.append(fname)
-
-            # Log harmony prep
-            log_csv(HARMONY_LOG, [fname, fmt, lines, chars, status])
-
-            # Inference (split if too large)
-            if chars > 8000 or lines > 500:  # Heuristic: split into hands if too large
-                # Split on "Game started at:" or blank lines
-                hands = []
-                current_hand = []
-                for line in text.splitlines(keepends=True):
-                    if "Game started at:" in line and current_hand:
-                        hands.append("".join(current_hand))
-                        current_hand = []
-                    current_hand.append(line)
-                if current_hand:
-                    hands.append("".join(current_hand))
-                outputs = []
-                for idx, hand in enumerate(hands, 1):
-                    try:
-                        out = analyze_hand(hand)
-                        outputs.append(f"--- Hand {idx} ---\n{out}\n")
-                        success += 1
-                    except Exception as e:
-                        failed += 1
-                        log_csv(ERROR_LOG, [datetime.now().isoformat(), f"{fname} (hand {idx})", traceback.format_exc()])
-                with open(output_path, "w", encoding="utf-8") as fout:
-                    fout.writelines(outputs)
-            else:
-                out = analyze_hand(text)
-                with open(output_path, "w", encoding="utf-8") as fout:
-                    fout.write(out)
-                success += 1
-
+            ok, ko, flagged, _, _ = future.result()
         except Exception as e:
+            # BrokenProcessPool and friends are already in ERROR_LOG; count the file and keep the summary
+            print(f"Error processing {fname}: {e!r}")
             failed += 1
-            log_csv(ERROR_LOG, [datetime.now().isoformat(), fname, traceback.format_exc()])
-            print(f"Error processing {fname}: {e}")
             continue
-
-        # System health after
-        cpu_after, mem_after = get_stats()
-        log_csv(HEALTH_LOG, [datetime.now().isoformat(), fname, cpu_after, mem_after])
-
-        # Safety check after
-        if cpu_after > CPU_THRESHOLD or mem_after > (psutil.virtual_memory().total / (1024 * 1024)) * (MEM_THRESHOLD / 100):
-            print(f"System resources exceeded after processing {fname}. Aborting batch.")
-            break
+        success += ok
+        failed += ko
+        if flagged:
+            needs_norm.append(fname)
 
     print(f"\n=== Batch Summary ===")
     print(f"Total files attempted: {total}")
     print(f"Successful inferences: {success}")
     print(f"Skipped or failed files: {failed}")
     print(f"Files flagged as 'needs normalization': {needs_norm}")
+    print(f"Peak concurrency: {controller.peak_limit} (backed off {controller.decreases} times, "
+          f"peak worker processes {slots.peak_live}, retired {slots.retired})")
     print(f"System health log: {HEALTH_LOG}")
     print(f"Harmony input log: {HARMONY_LOG}")
     print(f"Error log: {ERROR_LOG}")
 
-    print("Sleeping for 10 seconds before next batch...")
-    time.sleep(10)
-
 if __name__ == "__main__":
     main()
+
+
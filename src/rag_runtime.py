@@ -0,0 +1,192 @@
+# src/rag_runtime.py
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from Agentic_Rag.rag.knowledge_base import PokerKnowledgeBase
+from Agentic_Rag.rag.vector_store import VectorStore, EmbeddingService
+from Agentic_Rag.rag.rag_orchestrator import RAGOrchestrator
+from src.models.orchestrator import AgentOrchestrator
+from src.models.coach import CoachAgent
+
+logger = logging.getLogger("PokerPy.RAG")
+
+@dataclass(frozen=True)
+class RAGComponents:
+    """One consistent set of RAG components; replaced as a whole on reload"""
+    knowledge_base: PokerKnowledgeBase
+    vector_store: VectorStore
+    agent_orchestrator: AgentOrchestrator
+    rag_orchestrator: RAGOrchestrator
+    coach_agent: CoachAgent
+
+class RAGRuntime:
+    """
+    Long-lived RAG runtime shared by every chat request in the process.
+    Components are built once (the vector store warm-starts from disk) and all
+    knowledge base / vector store access runs on one background event loop, so
+    shared state is only ever touched from that thread.
+    When the knowledge base file changes (other than by the runtime's own saves),
+    a fresh set is built in an executor thread, where nothing else can see it yet,
+    and swapped in on the loop, so chats keep running during the rebuild; requests
+    already holding the previous set finish on it, and its vector store connection
+    is closed when the last of them completes.
+    """
+
+    def __init__(self,
+                 knowledge_path: Optional[str] = None,
+                 vector_store_path: Optional[str] = None,
+                 reload_check_interval: float = 5.0):
+        self.knowledge_path = knowledge_path
+        self.vector_store_path = vector_store_path
+        self.reload_check_interval = reload_check_interval
+        self._last_reload_check = time.monotonic()
+
+        # Requests using each component set (by id), and sets replaced while still in use
+        self._leases: Dict[int, int] = {}
+        self._retired: Dict[int, RAGComponents] = {}
+        # Rebuild in progress, shared by concurrent reloads
+        self._reloading: Optional[asyncio.Task] = None
+
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="rag-runtime-loop", daemon=True)
+        self._loop_thread.start()
+
+        self.components = self.call(self._build)
+
+    def _knowledge_mtime(self, knowledge_base: PokerKnowledgeBase) -> Optional[float]:
+        try:
+            return os.path.getmtime(knowledge_base.storage_path)
+        except OSError:
+            return None
+
+    def _build(self) -> RAGComponents:
+        start = time.perf_counter()
+        knowledge_base = PokerKnowledgeBase(storage_path=self.knowledge_path)
+        embedding_service = EmbeddingService(model_name="tfidf", cache_embeddings=True)
+        vector_store = VectorStore(storage_path=self.vector_store_path, embedding_service=embedding_service)
+        agent_orchestrator = AgentOrchestrator()
+        rag_orchestrator = RAGOrchestrator(
+            agent_orchestrator=agent_orchestrator,
+            knowledge_base=knowledge_base,
+            vector_store=vector_store
+        )
+        components = RAGComponents(
+            knowledge_base=knowledge_base,
+            vector_store=vector_store,
+            agent_orchestrator=agent_orchestrator,
+            rag_orchestrator=rag_orchestrator,
+            coach_agent=CoachAgent(rag_orchestrator=rag_orchestrator)
+        )
+        logger.info(f"RAG runtime ready with {len(knowledge_base.documents)} documents in {time.perf_counter() - start:.2f}s")
+        return components
+
+    # Loop-thread only
+
+    def _swap(self, components: RAGComponents):
+        previous, self.components = self.components, components
+        if self._leases.get(id(previous)):
+            self._retired[id(previous)] = previous
+        else:
+            previous.vector_store.close()
+
+    def _release(self, components: RAGComponents):
+        key = id(components)
+        self._leases[key] -= 1
+        if self._leases[key] == 0:
+            del self._leases[key]
+            retired = self._retired.pop(key, None)
+            if retired is not None:
+                retired.vector_store.close()
+
+    async def _build_and_swap(self) -> RAGComponents:
+        try:
+            components = await self._loop.run_in_executor(None, self._build)
+            self._swap(components)
+            return components
+        finally:
+            self._reloading = None
+
+    async def _reload(self) -> RAGComponents:
+        if self._reloading is None:
+            self._reloading = self._loop.create_task(self._build_and_swap())
+        # A cancelled caller must not abandon a build other callers wait on
+        return await asyncio.shield(self._reloading)
+
+    async def _reload_if_changed(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_reload_check < self.reload_check_interval:
+            return False
+        self._last_reload_check = now
+        knowledge_base = self.components.knowledge_base
+        # The knowledge base records the mtime of its own saves, so those never trigger a reload
+        if self._reloading is not None or self._knowledge_mtime(knowledge_base) == knowledge_base.storage_mtime:
+            return False
+        logger.info("Knowledge base changed on disk, reloading RAG runtime")
+        await self._reload()
+        return True
+
+    async def _run_with_components(self, handler: Callable[[RAGComponents], Awaitable[Any]]) -> Any:
+        components = self.components
+        self._leases[id(components)] = self._leases.get(id(components), 0) + 1
+        try:
+            return await handler(components)
+        finally:
+            self._release(components)
+
+    async def _invoke(self, function: Callable[..., Any], *args, **kwargs) -> Any:
+        return function(*args, **kwargs)
+
+    # Thread-safe entry points
+
+    def call(self, function: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run a plain function on the runtime's event loop and wait for its result"""
+        if threading.current_thread() is self._loop_thread:
+            return function(*args, **kwargs)
+        return self.run(self._invoke(function, *args, **kwargs), timeout)
+
+    def reload(self) -> RAGComponents:
+        """Rebuild every component from the current knowledge off the loop and swap them in"""
+        return self.run(self._reload())
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reload when the knowledge base file changed; checked at most every
+        reload_check_interval seconds. Returns True only when a rebuild happened
+        """
+        if time.monotonic() - self._last_reload_check < self.reload_check_interval:
+            return False
+        return self.run(self._reload_if_changed())
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        """Run an agent coroutine on the runtime's event loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def run_with_components(self, 
+                            handler: Callable[[RAGComponents], Awaitable[Any]], 
+                            timeout: Optional[float] = None) -> Any:
+        """
+        Run handler(components) on the loop with the current component set, which
+        stays open until the handler finishes even if a reload swaps it out
+        """
+        return self.run(self._run_with_components(handler), timeout)
+
+_runtime: Optional[RAGRuntime] = None
+_runtime_lock = threading.Lock()
+
+def get_rag_runtime() -> RAGRuntime:
+    """Process-wide runtime, created on first use"""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = RAGRuntime(
+                    knowledge_path=os.environ.get("POKERPY_KNOWLEDGE_PATH"),
+                    vector_store_path=os.environ.get("POKERPY_VECTOR_STORE_PATH")
+                )
+    return _runtime
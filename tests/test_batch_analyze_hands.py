@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+import batch_analyze_hands
+
+@pytest.fixture
+def batch(tmp_path, monkeypatch):
+    calls = []
+    def fake_init_worker():
+        batch_analyze_hands._analyze_hand = lambda text: calls.append(text) or f"analysis of {text}"
+    monkeypatch.setattr(batch_analyze_hands, "_init_worker", fake_init_worker)
+    monkeypatch.setattr(batch_analyze_hands, "OUTPUT_DIR", str(tmp_path / "outputs"))
+    monkeypatch.setattr(batch_analyze_hands, "LOG_FILE", str(tmp_path / "execution_log.csv"))
+    monkeypatch.setattr(batch_analyze_hands, "MANIFEST_FILE", str(tmp_path / "manifest.db"))
+    os.makedirs(tmp_path / "outputs")
+
+    def run(input_dir):
+        monkeypatch.setattr(sys, "argv", ["batch_analyze_hands.py", "--input-dir", str(input_dir)])
+        batch_analyze_hands.main()
+    run.calls = calls
+    return run
+
+def write_inputs(directory, files):
+    directory.mkdir()
+    for name, text in files.items():
+        (directory / name).write_text(text, encoding="utf-8")
+    return directory
+
+def read_output(input_path):
+    with open(batch_analyze_hands.output_path_for(os.path.realpath(input_path)), encoding="utf-8") as f:
+        return f.read()
+
+def test_rerun_skips_completed_files(batch, tmp_path):
+    input_dir = write_inputs(tmp_path / "raw", {"File1.txt": "hand one", "File2.txt": "hand two"})
+    batch(input_dir)
+    assert sorted(batch.calls) == ["hand one", "hand two"]
+
+    batch(input_dir)
+    assert len(batch.calls) == 2
+
+    # A changed input is reprocessed, the unchanged one stays skipped
+    (input_dir / "File2.txt").write_text("hand two, edited", encoding="utf-8")
+    batch(input_dir)
+    assert batch.calls[2:] == ["hand two, edited"]
+    assert read_output(input_dir / "File2.txt") == "analysis of hand two, edited"
+
+def test_same_file_name_in_two_directories_keeps_both_outputs(batch, tmp_path):
+    first = write_inputs(tmp_path / "first", {"File1.txt": "first hand"})
+    second = write_inputs(tmp_path / "second", {"File1.txt": "second hand"})
+    batch(first)
+    batch(second)
+
+    assert read_output(first / "File1.txt") == "analysis of first hand"
+    assert read_output(second / "File1.txt") == "analysis of second hand"
+
+    # Both are recorded as done, and both outputs still exist, so neither is rerun
+    batch(first)
+    batch(second)
+    assert batch.calls == ["first hand", "second hand"]
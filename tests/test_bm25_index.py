@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from Agentic_Rag.rag.bm25_index import BM25Index, tokenize, reciprocal_rank_fusion
+
+def test_tokenize_keeps_poker_terms():
+    tokens = tokenize("When to 3-bet light with a low SPR")
+    assert "3-bet" in tokens and "3bet" in tokens and "spr" in tokens
+    assert "when" not in tokens and "with" not in tokens
+
+def test_poker_actions_are_indexed():
+    for term in ["call", "fire", "top", "bottom", "full", "side", "behind", "back", "show", "not", "first", "all"]:
+        assert term in tokenize(f"When to {term}")
+
+    index = BM25Index()
+    index.add_document("call", "When to call a 3-bet out of position")
+    index.add_document("pair", "Playing top pair on a wet board")
+    index.add_document("odds", "Pot odds and implied odds")
+    assert index.search("when to call a 3-bet")[0][0] == "call"
+    assert [doc_id for doc_id, _ in index.search("top pair")] == ["pair"]
+
+def test_incremental_add_update_remove():
+    index = BM25Index()
+    index.add_document("a", "Squeeze and 3-bet ranges from the blinds")
+    index.add_document("b", "Pot odds and implied odds")
+    assert [doc_id for doc_id, _ in index.search("3bet")] == ["a"]
+
+    index.add_document("a", "Stack to pot ratio (SPR) planning")
+    assert index.search("3-bet") == []
+    assert index.search("spr")[0][0] == "a"
+
+    assert index.remove_document("b")
+    assert index.search("odds") == [] and "odds" not in index.postings
+    assert index.total_length == index.document_lengths["a"]
+
+def brute_force_scores(index, query, accept):
+    scores = {}
+    for doc_id, terms in index.document_terms.items():
+        if not accept(doc_id):
+            continue
+        length_ratio = index.document_lengths[doc_id] / index.average_length
+        score = sum(
+            index.idf(term) * terms[term] * (index.k1 + 1) / (terms[term] + index.k1 * (1 - index.b + index.b * length_ratio))
+            for term in set(tokenize(query)) if term in terms
+        )
+        if score:
+            scores[doc_id] = score
+    return scores
+
+def test_pruned_search_matches_brute_force():
+    rng = random.Random(0)
+    vocabulary = [f"term{i}" for i in range(60)]
+    index = BM25Index()
+    for i in range(300):
+        index.add_document(f"doc_{i}", " ".join(rng.choices(vocabulary, weights=range(60, 0, -1), k=rng.randint(5, 40))))
+
+    accept = lambda doc_id: not doc_id.endswith("7")
+    for _ in range(20):
+        query = " ".join(rng.sample(vocabulary, 4))
+        expected = sorted(brute_force_scores(index, query, accept).values(), reverse=True)[:10]
+        actual = [score for _, score in index.search(query, top_k=10, accept=accept)]
+        assert actual == pytest.approx(expected)
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[("a", 0.9), ("b", 0.5)], [("b", 12.0), ("c", 3.0)]], top_k=2)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a"]
@@ -0,0 +1,66 @@
+import asyncio
+
+from Agentic_Rag.rag.knowledge_base import PokerKnowledgeBase
+from Agentic_Rag.rag.rag_orchestrator import RAGOrchestrator
+from Agentic_Rag.rag.vector_store import VectorStore, EmbeddingService
+from src.models.orchestrator import AgentOrchestrator
+
+from tests.test_vector_store import make_document
+
+def test_semantic_response_cache(tmp_path):
+    knowledge_base = PokerKnowledgeBase(storage_path=str(tmp_path / "knowledge.json"))
+    vector_store = VectorStore(storage_path=str(tmp_path / "vectors.db"), embedding_service=EmbeddingService())
+    orchestrator = RAGOrchestrator(AgentOrchestrator(), knowledge_base, vector_store)
+
+    def enhance(agent_id, query, response="Base answer."):
+        return asyncio.run(orchestrator.enhance_agent_response(agent_id, query, response, {}))
+
+    first = enhance("coach", "How do pot odds work?")
+    rephrased = enhance("coach", "pot odds - how do they work", response="Another answer.")
+    assert rephrased.metadata['cache_hit']
+    assert rephrased.sources == first.sources
+    assert rephrased.enhanced_response.startswith("Another answer.")
+
+    assert enhance("coach", "What are pot odds?").metadata['cache_hit']
+    assert not enhance("hand_analyzer", "how do pot odds work").metadata.get('cache_hit')
+    assert not enhance("coach", "what is a bankroll").metadata.get('cache_hit')
+
+    # Any knowledge base change invalidates every entry
+    knowledge_base.add_document(make_document(1))
+    assert not enhance("coach", "How do pot odds work?").metadata.get('cache_hit')
+    assert orchestrator.get_rag_statistics()['cache_stats']['response_cache']['hits'] == 2
+
+def test_response_cache_tells_apart_queries_the_embedding_cannot(tmp_path):
+    knowledge_base = PokerKnowledgeBase(storage_path=str(tmp_path / "knowledge.json"))
+    vector_store = VectorStore(storage_path=str(tmp_path / "vectors.db"), embedding_service=EmbeddingService())
+    orchestrator = RAGOrchestrator(AgentOrchestrator(), knowledge_base, vector_store)
+
+    def enhance(query):
+        return asyncio.run(orchestrator.enhance_agent_response("coach", query, "Base answer.", {}))
+
+    embedding_service = vector_store.embedding_service
+    top, bottom = (embedding_service.generate_embedding(q) for q in ("how to play top pair", "how to play bottom pair"))
+    assert (top != bottom).nnz == 0  # identical TF-IDF vectors: "top" / "bottom" are English stop words
+
+    enhance("how to play top pair")
+    assert not enhance("how to play bottom pair").metadata.get('cache_hit')
+    enhance("when to call preflop")
+    assert not enhance("when to fold preflop").metadata.get('cache_hit')
+    assert enhance("How to play top pair?").metadata.get('cache_hit')
+
+def test_response_cache_scoped_on_inferred_skill_level(tmp_path):
+    knowledge_base = PokerKnowledgeBase(storage_path=str(tmp_path / "knowledge.json"))
+    vector_store = VectorStore(storage_path=str(tmp_path / "vectors.db"), embedding_service=EmbeddingService())
+    orchestrator = RAGOrchestrator(AgentOrchestrator(), knowledge_base, vector_store)
+    orchestrator.response_cache.similarity_threshold = 0.0
+
+    def enhance(query):
+        return asyncio.run(orchestrator.enhance_agent_response("coach", query, "Base answer.", {}))
+
+    enhance("pot odds basics")  # no advanced terms: beginner
+    assert not enhance("pot odds and equity").metadata.get('cache_hit')  # "equity": intermediate
+    assert enhance("pot odds for new players").metadata.get('cache_hit')
+
+    # Embeddings written after the knowledge base change invalidate entries too
+    vector_store.add_embeddings([make_document(1)])
+    assert not enhance("pot odds basics").metadata.get('cache_hit')
@@ -0,0 +1,83 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from src.rag_runtime import RAGRuntime
+
+@pytest.fixture
+def runtime(tmp_path):
+    return RAGRuntime(knowledge_path=str(tmp_path / "knowledge.json"),
+                      vector_store_path=str(tmp_path / "vectors.db"),
+                      reload_check_interval=0)
+
+def touch_knowledge(runtime):
+    knowledge_base = runtime.components.knowledge_base
+    runtime.call(knowledge_base.save_knowledge)
+    later = time.time() + 10
+    os.utime(knowledge_base.storage_path, (later, later))
+
+def test_components_are_used_on_the_loop_thread(runtime):
+    async def thread_name(components):
+        components.knowledge_base.search_documents(query="pot odds")
+        return threading.current_thread().name
+    assert runtime.run_with_components(thread_name) == "rag-runtime-loop"
+
+def test_reload_if_changed_reports_rebuilds(runtime):
+    touch_knowledge(runtime)
+    first = runtime.components
+    assert runtime.reload_if_changed()
+    assert runtime.components is not first
+    assert not runtime.reload_if_changed()
+
+def test_replaced_store_closes_after_in_flight_requests(runtime):
+    first = runtime.components
+    started = threading.Event()
+
+    async def slow_count(components):
+        started.set()
+        await asyncio.sleep(0.3)
+        return components.vector_store._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    result = {}
+    request = threading.Thread(target=lambda: result.setdefault("count", runtime.run_with_components(slow_count)))
+    request.start()
+    started.wait()
+    touch_knowledge(runtime)
+    assert runtime.reload_if_changed()
+    request.join()
+
+    assert result["count"] == len(first.vector_store.vectors)
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.vector_store._conn.execute("SELECT 1")
+
+def test_own_saves_do_not_trigger_a_reload(runtime):
+    first = runtime.components
+    runtime.call(first.knowledge_base.save_knowledge)
+    assert not runtime.reload_if_changed()
+    assert runtime.components is first
+
+def test_chats_keep_running_while_a_reload_builds(runtime):
+    build = runtime._build
+    building = threading.Event()
+
+    def slow_build():
+        building.set()
+        time.sleep(0.5)
+        return build()
+
+    runtime._build = slow_build
+    reload = threading.Thread(target=runtime.reload)
+    reload.start()
+    building.wait()
+
+    async def document_count(components):
+        return len(components.knowledge_base.documents)
+
+    start = time.monotonic()
+    assert runtime.run_with_components(document_count) > 0
+    assert time.monotonic() - start < 0.4
+    reload.join()
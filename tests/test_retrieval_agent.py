@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from Agentic_Rag.rag.knowledge_base import PokerKnowledgeBase, SkillLevel
+from Agentic_Rag.rag.retrieval_agent import RetrievalAgent, QueryCache
+from Agentic_Rag.rag.vector_store import VectorStore, EmbeddingService
+from src.agents.base_agent import AgentMessage
+
+from tests.test_vector_store import make_document
+
+@pytest.fixture
+def agent(tmp_path):
+    knowledge_base = PokerKnowledgeBase(storage_path=str(tmp_path / "knowledge.json"))
+    for i in range(20):
+        knowledge_base.add_document(make_document(i))
+    vector_store = VectorStore(storage_path=str(tmp_path / "vectors.db"), embedding_service=EmbeddingService())
+    return RetrievalAgent(knowledge_base, vector_store, cache_size=8)
+
+def retrieve(agent, query, min_similarity=0.0):
+    message = AgentMessage(id="m", sender="test", recipient=agent.agent_id, message_type="retrieve_knowledge",
+                           content={"query": query, "max_results": 3, "min_similarity": min_similarity},
+                           timestamp=datetime.now())
+    return asyncio.run(agent.process_message(message)).content
+
+def test_cache_hits_normalized_queries(agent):
+    first = retrieve(agent, "How do pot odds work?")['retrieval_result']
+    second = retrieve(agent, "  how do POT odds   work?")['retrieval_result']
+    assert agent.retrieval_stats['cache_hits'] == 1
+    assert second['documents'] == first['documents']
+    assert second['similarity_scores'] == first['similarity_scores']
+    # The processed query belongs to each request, not to the one that filled the cache
+    assert second['processed_query']['original_query'] == "  how do POT odds   work?"
+
+def test_vector_store_changes_invalidate_cache(agent):
+    # Ingestion adds documents to the knowledge base first and embeds them in one batch afterwards
+    agent.hybrid_search = False
+    document = make_document(303)
+    document.title = "Bankroll"
+    document.content = "Bankroll bankroll bankroll"
+    agent.knowledge_base.add_document(document)
+    assert "doc_303" not in [d['id'] for d in retrieve(agent, "bankroll")['retrieval_result']['documents']]
+
+    agent.vector_store.add_embeddings([document])
+    assert "doc_303" in [d['id'] for d in retrieve(agent, "bankroll")['retrieval_result']['documents']]
+    assert agent.retrieval_stats['cache_hits'] == 0
+
+def test_knowledge_changes_invalidate_cache(agent):
+    retrieve(agent, "check raising")
+    document = make_document(300)
+    document.title = "Check raising"
+    document.content = "When to check raise the flop with draws"
+    asyncio.run(agent.process_message(AgentMessage(
+        id="a", sender="test", recipient=agent.agent_id, message_type="add_knowledge",
+        content={"document": document.to_dict()}, timestamp=datetime.now()
+    )))
+    retrieve(agent, "check raising")
+    assert agent.retrieval_stats['cache_hits'] == 0
+    assert agent.query_cache.get_statistics()['misses'] == 2
+
+def test_query_cache_lru_and_ttl():
+    cache = QueryCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1
+    cache.ttl_seconds = 0
+    assert cache.get("c") is None
+    assert cache.get_statistics()['expirations'] == 1
+
+def test_hybrid_search_surfaces_exact_terms(agent):
+    document = make_document(400)
+    document.title = "Playing low SPR pots"
+    document.content = "With a small stack to pot ratio, commit after a 3-bet"
+    agent.knowledge_base.add_document(document)
+    agent.vector_store.add_document_embedding(document)
+
+    result = retrieve(agent, "SPR")['retrieval_result']
+    assert result['documents'][0]['id'] == "doc_400"
+    assert result['metadata']['retrieval_mode'] == "hybrid"
+    assert retrieve(agent, "3bet")['retrieval_result']['documents'][0]['id'] == "doc_400"
+
+def test_hybrid_search_keeps_keyword_hits_below_min_similarity(agent):
+    document = make_document(401)
+    document.title = "Playing low SPR pots"
+    document.content = "With a small stack to pot ratio, commit after a 3-bet"
+    document.skill_level = SkillLevel.ALL_LEVELS
+    agent.knowledge_base.add_document(document)
+    agent.vector_store.add_document_embedding(document)
+
+    # The default threshold applies to vector candidates only; the BM25 match still comes back
+    hits = dict(agent._search("SPR", 3, 0.1, {}))
+    assert "doc_401" in hits
+    assert "doc_401" in [d['id'] for d in retrieve(agent, "SPR", min_similarity=0.1)['retrieval_result']['documents']]
+
+    agent.min_bm25_score = float("inf")
+    assert "doc_401" not in dict(agent._search("SPR", 3, 0.1, {}))
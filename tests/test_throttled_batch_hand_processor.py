@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import types
+import concurrent.futures
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+import throttled_batch_hand_processor as throttled
+
+def sample(timestamp, cpu=10.0, mem=10.0, rss=100.0, warmup=False):
+    return {"timestamp": timestamp, "warmup": warmup, "cpu_percent": cpu, "mem_percent": mem,
+            "mem_used_mb": 0.0, "rss_mb": rss}
+
+def test_controller_grows_one_slot_per_saturated_sample():
+    controller = throttled.AIMDController(max_limit=3)
+    controller.in_flight = 1
+    controller.update(sample(1))
+    assert controller.limit == 2
+    controller.update(sample(1))  # the same sample never counts twice
+    assert controller.limit == 2
+
+    controller.in_flight = 0
+    controller.update(sample(2))  # unused headroom: no growth
+    assert controller.limit == 2
+
+    controller.in_flight = 2
+    controller.update(sample(3))
+    controller.in_flight = 3
+    controller.update(sample(4))
+    assert controller.limit == controller.peak_limit == 3
+
+def test_controller_halves_on_pressure():
+    controller = throttled.AIMDController(max_limit=16, rss_target_mb=500)
+    controller.limit = 8
+    controller.update(sample(1, cpu=95.0))
+    assert controller.limit == 4
+    controller.update(sample(2, mem=90.0))
+    assert controller.limit == 2
+    controller.update(sample(3, rss=600.0))
+    controller.update(sample(4, cpu=95.0))
+    assert controller.limit == 1 and controller.decreases == 4
+
+def test_controller_skips_the_warmup_sample():
+    controller = throttled.AIMDController(max_limit=4)
+    controller.limit = 4
+    controller.update(sample(1, cpu=100.0, warmup=True))
+    assert controller.limit == 4 and controller.decreases == 0
+
+    sampler = throttled.ResourceSampler()
+    assert sampler.latest()["warmup"]
+    assert sampler._take_sample()["rss_mb"] >= sampler.process.memory_info().rss / (1024 * 1024)
+
+def slow_pid(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+def make_slots(limit, idle_seconds):
+    controller = types.SimpleNamespace(limit=limit)
+    return controller, throttled.WorkerSlots(controller, idle_seconds=idle_seconds, initializer=None)
+
+def test_worker_slots_follow_the_limit():
+    controller, slots = make_slots(3, idle_seconds=0.0)
+    try:
+        futures = [slots.submit(slow_pid, 0.2) for _ in range(3)]
+        assert len({future.result() for future in futures}) == 3
+        concurrent.futures.wait(futures)
+        time.sleep(0.1)  # release callbacks run on the executors' threads
+        assert slots.live == 3
+
+        controller.limit = 1
+        survivor = slots.submit(os.getpid).result()
+        assert slots.live == 1 and slots.retired == 2
+        time.sleep(0.1)
+        assert slots.submit(os.getpid).result() == survivor
+    finally:
+        slots.shutdown()
+
+def test_worker_slots_stay_warm_through_a_short_back_off():
+    controller, slots = make_slots(2, idle_seconds=60.0)
+    try:
+        pids = {future.result() for future in [slots.submit(slow_pid, 0.2) for _ in range(2)]}
+        time.sleep(0.1)
+        controller.limit = 1
+        assert len(pids) == 2
+        assert slots.submit(os.getpid).result() in pids
+        assert slots.live == 2 and slots.retired == 0
+    finally:
+        slots.shutdown()
+
+def test_worker_crash_is_logged_and_its_slot_replaced(tmp_path, monkeypatch):
+    monkeypatch.setattr(throttled, "ERROR_LOG", str(tmp_path / "errors.csv"))
+    monkeypatch.setattr(throttled, "HEALTH_LOG", str(tmp_path / "health.csv"))
+    controller, slots = make_slots(1, idle_seconds=0.0)
+    released = []
+    controller.release = released.append
+    sampler = types.SimpleNamespace(latest=lambda: sample(1))
+    try:
+        future = slots.submit(os._exit, 1)
+        future.add_done_callback(lambda done: throttled.on_file_done(done, "File1.txt", controller, sampler))
+        with pytest.raises(concurrent.futures.process.BrokenProcessPool):
+            future.result()
+        time.sleep(0.1)
+        assert released and slots.live == 0
+        with open(tmp_path / "errors.csv", encoding="utf-8") as f:
+            assert "BrokenProcessPool" in f.read()
+        assert slots.submit(os.getpid).result() > 0
+    finally:
+        slots.shutdown()
@@ -0,0 +1,309 @@
+import pickle
+import pytest
+import numpy as np
+from datetime import datetime
+from sklearn.metrics.pairwise import cosine_similarity
+
+from Agentic_Rag.rag.knowledge_base import KnowledgeDocument, DocumentType, SkillLevel
+from scipy import sparse
+
+from Agentic_Rag.rag.vector_store import VectorStore, EmbeddingService, EmbeddingMatrix, SparseEmbeddingMatrix
+from Agentic_Rag.rag.ann_index import IVFIndex
+
+TOPICS = ["pot odds", "bluffing", "position", "tournament", "bankroll", "ranges"]
+LEVELS = [SkillLevel.BEGINNER, SkillLevel.INTERMEDIATE, SkillLevel.ADVANCED, SkillLevel.ALL_LEVELS]
+
+def make_document(i):
+    topic = TOPICS[i % len(TOPICS)]
+    return KnowledgeDocument(
+        id=f"doc_{i}",
+        title=f"{topic.title()} lesson {i}",
+        content=f"Understanding {topic} in no limit holdem, part {i}. Think about {TOPICS[(i * 7) % len(TOPICS)]} too.",
+        document_type=DocumentType.STRATEGY if i % 2 else DocumentType.CONCEPT,
+        skill_level=LEVELS[i % len(LEVELS)],
+        tags=[topic, f"part{i % 3}"],
+        metadata={},
+        created_at=datetime.now(),
+        updated_at=datetime.now()
+    )
+
+@pytest.fixture
+def store(tmp_path):
+    vector_store = VectorStore(storage_path=str(tmp_path / "vectors.db"), embedding_service=EmbeddingService())
+    vector_store.rebuild_index([make_document(i) for i in range(40)])
+    return vector_store
+
+def brute_force(store, query, top_k, min_similarity, filters=None):
+    query_vector = store.embedding_service.generate_embedding(query)
+    results = []
+    for doc_id, embedding_vector in store.vectors.items():
+        if filters and not store._matches_filters(embedding_vector, filters):
+            continue
+        similarity = cosine_similarity(query_vector.reshape(1, -1), embedding_vector.vector.reshape(1, -1))[0][0]
+        if similarity >= min_similarity:
+            results.append((doc_id, similarity))
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results[:top_k]
+
+def assert_same_results(results, expected, store=None, query=None):
+    # Equal scores may come back in a different order, so compare scores, then each id's own score
+    np.testing.assert_allclose([s for _, s in results], [s for _, s in expected], rtol=1e-5, atol=1e-6)
+    if store is not None:
+        exact = dict(brute_force(store, query, len(store.vectors), -1.0))
+        for doc_id, similarity in results:
+            assert similarity == pytest.approx(exact[doc_id], rel=1e-5, abs=1e-6)
+
+def test_search_matches_brute_force(store):
+    for query in ["pot odds in position", "bluffing tournament ranges", "bankroll"]:
+        assert_same_results(store.search_similar(query, top_k=5, min_similarity=0.05),
+                            brute_force(store, query, 5, 0.05), store, query)
+
+def test_search_with_filters(store):
+    filters = {"skill_level": ["beginner", "all_levels"], "document_type": "strategy"}
+    results = store.search_similar("pot odds", top_k=10, min_similarity=0.0, filters=filters)
+    assert_same_results(results, brute_force(store, "pot odds", 10, 0.0, filters), store, "pot odds")
+    for doc_id, _ in results:
+        metadata = store.vectors[doc_id].metadata
+        assert metadata["skill_level"] in ("beginner", "all_levels")
+        assert metadata["document_type"] == "strategy"
+
+def test_tag_filters_use_bitmaps(store):
+    filters = {"tags": ["bluffing", "bankroll"], "skill_level": "advanced"}
+    results = store.search_similar("bluffing", top_k=10, min_similarity=0.0, filters=filters)
+    assert results
+    assert_same_results(results, brute_force(store, "bluffing", 10, 0.0, filters), store, "bluffing")
+    for doc_id, _ in results:
+        assert {"bluffing", "bankroll"} & set(store.vectors[doc_id].metadata["tags"])
+
+def test_index_stays_in_sync(store):
+    store.remove_embedding("doc_3")
+    doc = make_document(5)
+    doc.content = "A completely new text about bankroll management"
+    store.update_embedding(doc)
+    store.add_document_embedding(make_document(100))
+
+    assert "doc_3" not in store.index
+    assert len(store.index) == len(store.vectors) == len(store.metadata_index)
+    for row, doc_id in enumerate(store.index.ids):
+        assert store.metadata_index.mask({"skill_level": store.vectors[doc_id].metadata["skill_level"]})[row]
+    assert_same_results(store.search_similar("bankroll management", top_k=8, min_similarity=0.0),
+                        brute_force(store, "bankroll management", 8, 0.0), store, "bankroll management")
+
+    # A vector of another dimension drops the document's row from the index, and from the bitmaps
+    store.embedding_service.fit_vectorizer(["a completely different corpus", "about squeeze plays"])
+    store.add_document_embedding(make_document(7))
+    assert "doc_7" not in store.index
+    assert len(store.index) == len(store.metadata_index)
+    for row, doc_id in enumerate(store.index.ids):
+        assert store.metadata_index.mask({"skill_level": store.vectors[doc_id].metadata["skill_level"]})[row]
+
+def test_reload_from_disk(store):
+    reloaded = VectorStore(storage_path=store.storage_path, embedding_service=store.embedding_service)
+    assert set(reloaded.vectors) == set(store.vectors)
+    assert_same_results(reloaded.search_similar("position", top_k=5), store.search_similar("position", top_k=5))
+
+def test_vectors_round_trip_bit_exact_and_skip_legacy_rows(store):
+    with store._db_lock, store._conn:
+        store._conn.execute(
+            "INSERT INTO embeddings (document_id, vector, metadata, created_at, model_name, vector_dimension) VALUES (?, ?, ?, ?, ?, ?)",
+            ("legacy", pickle.dumps(np.ones(3)), "{}", datetime.now().isoformat(), "tfidf", 3)
+        )
+    reloaded = VectorStore(storage_path=store.storage_path, embedding_service=store.embedding_service)
+    assert "legacy" not in reloaded.vectors and set(reloaded.vectors) == set(store.vectors)
+    for doc_id, embedding_vector in store.vectors.items():
+        original = sparse.csr_matrix(embedding_vector.vector, dtype=np.float32)
+        assert (sparse.csr_matrix(reloaded.vectors[doc_id].vector) != original).nnz == 0
+
+    dense = np.random.default_rng(0).normal(size=(3, 7)).astype(np.float32)
+    blobs = [VectorStore._encode_vector(row) for row in dense]
+    rows = [(f"d{i}", values, indices) for i, (values, indices, _) in enumerate(blobs)]
+    assert {vector_format for _, _, vector_format in blobs} == {"dense"}
+    np.testing.assert_array_equal(VectorStore._decode_vectors("dense", 7, rows), dense)
+
+def test_embedding_matrix_swap_remove():
+    matrix = EmbeddingMatrix(initial_capacity=2)
+    for i in range(5):
+        matrix.upsert(f"v{i}", np.eye(5)[i] * (i + 1))
+    matrix.remove("v1")
+    assert len(matrix) == 4
+    assert matrix.ids[1] == "v4"
+    assert matrix.top_k(np.eye(5)[4], top_k=1, min_similarity=0.5) == [("v4", 1.0)]
+
+def test_embedding_cache_is_bounded_and_versioned(store):
+    service = EmbeddingService(cache_size=3)
+    service.fit_vectorizer(["pot odds", "bluffing in position"])
+    before = service.generate_embedding("pot odds")
+    assert service.generate_embedding("pot odds") is before
+    for query in ["bluffing", "position", "ranges"]:
+        service.generate_embedding(query)
+    assert len(service.embedding_cache) == 3
+    assert service.embedding_cache.get_statistics()['evictions'] == 1
+
+    # A refit changes the key: the old vector is never served again
+    service.fit_vectorizer(["ranges and bankroll", "tournament pot odds"])
+    after = service.generate_embedding("pot odds")
+    assert after.shape[1] == service.get_vector_dimension() != before.shape[1]
+
+    store.search_similar("bankroll")
+    store.search_similar("bankroll")
+    stats = store.get_statistics()['embedding_cache']
+    assert stats['hits'] >= 1 and stats['misses'] >= 1 and 0 < stats['hit_rate'] < 1
+
+def test_tfidf_vectors_stay_sparse(store):
+    assert isinstance(store.index, SparseEmbeddingMatrix)
+    assert sparse.issparse(store.vectors["doc_0"].vector)
+    assert sparse.issparse(store.embedding_service.generate_embedding("pot odds"))
+
+    dense = EmbeddingMatrix()
+    dense.build(list(store.vectors), [v.vector.toarray()[0] for v in store.vectors.values()])
+    query = store.embedding_service.generate_embedding("bluffing in position")
+    np.testing.assert_allclose(store.index.scores(query), dense.scores(query), rtol=1e-5, atol=1e-6)
+    assert sparse.issparse(store.index.normalize_query(query))
+    np.testing.assert_allclose(sparse.linalg.norm(store.index.normalize_query(query)), 1.0, rtol=1e-5)
+
+def test_add_embeddings_bulk(store):
+    documents = [make_document(i) for i in range(200, 230)]
+    assert store.add_embeddings(documents)
+    assert len(store.index) == len(store.vectors) == 70
+
+    reloaded = VectorStore(storage_path=store.storage_path, embedding_service=store.embedding_service)
+    assert set(reloaded.vectors) == set(store.vectors)
+    reloaded.close()
+
+def test_ivf_index_recall_and_sync():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    vectors = (centers[rng.integers(0, 20, 3000)] + 0.5 * rng.normal(size=(3000, 32))).astype(np.float32)
+    matrix = EmbeddingMatrix(ann=IVFIndex(nprobe=8, min_train_size=1000))
+    matrix.build([f"v{i}" for i in range(3000)], vectors)
+    assert not matrix.ann.ready(len(matrix))  # searches never train the index
+    matrix.top_k(vectors[0], 10, -1.0)
+    assert not matrix.ann.is_trained
+    matrix.ann.train(matrix.matrix)
+    assert matrix.ann.ready(len(matrix))
+
+    for i in range(0, 3000, 7):
+        matrix.remove(f"v{i}")
+    matrix.upsert("new", vectors[1] * 2)
+    assert matrix.ann.ready(len(matrix))
+    np.testing.assert_array_equal(matrix.ann.row_cluster, matrix.ann.assign(matrix.matrix))
+
+    recall = []
+    for query in vectors[rng.integers(0, 3000, 50)]:
+        approximate = {doc_id for doc_id, _ in matrix.top_k(query, 10, -1.0)}
+        exact = {doc_id for doc_id, _ in matrix.top_k(query, 10, -1.0, exact=True)}
+        recall.append(len(approximate & exact) / 10)
+    assert np.mean(recall) >= 0.9
+    assert matrix.top_k(vectors[1], 1, 0.0)[0][0] in ("v1", "new")
+
+def test_ivf_index_over_sparse_tfidf_rows(tmp_path):
+    documents = [make_document(i) for i in range(60)]
+    store = VectorStore(storage_path=str(tmp_path / "ivf.db"), embedding_service=EmbeddingService(),
+                        ann_index=IVFIndex(nlist=4, nprobe=4, min_train_size=10))
+    store.rebuild_index(documents)
+    assert isinstance(store.index, SparseEmbeddingMatrix)
+    store._ann_thread.join()  # rebuild_index starts training in the background
+    assert store.ann_index.is_trained and store.ann_index.ready(len(store.index))
+    np.testing.assert_array_equal(store.ann_index.row_cluster, store.ann_index.assign(store.index.matrix))
+
+    # Probing every list returns exactly what the exhaustive scan does
+    query = store.embedding_service.generate_embedding(documents[5].content)
+    assert store.index.top_k(query, 5, 0.0) == store.index.top_k(query, 5, 0.0, exact=True)
+    assert store.get_statistics()['ann_index']['active']
+    store.close()
+
+def make_corpus(prefix, count, rng):
+    """Documents over their own random vocabulary, rich enough to fill the 1000 TF-IDF features"""
+    documents = []
+    for i in range(count):
+        document = make_document(i)
+        document.content = " ".join(f"{prefix}{word}" for word in rng.integers(0, 400, 40))
+        documents.append(document)
+    return documents
+
+def test_ivf_index_ignores_centroids_from_before_a_refit(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / "refit.db")
+    store = VectorStore(storage_path=path, embedding_service=EmbeddingService(),
+                        ann_index=IVFIndex(nlist=8, nprobe=1, min_train_size=10))
+    store.rebuild_index(make_corpus("alpha", 120, rng))
+    store._ann_thread.join()
+    assert store.ann_index.is_trained
+
+    # Refit on a new vocabulary of the same width, and stop before the background retrain
+    monkeypatch.setattr(VectorStore, "_maybe_train_ann_in_background", lambda self: None)
+    documents = make_corpus("beta", 120, rng)
+    store.rebuild_index(documents)
+    assert store.index.dimension == len(store.ann_index.centroids[0]) == 1000
+    store.close()
+
+    reopened = VectorStore(storage_path=path, embedding_service=EmbeddingService(),
+                           ann_index=IVFIndex(nlist=8, nprobe=1, min_train_size=10))
+    assert not reopened.ann_index.is_trained
+    for document in documents[:20]:
+        query = reopened.embedding_service.generate_embedding(document.content)
+        assert reopened.index.top_k(query, 5, 0.0) == reopened.index.top_k(query, 5, 0.0, exact=True)
+
+    # Retrained centroids are tagged with the current vectorizer and reload on the next open
+    assert reopened.train_ann_index()
+    reopened.close()
+    again = VectorStore(storage_path=path, embedding_service=EmbeddingService(),
+                        ann_index=IVFIndex(nlist=8, nprobe=1, min_train_size=10))
+    assert again.ann_index.is_trained and again.ann_index.ready(len(again.index))
+    again.close()
+
+def test_ivf_index_refuses_high_dimensional_vectors():
+    ann = IVFIndex(min_train_size=10, max_dimension=64)
+    assert ann.needs_training(100, 64) and not ann.needs_training(100, 2 ** 18)
+    with pytest.raises(ValueError):
+        ann.train(np.ones((100, 65), dtype=np.float32))
+    with pytest.raises(ValueError):
+        ann.train(sparse.random(100, 65, density=0.1, format='csr'))
+
+def test_hashing_mode_adds_without_refit(tmp_path):
+    service = EmbeddingService(model_name="hashing", n_features=2 ** 12)
+    store = VectorStore(storage_path=str(tmp_path / "hashed.db"), embedding_service=service, reweight_interval=10 ** 6)
+    store.rebuild_index([make_document(i) for i in range(30)])
+    assert isinstance(store.index, SparseEmbeddingMatrix)
+
+    late = make_document(500)
+    late.content = "Squeeze plays against loose openers"
+    store.add_document_embedding(late)
+    assert service.num_documents == 31
+    assert store.search_similar("squeeze plays", top_k=1, min_similarity=0.0)[0][0] == "doc_500"
+
+    # Re-weighting matches embedding every document from scratch with the current IDF
+    assert store.reweight_index()
+    query = service.generate_embedding("squeeze plays against openers")
+    expected = EmbeddingMatrix.normalize(
+        service.apply_idf(sparse.vstack([store.vectors[doc_id].vector for doc_id in store.index.ids])).toarray()
+    ) @ EmbeddingMatrix.normalize(query)[0]
+    np.testing.assert_allclose(store.index.scores(query), expected, rtol=1e-5, atol=1e-6)
+
+    store.remove_embedding("doc_500")
+    assert service.num_documents == 30
+    reloaded = VectorStore(storage_path=store.storage_path, embedding_service=EmbeddingService("hashing", n_features=2 ** 12))
+    np.testing.assert_array_equal(reloaded.embedding_service.document_frequency, service.document_frequency)
+    reloaded.close()
+    store.close()
+
+def test_warm_start_reuses_persisted_vectors(store):
+    documents = [make_document(i) for i in range(40)]
+    documents[2].content = "Edited text about check raising"
+    documents.append(make_document(41))
+    del documents[7]
+
+    # Fresh service and store, as in a new process: the fitted TF-IDF comes from the database
+    warm = VectorStore(storage_path=store.storage_path, embedding_service=EmbeddingService())
+    summary = warm.sync_documents(documents)
+    assert summary == {'rebuilt': False, 'embedded': 2, 'removed': 1, 'unchanged': 38}
+    assert set(warm.vectors) == {doc.id for doc in documents}
+    assert warm.sync_documents(documents)['embedded'] == 0
+
+    cold = VectorStore(storage_path=str(store.storage_path) + ".cold", embedding_service=EmbeddingService())
+    cold.rebuild_index([make_document(i) for i in range(40)])
+    cold.sync_documents(documents)
+    for query in ["check raising", "bankroll"]:
+        assert_same_results(warm.search_similar(query, top_k=5), cold.search_similar(query, top_k=5))
+    warm.close()
+    cold.close()